@@ -1,27 +1,21 @@
+import json
+import os
 import shlex
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
-from os import chdir, getcwd
-from os.path import exists
 from pathlib import Path
 from subprocess import check_call, check_output, CalledProcessError, DEVNULL
 import shutil
 import sys
+import time
 from urllib.parse import urlparse
 
-
-class cd:
-    """Context manager for changing the current working directory"""
-
-    def __init__(self, path):
-        path = Path(path)
-        self.path = path.expanduser()
-
-    def __enter__(self):
-        self.prevPath = Path(getcwd())
-        chdir(str(self.path))
-
-    def __exit__(self, etype, value, traceback):
-        chdir(str(self.prevPath))
+# Batch mode creates gists through one pooled API session, when `requests` is available
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from git_helpers.util.github_api import GitHubSession
+except ImportError:
+    GitHubSession = None
 
 
 err = partial(print, file=sys.stderr)
@@ -36,10 +30,11 @@ def run(
 ):
     """Print a command to stderr, then run it.
 
-    Also converts args to `str`s (useful for `Path`s).
+    Also converts args to `str`s (useful for `Path`s). A `cwd` kwarg is passed through, and prefixed to the log line.
     """
     cmd = [str(arg) for arg in args]
-    err(f'Running: {shlex.join(cmd)}')
+    cwd = kwargs.get('cwd')
+    err(f'{f"[{cwd}] " if cwd else ""}Running: {shlex.join(cmd)}')
     if output:
         return check_output(cmd, **kwargs).decode()
     else:
@@ -82,6 +77,37 @@ def parse_gist_url(url):
     return id, ssh_url
 
 
+def is_text(path):
+    """Whether `path` is UTF-8; the gists API (like `gh gist create`) only accepts text contents."""
+    try:
+        Path(path).read_bytes().decode()
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def create_gist(files, public=False, cwd=None, session=None):
+    """Create a gist from `files` (relative to `cwd`), returning its URL.
+
+    Uses the shared API `session` if provided, else `gh gist create`. Via the API, non-UTF-8 files are left out (the
+    caller pushes them via git afterwards), but at least one file must be text.
+    """
+    if session:
+        root = Path(cwd or '.')
+        content = { Path(f).name: {'content': (root / f).read_text('utf-8')} for f in files if is_text(root / f) }
+        if not content:
+            raise RuntimeError(f"No text files to create gist from in {root} (gists need at least one)")
+        resp = session.post('gists', json={'public': public, 'files': content})
+        resp.raise_for_status()
+        return resp.json()['html_url']
+
+    cmd = ['gh', 'gist', 'create']
+    if public:
+        cmd.append('--public')
+    cmd.extend(files)
+    return line(*cmd, cwd=cwd)
+
+
 def gist_dir(
     dir,
     remote='g',
@@ -92,117 +118,197 @@ def gist_dir(
     files=None,
     restore_branch=False,
     gist=None,
+    session=None,
+    auth_checked=False,
+    on_create=None,
 ):
-    """Create a gist from a directory using GitHub CLI.
+    """Create a gist from a directory using GitHub CLI; returns the gist's URL.
+
+    Commands run in `dir` via `cwd=` (the process's working directory is untouched), so several directories can be
+    processed concurrently. `session`/`auth_checked` let batch callers share one API session and one auth check, and
+    `on_create` is called with the new gist's URL as soon as it exists.
 
     Note: Requires 'gh' (GitHub CLI) to be installed and authenticated.
     For GitHub Enterprise, configure gh with: gh auth login --hostname your-github-enterprise.com
     """
     dir = Path(dir)
-    with cd(dir):
-        # We'll make a git repository in this directory iff one doesn't exist
-        init = not exists('.git')
-
-        # Capture current branch if in existing repo (for restore_branch option)
-        original_branch = None
-        if not init:
-            try:
-                original_branch = line('git', 'symbolic-ref', '-q', '--short', 'HEAD')
-            except:
-                pass  # Detached HEAD or other edge case
-
-        if gist:
-            id, ssh_url = parse_gist_url(gist)
+    git = partial(run, cwd=dir)
+    git_lines = partial(lines, cwd=dir)
+    git_line = partial(line, cwd=dir)
+
+    # We'll make a git repository in this directory iff one (with commits) doesn't exist; a repo without commits is
+    # left over from an earlier, failed attempt
+    has_repo = (dir / '.git').exists()
+    init = not has_repo
+    if has_repo:
+        try:
+            git_line('git', 'rev-parse', '-q', '--verify', 'HEAD', stderr=DEVNULL)
+        except CalledProcessError:
+            init = True
+
+    # Capture current branch if in existing repo (for restore_branch option)
+    original_branch = None
+    if not init:
+        try:
+            original_branch = git_line('git', 'symbolic-ref', '-q', '--short', 'HEAD')
+        except:
+            pass  # Detached HEAD or other edge case
+
+    if gist:
+        url = gist
+        id, ssh_url = parse_gist_url(gist)
+        gist_files = [str(f) for f in files or []]
+    else:
+        # Get list of files to include in gist
+        if files:
+            gist_files = [str(f) for f in files]
         else:
-            # Get list of files to include in gist
-            if files:
-                gist_files = [str(f) for f in files]
-            else:
-                gist_files = lines('git', 'ls-files')
-                gist_files = [f for f in gist_files if f]  # Remove empty strings
-
-            if not gist_files:
-                err("No files to create gist from")
+            gist_files = git_lines('git', 'ls-files')
+            gist_files = [f for f in gist_files if f]  # Remove empty strings
+
+        if not gist_files:
+            raise RuntimeError(f"No files to create gist from in {dir}")
+
+        # Create the gist and grab its ID
+        try:
+            url = create_gist(gist_files, public=public, cwd=dir, session=session)
+        except CalledProcessError:
+            # Check if authentication is the issue
+            if not auth_checked and not check_gh_auth():
+                err("Error: Not authenticated with gh CLI. Please run 'gh auth login' first.")
                 sys.exit(1)
-
-            # Prepare gh gist create cmd with actual files
-            cmd = ['gh', 'gist', 'create']
-            if public:
-                cmd.append('--public')
-            cmd.extend(gist_files)
-
-            # Create the gist and grab its ID
+            else:
+                # Re-raise the original error if it's not an auth issue
+                raise
+        id, ssh_url = parse_gist_url(url)
+        err(f"Created gist {url} (id {id})")
+        if on_create:
+            on_create(url)
+
+        # Copy URL to clipboard if requested
+        if copy_url:
             try:
-                url = line(*cmd)
+                run('pbcopy', input=url.encode())
+                err("Gist URL copied to clipboard")
             except CalledProcessError:
-                # Check if authentication is the issue
-                if not check_gh_auth():
-                    err("Error: Not authenticated with gh CLI. Please run 'gh auth login' first.")
-                    sys.exit(1)
-                else:
-                    # Re-raise the original error if it's not an auth issue
-                    raise
-            id, ssh_url = parse_gist_url(url)
-            err(f"Created gist {url} (id {id})")
+                err("Couldn't copy to clipboard (pbcopy not available)")
 
-            # Copy URL to clipboard if requested
-            if copy_url:
-                try:
-                    run('pbcopy', input=url.encode())
-                    err("Gist URL copied to clipboard")
-                except CalledProcessError:
-                    err("Couldn't copy to clipboard (pbcopy not available)")
+    if not has_repo:
+        # Make working dir a clone of the upstream gist
+        git('git', 'init')
 
-            if init:
-                # Make working dir a clone of the upstream gist
-                run('git', 'init')
-
-        remotes = list(lines('git', 'remote'))
+    remotes = list(git_lines('git', 'remote'))
 
+    # Reuse a remote already pointing at this gist (e.g. added by an earlier, failed attempt)
+    existing = [ name for name in remotes if name and git_line('git', 'remote', 'get-url', name) == ssh_url ]
+    if existing:
+        remote = existing[0]
+    elif remote == 'g' and 'g' in remotes:
         # If the specified remote already exists and it's 'g', try 'gist' instead
-        if remote == 'g' and 'g' in remotes:
-            if 'gist' not in remotes:
-                err(f"Remote 'g' already exists, using 'gist' instead")
-                remote = 'gist'
-            else:
-                err(f"Both 'g' and 'gist' remotes already exist")
-                # Keep the original remote name, will just update it
-
-        if remote not in remotes:
-            run('git', 'remote', 'add', remote, ssh_url)
+        if 'gist' not in remotes:
+            err(f"Remote 'g' already exists, using 'gist' instead")
+            remote = 'gist'
+        else:
+            err(f"Both 'g' and 'gist' remotes already exist")
+            # Keep the original remote name, will just update it
 
-        # If we're in an existing git repo (not newly initialized), push current commit to gist
-        if not init:
-            prev_sha = line('git', 'log', '-1', '--format=%h')
+    if remote not in remotes:
+        git('git', 'remote', 'add', remote, ssh_url)
 
-            err(f'Pushing existing commit {prev_sha} to gist')
-            # Force push current HEAD to gist's main branch
-            run('git', 'push', remote, '--force', 'HEAD:main')
+    # If we're in an existing git repo (not newly initialized), push current commit to gist
+    if not init:
+        prev_sha = git_line('git', 'log', '-1', '--format=%h')
 
-            # Set up tracking if we're on a branch
-            if original_branch:
-                run('git', 'branch', '--set-upstream-to', f'{remote}/main', original_branch)
-                err(f'Set {original_branch} to track {remote}/main')
-        else:
-            # For newly initialized repos, fetch and create tracking branch
-            run('git', 'fetch', remote)
+        err(f'Pushing existing commit {prev_sha} to gist')
+        # Force push current HEAD to gist's main branch
+        git('git', 'push', remote, '--force', 'HEAD:main')
 
-            # Create local branch to track the gist
-            run('git', 'checkout', '-b', branch, f'{remote}/main')
-            run('git', 'branch', '-u', f'{remote}/main')
+        # Set up tracking if we're on a branch
+        if original_branch:
+            git('git', 'branch', '--set-upstream-to', f'{remote}/main', original_branch)
+            err(f'Set {original_branch} to track {remote}/main')
+    else:
+        # For newly initialized repos, fetch and create tracking branch
+        git('git', 'fetch', remote)
+
+        # Create local branch to track the gist. The worktree already holds the gist's files (untracked), which
+        # `checkout` would refuse to overwrite; point the unborn branch at the gist and reset the index instead.
+        git('git', 'symbolic-ref', 'HEAD', f'refs/heads/{branch}')
+        git('git', 'reset', '-q', f'{remote}/main')
+        git('git', 'branch', '-u', f'{remote}/main')
+
+        # The API only took text files; commit and push the rest
+        binary = [ f for f in gist_files if not is_text(dir / f) ] if session else []
+        if binary:
+            git('git', 'add', '--', *binary)
+            # Already there, if this is a retry
+            if any(git_lines('git', 'diff', '--cached', '--name-only')):
+                git('git', 'commit', '-m', f'Add {len(binary)} binary file(s)')
+                git('git', 'push', remote, 'HEAD:main')
+
+    # Configure push.default so that `git push` will update gist/main
+    git('git', 'config', 'push.default', 'upstream')
+
+    err(f"Gist created: {url}")
+    if open_gist:
+        try:
+            run('open', url)
+        except CalledProcessError:
+            err("Couldn't find `open` command")
+
+    if restore_branch and original_branch:
+        git('git', 'checkout', original_branch)
+
+    return url
+
+
+def gist_dirs(dirs, jobs=4, retries=2, manifest=None, **kwargs):
+    """Create gists for many directories concurrently (at most `jobs` at a time); returns `{dir: url}`.
+
+    The `gh` auth check happens once up front, and gists are created through one shared API session (when `requests`
+    is installed). Each directory is retried independently, up to `retries` times, reusing its gist if one was already
+    created. If `manifest` is given, `{dir: url}` is written there as JSON.
+    """
+    if not check_gh_auth():
+        err("Error: Not authenticated with gh CLI. Please run 'gh auth login' first.")
+        sys.exit(1)
+    session = GitHubSession(pool_size=jobs) if GitHubSession else None
 
-        # Configure push.default so that `git push` will update gist/main
-        run('git', 'config', 'push.default', 'upstream')
+    urls = {}
+    created = {}
 
-        err(f"Gist created: {url}")
-        if open_gist:
+    def attempt(dir):
+        for i in range(retries + 1):
+            # Remember the gist as soon as it's created, so a retry pushes to it instead of creating another
+            on_create = partial(created.__setitem__, dir)
+            gist = created.get(dir) or kwargs.get('gist')
             try:
-                run('open', url)
-            except CalledProcessError:
-                err("Couldn't find `open` command")
-
-        if restore_branch and original_branch:
-            run('git', 'checkout', original_branch)
+                return gist_dir(dir, session=session, auth_checked=True, on_create=on_create, **{**kwargs, 'gist': gist})
+            except Exception as e:
+                if i == retries:
+                    raise
+                delay = 2 ** i
+                err(f"[{dir}] Failed ({e}); retrying in {delay}s")
+                time.sleep(delay)
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = { executor.submit(attempt, dir): dir for dir in dirs }
+        for future in as_completed(futures):
+            dir = futures[future]
+            try:
+                urls[str(dir)] = future.result()
+            except Exception as e:
+                failures[str(dir)] = str(e)
+                err(f"[{dir}] Giving up: {e}")
+
+    if manifest:
+        with open(manifest, 'w') as f:
+            json.dump({'gists': urls, 'failures': failures}, f, indent=2)
+        err(f"Wrote manifest of {len(urls)} gists to {manifest}")
+    if failures:
+        sys.exit(1)
+    return urls
 
 
 if __name__ == '__main__':
@@ -210,7 +316,7 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('paths', nargs='*',
-                        help='Either a list of directories to create GitHub gists of, or a list of files to add to a gist from the current directory (binary files work in both cases!)')
+                        help='Either a list of directories to create GitHub gists of, or a list of files to add to a gist from the current directory (binary files reach the gist via `git push`, in batch mode or from an existing git repo; a new gist needs at least one text file)')
     parser.add_argument('-b', '--branch', default='gist',
                         help="Name for new local branch when creating gist from non-git directory (ignored for existing git repos)")
     parser.add_argument('-B', '--restore_branch', default=False, action='store_true',
@@ -220,8 +326,11 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--dir', required=False,
                         help="Specify a single directory to make a gist from; any positional arguments must point to files in this directory")
     parser.add_argument('-g', '--gist', help="URL of an existing Gist (will overwrite that Gist's contents!)")
+    parser.add_argument('-j', '--jobs', type=int, default=4, help="When multiple directories are passed, create up to this many gists concurrently (default: 4)")
+    parser.add_argument('-m', '--manifest', help="Write a JSON manifest of directory → gist URL (and any failures) to this path")
     parser.add_argument('-o', '--open', default=False, action='store_true', help="Open the gist when finished running")
     parser.add_argument('-p', '--public', default=False, action='store_true', help="Make the gist public (default is secret)")
+    parser.add_argument('-R', '--retries', type=int, default=2, help="Retry each directory's gist creation/push up to this many times (batch mode; default: 2)")
     parser.add_argument('-r', '--remote', default='g',
                         help='Name to use for a git remote created in each repo/directory, which points at the created gist (defaults to "g", falls back to "gist" if "g" is taken).')
     args = parser.parse_args()
@@ -257,15 +366,21 @@ if __name__ == '__main__':
         else:
             dirs = [Path.cwd()]
 
-    for dir in dirs:
-        gist_dir(
-            dir,
-            remote=remote,
-            branch=branch,
-            copy_url=copy_url,
-            open_gist=open_gist,
-            public=public,
-            files=files,
-            restore_branch=restore_branch,
-            gist=gist,
-        )
+    kwargs = dict(
+        remote=remote,
+        branch=branch,
+        copy_url=copy_url,
+        open_gist=open_gist,
+        public=public,
+        files=files,
+        restore_branch=restore_branch,
+        gist=gist,
+    )
+    if len(dirs) > 1 or args.manifest:
+        gist_dirs(dirs, jobs=args.jobs, retries=args.retries, manifest=args.manifest, **kwargs)
+    else:
+        try:
+            gist_dir(dirs[0], **kwargs)
+        except RuntimeError as e:
+            err(str(e))
+            sys.exit(1)
@@ -0,0 +1,211 @@
+"""Pooled GitHub API client: one `requests.Session`, conditional GETs, pagination, and rate-limit backoff."""
+
+import os
+import time
+from subprocess import check_output, CalledProcessError, DEVNULL
+from sys import stderr
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+API_URL = 'https://api.github.com'
+
+
+def get_token():
+    """Return a GitHub token from `$GH_TOKEN`/`$GITHUB_TOKEN`, falling back to `gh auth token`."""
+    for key in ('GH_TOKEN', 'GITHUB_TOKEN'):
+        token = os.environ.get(key)
+        if token:
+            return token
+    try:
+        return check_output(['gh', 'auth', 'token'], stderr=DEVNULL).decode().strip() or None
+    except (CalledProcessError, FileNotFoundError):
+        return None
+
+
+def backoff(timeout=60, initial=1., factor=2., max_delay=10.):
+    """Yield attempt numbers, sleeping with exponential backoff between them, until `timeout` seconds elapse.
+
+    The first attempt is yielded immediately.
+    """
+    start = time.monotonic()
+    delay = initial
+    attempt = 0
+    while True:
+        yield attempt
+        attempt += 1
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+
+class RateLimiter:
+    """Token bucket per host: at most `rate` requests/sec to each host, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1., rate)
+        self._buckets = {}
+        self._lock = Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+class GitHubSession:
+    """Thin wrapper around a pooled `requests.Session` for the GitHub REST and GraphQL APIs.
+
+    - Reuses keep-alive connections across all requests (and threads).
+    - `get_cached` sends `If-None-Match` with the last ETag seen for a URL; 304s don't count against the rate limit.
+    - Primary/secondary rate-limit responses (403/429) and 5xx errors are retried with backoff; a rate-limit response
+      seen by one thread pauses all threads sharing the session.
+    - `rate` (requests/sec) throttles requests to each host, across threads.
+    """
+
+    def __init__(self, token=None, pool_size=10, max_retries=5, timeout=30, verbose=False, api_url=API_URL, rate=None):
+        self.api_url = api_url
+        self.limiter = RateLimiter(rate) if rate else None
+        self.token = token or get_token()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.verbose = verbose
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        if self.token:
+            self.session.headers['Authorization'] = f'Bearer {self.token}'
+        self._etags = {}
+        self._etags_lock = Lock()
+        self._paused_until = 0.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def url(self, path):
+        if path.startswith(('https://', 'http://')):
+            return path
+        return f'{self.api_url}/{path.lstrip("/")}'
+
+    def log(self, msg):
+        if self.verbose:
+            stderr.write(f'{msg}\n')
+
+    @staticmethod
+    def retry_delay(resp, attempt):
+        """Return seconds to wait before retrying `resp`, or `None` if it shouldn't be retried."""
+        status = resp.status_code
+        if status in (403, 429):
+            retry_after = resp.headers.get('Retry-After')
+            if retry_after:
+                return float(retry_after)
+            if resp.headers.get('X-RateLimit-Remaining') == '0':
+                reset = resp.headers.get('X-RateLimit-Reset')
+                if reset:
+                    return max(0., int(reset) - time.time()) + 1
+            if status == 429 or 'rate limit' in resp.text.lower():
+                # Secondary rate limit without `Retry-After`: GitHub asks for at least a minute
+                return 60. * 2 ** attempt
+            return None
+        if status >= 500:
+            return 2. ** attempt
+        return None
+
+    def request(self, method, path, headers=None, **kwargs):
+        """Issue a request, retrying rate-limited and 5xx responses; returns the final `Response`."""
+        url = self.url(path)
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            pause = self._paused_until - time.time()
+            if pause > 0:
+                time.sleep(pause)
+            if self.limiter:
+                self.limiter.acquire(url)
+            resp = self.session.request(method, url, headers=headers, **kwargs)
+            delay = self.retry_delay(resp, attempt)
+            if delay is None or attempt == self.max_retries:
+                return resp
+            self.log(f'{method} {url}: {resp.status_code}, retrying in {delay:.0f}s')
+            if resp.status_code in (403, 429):
+                self._paused_until = max(self._paused_until, time.time() + delay)
+            time.sleep(delay)
+        return resp
+
+    def get(self, path, params=None):
+        resp = self.request('GET', path, params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_cached(self, path, params=None):
+        """Conditional GET; returns `(json, changed)`, where `changed` is `False` on a 304."""
+        url = self.url(path)
+        key = (url, tuple(sorted((params or {}).items())))
+        with self._etags_lock:
+            cached = self._etags.get(key)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        resp = self.request('GET', url, params=params, headers=headers)
+        if resp.status_code == 304 and cached:
+            return cached[1], False
+        resp.raise_for_status()
+        body = resp.json()
+        etag = resp.headers.get('ETag')
+        if etag:
+            with self._etags_lock:
+                self._etags[key] = (etag, body)
+        return body, True
+
+    def paginate(self, path, params=None, key=None, per_page=100):
+        """Yield items from every page of a list endpoint, following `Link: rel="next"` headers.
+
+        `key` selects the list from object-wrapped responses (e.g. `workflow_runs`).
+        """
+        params = { 'per_page': per_page, **(params or {}) }
+        url = self.url(path)
+        while url:
+            resp = self.request('GET', url, params=params)
+            resp.raise_for_status()
+            body = resp.json()
+            yield from (body[key] if key else body)
+            url = resp.links.get('next', {}).get('url')
+            # `next` URLs already carry the query string
+            params = None
+
+    def post(self, path, json=None):
+        return self.request('POST', path, json=json)
+
+    def delete(self, path):
+        return self.request('DELETE', path)
+
+    def graphql(self, query, **variables):
+        resp = self.post('graphql', json={'query': query, 'variables': variables})
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('errors'):
+            raise RuntimeError(f"GraphQL errors: {body['errors']}")
+        return body['data']
@@ -0,0 +1,132 @@
+"""Find PRs for a branch across a GitHub repo and its parent (fork source) with one GraphQL query, cached per head SHA."""
+
+import json
+import os
+from subprocess import check_output, CalledProcessError, DEVNULL
+from sys import stderr
+
+from git_helpers.util.github_api import GitHubSession
+
+
+PR_FIELDS = '''
+    nodes {
+      number
+      url
+      state
+      headRepository { nameWithOwner }
+    }
+'''
+
+PRS_QUERY = '''
+query($owner: String!, $name: String!, $branch: String!) {
+  repository(owner: $owner, name: $name) {
+    nameWithOwner
+    pullRequests(headRefName: $branch, first: 100, orderBy: {field: UPDATED_AT, direction: DESC}) {%s}
+    parent {
+      nameWithOwner
+      pullRequests(headRefName: $branch, first: 100, orderBy: {field: UPDATED_AT, direction: DESC}) {%s}
+    }
+  }
+}
+''' % (PR_FIELDS, PR_FIELDS)
+
+
+def cache_path():
+    """`<git common dir>/git-helpers/prs.json`, or `None` outside a git repo."""
+    try:
+        git_dir = check_output(['git', 'rev-parse', '--git-common-dir'], stderr=DEVNULL).decode().strip()
+    except CalledProcessError:
+        return None
+    return os.path.join(git_dir, 'git-helpers', 'prs.json')
+
+
+def load_cache(path):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def save_cache(path, cache):
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+
+def query_prs(repo, branch, gh=None):
+    """Run the GraphQL lookup; returns `{'parent': <owner/name or None>, 'prs': [...]}`.
+
+    PRs are those whose head is `branch` in `repo` itself, or in `repo`'s parent with a head in either repo.
+    """
+    owner, name = repo.split('/', 1)
+    gh = gh or GitHubSession()
+    data = gh.graphql(PRS_QUERY, owner=owner, name=name, branch=branch)['repository']
+    heads = {data['nameWithOwner']}
+    parent = data.get('parent')
+    if parent:
+        heads.add(parent['nameWithOwner'])
+
+    prs = []
+    for r in [data] + ([parent] if parent else []):
+        for pr in r['pullRequests']['nodes']:
+            head = (pr.get('headRepository') or {}).get('nameWithOwner')
+            if head not in heads:
+                continue
+            prs.append({
+                'number': pr['number'],
+                'url': pr['url'],
+                'state': pr['state'],
+                'repo': r['nameWithOwner'],
+            })
+    return {
+        'parent': parent['nameWithOwner'] if parent else None,
+        'prs': prs,
+    }
+
+
+def find_prs(repo, branch, head_sha=None, refresh=False, verbose=True):
+    """Return `{'parent': ..., 'prs': [...]}` for `branch` of `repo`, from cache if `head_sha` matches the last lookup.
+
+    The cache lives in the git dir, keyed by `<repo>:<branch>`; a new head SHA (or `refresh`) triggers a new query.
+    """
+    path = cache_path()
+    cache = load_cache(path)
+    key = f'{repo}:{branch}'
+    entry = cache.get(key)
+    if entry and head_sha and entry.get('sha') == head_sha and not refresh:
+        if verbose:
+            stderr.write(f"Using cached PR lookup for {key} ({head_sha[:7]})\n")
+        return entry['result']
+
+    if verbose:
+        stderr.write(f"Searching for PRs in {repo} (and parent) with branch {branch}...\n")
+    result = query_prs(repo, branch)
+    # Don't cache misses: a PR may be opened without the head moving
+    if head_sha and result['prs']:
+        cache[key] = {'sha': head_sha, 'result': result}
+        save_cache(path, cache)
+    return result
+
+
+def pick_pr(prs, verbose=True):
+    """Pick a PR from `prs`, preferring open ones; returns `None` if empty."""
+    if not prs:
+        return None
+    if len(prs) == 1:
+        return prs[0]
+    open_prs = [ pr for pr in prs if pr['state'] == 'OPEN' ]
+    if verbose:
+        stderr.write("Multiple PRs found:\n")
+        for pr in prs:
+            stderr.write(f"  {pr['repo']}#{pr['number']} ({pr['state']}): {pr['url']}\n")
+    pr = open_prs[0] if open_prs else prs[0]
+    if verbose:
+        stderr.write(f"Using {'first open' if open_prs else 'first'} PR: #{pr['number']}\n")
+    return pr
@@ -0,0 +1,333 @@
+"""Rewrite commit/tag identities and dates across history by streaming `git fast-export` through in-process filters
+into `git fast-import`.
+
+Blobs and trees are never exported (`--no-data` makes file entries reference existing blob SHAs), and only
+`author`/`committer`/`tagger` lines are rewritten, so throughput is bounded by `git` itself (thousands of commits per
+second), rather than by a shell per commit (as with `git filter-branch --env-filter`). Commits whose identities don't
+change, and whose parents don't change, are re-created byte-for-byte (same SHA).
+"""
+
+import re
+import sys
+from dataclasses import dataclass, field
+from os.path import isfile
+from subprocess import PIPE, Popen, check_output
+from time import monotonic
+
+from git_helpers.util.refs import update_refs
+
+EXPORT_ARGS = [
+    '--no-data',
+    '--reference-excluded-parents',
+    '--show-original-ids',
+    '--reencode=no',
+    '--signed-tags=warn-strip',
+    '--tag-of-filtered-object=rewrite',
+    '--use-done-feature',
+]
+OFFSET_RGX = re.compile(r'^([+-]?)(\d+)([smhd]?)$')
+OFFSET_UNITS = { 's': 1, 'm': 60, 'h': 3600, 'd': 86400, '': 1 }
+MARK_RGX = re.compile(rb'^(?:from|merge) (:\d+)$')
+# The name (and the space before `<`) may be empty, e.g. `author <e@x> 1 +0000`
+IDENT_RGX = re.compile(rb'^(.*?) ?<([^>]*)> (.*)$')
+
+
+def split_ident(ident):
+    """Split `Name <email> <ts> <tz>` (bytes) into `(name, email, date)`."""
+    m = IDENT_RGX.match(ident)
+    if not m:
+        raise ValueError(f'Invalid ident: {ident!r}')
+    return m.groups()
+
+
+def join_ident(name, email, date):
+    return b'%s<%s> %s' % (name + b' ' if name else b'', email, date)
+
+
+def parse_offset(offset):
+    """`[+|-]<number>[s|m|h|d]` → seconds. As in `git set-committer-info -d`, a `+` prefix adds; otherwise, subtracts."""
+    m = OFFSET_RGX.match(offset)
+    if not m:
+        raise ValueError(f'Invalid date offset: {offset} (expected [+|-]<number>[s|m|h|d], e.g. 1s, +2h, -3d)')
+    sign, num, unit = m.groups()
+    seconds = int(num) * OFFSET_UNITS[unit]
+    return seconds if sign == '+' else -seconds
+
+
+def parse_person(spec):
+    """`Name <email>` → `(name, email)`; a bare `email` → `(None, email)` (bytes)."""
+    spec = spec.strip()
+    if '<' in spec:
+        name, _, rest = spec.partition('<')
+        return name.strip().encode(), rest.rstrip('>').strip().encode()
+    return None, spec.encode()
+
+
+class Mailmap:
+    """In-process `.mailmap` lookups (see gitmailmap(5)); names and emails match case-insensitively."""
+
+    def __init__(self):
+        # {commit email: (proper name, proper email, {commit name: (proper name, proper email)})}
+        self.entries = {}
+
+    @classmethod
+    def load(cls, *paths):
+        mailmap = cls()
+        for path in paths:
+            if path and isfile(path):
+                with open(path, 'rb') as f:
+                    for line in f:
+                        mailmap.add_line(line)
+        return mailmap
+
+    def add_line(self, line):
+        line = line.split(b'#', 1)[0].strip()
+        parts = re.findall(rb'([^<]*)<([^>]*)>', line)
+        if not parts:
+            return
+        proper_name = parts[0][0].strip() or None
+        proper_email = parts[0][1].strip() or None
+        if len(parts) == 1:
+            commit_name, commit_email = None, proper_email
+            proper_email = None
+        else:
+            commit_name = parts[1][0].strip() or None
+            commit_email = parts[1][1].strip()
+        name, email, by_name = self.entries.setdefault(commit_email.lower(), (None, None, {}))
+        if commit_name:
+            by_name[commit_name.lower()] = (proper_name, proper_email)
+        else:
+            self.entries[commit_email.lower()] = (proper_name or name, proper_email or email, by_name)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def map(self, name, email):
+        entry = self.entries.get(email.lower())
+        if not entry:
+            return name, email
+        proper_name, proper_email, by_name = entry
+        if name.lower() in by_name:
+            proper_name, proper_email = by_name[name.lower()]
+        return proper_name or name, proper_email or email
+
+
+@dataclass
+class IdentFilter:
+    """Rewrites identities/dates; `commit()` and `tag()` return the (possibly) updated `Name <email> <ts> <tz>` idents.
+
+    Applied in order: `mailmap`, then `emails` (`{old email (lowercase): (name or None, email)}`), then `author` /
+    `committer` (`(name, email)`, set unconditionally), then date changes.
+    """
+    mailmap: Mailmap = None
+    emails: dict = field(default_factory=dict)
+    author: tuple = None
+    committer: tuple = None
+    committer_date_is_author_date: bool = False
+    author_date_is_committer_date: bool = False
+    date_offset: int = 0
+
+    def person(self, ident, override=None):
+        name, email, date = split_ident(ident)
+        if self.mailmap:
+            name, email = self.mailmap.map(name, email)
+        mapped = self.emails.get(email.lower())
+        if mapped:
+            name, email = mapped[0] or name, mapped[1]
+        if override:
+            name, email = override
+        return name, email, self.shift(date)
+
+    def shift(self, date):
+        if not self.date_offset:
+            return date
+        ts, _, tz = date.partition(b' ')
+        return b'%d %s' % (int(ts) + self.date_offset, tz)
+
+    def commit(self, author, committer):
+        a_name, a_email, a_date = self.person(author, self.author)
+        c_name, c_email, c_date = self.person(committer, self.committer)
+        if self.committer_date_is_author_date:
+            c_date = a_date
+        elif self.author_date_is_committer_date:
+            a_date = c_date
+        return join_ident(a_name, a_email, a_date), join_ident(c_name, c_email, c_date)
+
+    def tag(self, tagger):
+        return join_ident(*self.person(tagger))
+
+
+@dataclass
+class Stats:
+    commits: int = 0
+    tags: int = 0
+    # Original SHAs of commits whose identities changed
+    changed: list = field(default_factory=list)
+    # Commits that get new SHAs (changed, or descended from a changed commit)
+    rewritten: int = 0
+    # Annotated tags whose tagger changed
+    changed_tags: int = 0
+    refs: dict = field(default_factory=dict)
+
+
+def filter_stream(src, dst, ident_filter, stats, on_change=None, progress=None):
+    """Copy a `git fast-export` stream from `src` to `dst`, rewriting `author`/`committer`/`tagger` lines.
+
+    Message/data payloads are copied verbatim. `on_change(oid, kind, old, new)` is called for each changed ident;
+    `progress(stats)` after every commit. Everything up to (not including) the final `done` is written; returns
+    whether a `done` was seen.
+    """
+    readline = src.readline
+    write = dst.write if dst else None
+    oid = author = mark = None
+    rewritten_marks = set()
+    # Whether the current commit (if any) gets a new SHA; parents (`from`/`merge`) follow its `committer` line, so this
+    # is only final once the next command starts
+    rewritten = None
+
+    def end_commit():
+        if rewritten:
+            stats.rewritten += 1
+            rewritten_marks.add(mark)
+
+    while True:
+        line = readline()
+        if not line:
+            end_commit()
+            return False
+        if line.startswith(b'author '):
+            author = line[7:-1]
+            continue
+        if line.startswith(b'committer '):
+            committer = line[10:-1]
+            new_author, new_committer = ident_filter.commit(author, committer)
+            changed = False
+            if new_author != author:
+                changed = True
+                if on_change:
+                    on_change(oid, 'author', author, new_author)
+            if write:
+                write(b'author ' + new_author + b'\n')
+            if new_committer != committer:
+                changed = True
+                if on_change:
+                    on_change(oid, 'committer', committer, new_committer)
+            if write:
+                write(b'committer ' + new_committer + b'\n')
+            if changed:
+                stats.changed.append(oid)
+                rewritten = True
+            stats.commits += 1
+            if progress:
+                progress(stats)
+            continue
+        if line.startswith(b'tagger '):
+            tagger = line[7:-1]
+            new_tagger = ident_filter.tag(tagger)
+            if new_tagger != tagger:
+                stats.changed_tags += 1
+                if on_change:
+                    on_change(oid, 'tagger', tagger, new_tagger)
+            if write:
+                write(b'tagger ' + new_tagger + b'\n')
+            continue
+        if line.startswith(b'data '):
+            if write:
+                write(line)
+                write(src.read(int(line[5:])))
+            else:
+                src.read(int(line[5:]))
+            continue
+        if line.startswith(b'commit '):
+            end_commit()
+            stats.refs[line[7:-1].decode()] = None
+            oid = mark = None
+            rewritten = False
+        elif line.startswith(b'tag '):
+            end_commit()
+            stats.refs[f'refs/tags/{line[4:-1].decode()}'] = None
+            stats.tags += 1
+            oid = rewritten = None
+        elif line.startswith(b'reset '):
+            end_commit()
+            stats.refs[line[6:-1].decode()] = None
+            rewritten = None
+        elif line.startswith(b'mark '):
+            mark = line[5:-1]
+        elif line.startswith(b'original-oid '):
+            oid = line[13:-1].decode()
+        elif line == b'done\n':
+            end_commit()
+            return True
+        elif rewritten is False:
+            m = MARK_RGX.match(line.rstrip(b'\n'))
+            if m and m.group(1) in rewritten_marks:
+                rewritten = True
+        if write:
+            write(line)
+
+
+class Progress:
+    """Log `<n> commits (<rate>/s)` to stderr, at most every `interval` seconds."""
+
+    def __init__(self, interval=0.5, out=sys.stderr):
+        self.start = self.last = monotonic()
+        self.interval = interval
+        self.out = out
+
+    def __call__(self, stats):
+        now = monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.write(stats, now)
+
+    def write(self, stats, now=None, end=''):
+        elapsed = (now or monotonic()) - self.start
+        rate = stats.commits / elapsed if elapsed else 0
+        self.out.write(f'\r{stats.commits} commits, {len(stats.changed)} changed ({rate:.0f}/s){end}')
+        self.out.flush()
+
+
+def rewrite_history(revs, ident_filter, dry_run=False, on_change=None, progress=None, backup_ns=None, overwrite_backup=False, cwd=None):
+    """Stream `git fast-export <revs>` through `ident_filter` into `git fast-import` (unless `dry_run`); returns `Stats`.
+
+    Refs in the stream are force-updated by fast-import at the end. With `backup_ns`, if anything changed, each ref's
+    previous value is saved as `<backup_ns>/<ref>` once fast-import succeeds; as with `git filter-branch`'s
+    `refs/original/`, this refuses to run if `<backup_ns>` already holds refs (from a previous rewrite), unless
+    `overwrite_backup`.
+    """
+    if backup_ns and not dry_run and not overwrite_backup:
+        existing = check_output(['git', 'for-each-ref', '--count=1', '--format=%(refname)', f'{backup_ns}/'], cwd=cwd).decode().strip()
+        if existing:
+            raise RuntimeError(
+                f'A previous backup exists in {backup_ns}/ (e.g. {existing}); '
+                f'delete it (`git for-each-ref --format="delete %(refname)" {backup_ns}/ | git update-ref --stdin`) first'
+            )
+    export = Popen(['git', 'fast-export', *EXPORT_ARGS, *revs], stdout=PIPE, cwd=cwd)
+    fast_import = None if dry_run else Popen(['git', 'fast-import', '--quiet', '--force'], stdin=PIPE, cwd=cwd)
+    stats = Stats()
+    try:
+        done = filter_stream(export.stdout, fast_import and fast_import.stdin, ident_filter, stats, on_change=on_change, progress=progress)
+        if export.wait():
+            raise RuntimeError(f'git fast-export exited {export.returncode}')
+        if not done:
+            raise RuntimeError('git fast-export stream ended without `done`')
+        if fast_import:
+            backup = None
+            if backup_ns and (stats.rewritten or stats.changed_tags):
+                # fast-import only updates refs at the end, so the refs still hold their old values here
+                old = check_output(['git', 'rev-parse', *stats.refs], cwd=cwd).decode().split()
+                backup = { f'{backup_ns}/{ref}': sha for ref, sha in zip(stats.refs, old) }
+            fast_import.stdin.write(b'done\n')
+            fast_import.stdin.close()
+            if fast_import.wait():
+                raise RuntimeError(f'git fast-import exited {fast_import.returncode}')
+            # Only back up once the rewrite has landed, so a failed run doesn't block the next one
+            if backup:
+                update_refs(backup, cwd=cwd, msg='rewrite-history: backup')
+    except BaseException:
+        export.kill()
+        if fast_import:
+            fast_import.kill()
+        raise
+    return stats
@@ -0,0 +1,40 @@
+"""Batched ref updates: many refs created/moved/deleted in one `git update-ref --stdin` transaction."""
+
+from contextlib import contextmanager
+from subprocess import run
+
+# Private namespace for refs that only exist while a command runs; not shown by `git branch`/`git tag`
+EPHEMERAL_NS = 'refs/git-helpers'
+
+
+def update_refs(updates, cwd=None, msg=None, old=None):
+    """Apply `{ref: sha}` updates atomically (a `None` sha deletes the ref); all succeed or none do.
+
+    `old` (`{ref: sha}`) optionally gives each ref's expected current value; if any ref has moved, nothing is updated.
+    """
+    if not updates:
+        return
+    old = old or {}
+    stdin = 'start\n'
+    for ref, sha in updates.items():
+        expected = f' {old[ref]}' if ref in old else ''
+        stdin += f'update {ref} {sha}{expected}\n' if sha else f'delete {ref}{expected}\n'
+    stdin += 'commit\n'
+    cmd = ['git', 'update-ref', '--stdin']
+    if msg:
+        cmd += ['-m', msg]
+    proc = run(cmd, input=stdin.encode(), cwd=cwd, capture_output=True)
+    if proc.returncode:
+        raise RuntimeError(f'`git update-ref --stdin` failed: {proc.stderr.decode().strip()}')
+
+
+@contextmanager
+def ephemeral_refs(shas, ns=f'{EPHEMERAL_NS}/tmp', cwd=None):
+    """Create `<ns>/<name>` → `sha` for each of `shas` (`{name: sha}`) for the duration of the block, in one transaction
+    each way; yields the full ref names, in `shas` order."""
+    refs = { f'{ns}/{name}': sha for name, sha in shas.items() }
+    update_refs(refs, cwd=cwd)
+    try:
+        yield list(refs)
+    finally:
+        update_refs({ ref: None for ref in refs }, cwd=cwd)
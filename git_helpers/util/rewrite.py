@@ -0,0 +1,292 @@
+"""In-memory history rewriting: read many commits in one `git log` pass, replay them with `git merge-tree`, and write
+new ones with `git commit-tree` or one `git fast-import` stream, without touching the index or worktree."""
+
+import os
+from dataclasses import dataclass
+from subprocess import check_output, PIPE, Popen, run
+from tempfile import TemporaryDirectory
+
+# Fields are NUL-separated (and `-z` NUL-separates records), so messages may contain any other bytes
+LOG_FORMAT = '%H%x00%P%x00%T%x00%an <%ae> %ad%x00%cn <%ce> %cd%x00%B'
+LOG_FIELDS = 6
+
+
+@dataclass
+class Commit:
+    sha: str
+    parents: list
+    tree: str
+    # `Name <email> <unix ts> <tz offset>`, as in the commit object's `author`/`committer` headers
+    author: bytes
+    committer: bytes
+    message: bytes
+
+
+def read_commits(*revs, cwd=None):
+    """Return `[Commit]` for `git log <revs>` (pass e.g. `--reverse`, `--topo-order`), from one `git log` call."""
+    out = check_output(
+        ['git', '-c', 'log.showSignature=false', 'log', '-z', '--date=raw', f'--format={LOG_FORMAT}', *revs],
+        cwd=cwd,
+    )
+    if not out:
+        return []
+    fields = out.split(b'\0')
+    commits = []
+    for i in range(0, len(fields) - LOG_FIELDS + 1, LOG_FIELDS):
+        sha, parents, tree, author, committer, message = fields[i:i + LOG_FIELDS]
+        commits.append(Commit(
+            sha=sha.decode(),
+            parents=parents.decode().split(),
+            tree=tree.decode(),
+            author=author,
+            committer=committer,
+            message=message,
+        ))
+    return commits
+
+
+def committer_ident(cwd=None):
+    """The current `Name <email> <ts> <tz>` committer identity (honors `$GIT_COMMITTER_*`)."""
+    return check_output(['git', 'var', 'GIT_COMMITTER_IDENT'], cwd=cwd).rstrip(b'\n')
+
+
+class FastImport:
+    """Stream commits into one `git fast-import` process; `close()` returns `{mark: sha}` for everything written.
+
+    Commits reuse existing trees (`M 040000 <tree> ""` replaces the root tree), so no blobs or trees are rewritten.
+    Each commit is written to `ref`, which fast-import updates once at the end; callers typically point it at a
+    scratch ref and move real refs themselves.
+    """
+
+    def __init__(self, ref, cwd=None):
+        self.ref = ref
+        self.mark = 0
+        self.tmpdir = TemporaryDirectory()
+        self.marks_path = os.path.join(self.tmpdir.name, 'marks')
+        self.proc = Popen(
+            ['git', 'fast-import', '--quiet', '--done', f'--export-marks={self.marks_path}'],
+            stdin=PIPE,
+            cwd=cwd,
+        )
+
+    def write(self, data):
+        self.proc.stdin.write(data)
+
+    def commit(self, tree, parents, message, author, committer):
+        """Queue a commit; `parents` are SHAs or marks (`:N`) of earlier commits in this stream. Returns its mark."""
+        self.mark += 1
+        mark = f':{self.mark}'
+        lines = [
+            f'commit {self.ref}\nmark {mark}\n'.encode(),
+            b'author ' + author + b'\n',
+            b'committer ' + committer + b'\n',
+            f'data {len(message)}\n'.encode(), message, b'\n',
+        ]
+        if parents:
+            lines.append(f'from {parents[0]}\n'.encode())
+            lines += [ f'merge {parent}\n'.encode() for parent in parents[1:] ]
+        else:
+            lines.append(b'deleteall\n')
+        lines.append(f'M 040000 {tree} ""\n\n'.encode())
+        self.write(b''.join(lines))
+        return mark
+
+    def close(self):
+        self.write(b'done\n')
+        self.proc.stdin.close()
+        if self.proc.wait():
+            raise RuntimeError(f'git fast-import exited {self.proc.returncode}')
+        marks = {}
+        with open(self.marks_path, 'r') as f:
+            for line in f:
+                mark, sha = line.split()
+                marks[mark] = sha
+        self.tmpdir.cleanup()
+        return marks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type:
+            self.proc.kill()
+            self.proc.wait()
+            self.tmpdir.cleanup()
+
+
+def git_version(cwd=None):
+    out = check_output(['git', 'version'], cwd=cwd).decode()
+    return tuple(int(part) for part in out.split()[2].split('.')[:2] if part.isdigit())
+
+
+def split_ident(ident):
+    """Split `Name <email> <ts> <tz>` into `(name, email, '<ts> <tz>')` strings."""
+    ident = ident.decode() if isinstance(ident, bytes) else ident
+    name, _, rest = ident.partition(' <')
+    email, _, date = rest.partition('> ')
+    return name, email, date
+
+
+def commit_tree(tree, parents, message, author=None, committer=None, cwd=None):
+    """Write one commit object (no ref, index, or worktree changes); returns its SHA."""
+    env = None
+    if author or committer:
+        env = dict(os.environ)
+        for role, ident in (('AUTHOR', author), ('COMMITTER', committer)):
+            if ident:
+                name, email, date = split_ident(ident)
+                env.update({ f'GIT_{role}_NAME': name, f'GIT_{role}_EMAIL': email, f'GIT_{role}_DATE': f'@{date}' })
+    cmd = ['git', 'commit-tree', tree]
+    for parent in parents:
+        cmd += ['-p', parent]
+    return check_output(cmd, input=message, env=env, cwd=cwd).decode().strip()
+
+
+def merge_tree(ours, theirs, *args, cwd=None):
+    """`git merge-tree --write-tree` two commits (merge base computed by git, unless `args` give one); returns
+    `(tree, conflicted paths)`. On conflict, the tree contains conflict markers."""
+    cmd = ['git', 'merge-tree', '--write-tree', '--name-only', '-z', *args, ours, theirs]
+    proc = run(cmd, stdout=PIPE, stderr=PIPE, cwd=cwd)
+    if proc.returncode not in (0, 1):
+        raise RuntimeError(f'`{" ".join(cmd)}` failed: {proc.stderr.decode().strip()}')
+    fields = proc.stdout.decode().split('\0')
+    tree = fields[0]
+    paths = []
+    for field in fields[1:]:
+        if not field:
+            break
+        if field not in paths:
+            paths.append(field)
+    return tree, (paths or ['(unknown)']) if proc.returncode else []
+
+
+class Conflict(Exception):
+    def __init__(self, commit, paths):
+        self.commit = commit
+        self.paths = paths
+        super().__init__(f'Conflict replaying {commit}: {", ".join(paths)}')
+
+
+class Replayer:
+    """Cherry-pick commits in memory with `git merge-tree --write-tree` (no index or worktree I/O).
+
+    git ≥ 2.40 takes the pick's base via `--merge-base`; older versions get the same three-way merge by merging a
+    scratch commit (the target's tree, parented on the picked commit's parent) with the picked commit.
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        self.has_merge_base = git_version(cwd) >= (2, 40)
+        self.trees = {}
+
+    def tree(self, rev):
+        if rev not in self.trees:
+            self.trees[rev] = check_output(['git', 'rev-parse', f'{rev}^{{tree}}'], cwd=self.cwd).decode().strip()
+        return self.trees[rev]
+
+    def merge(self, base, ours, theirs):
+        """Three-way merge of commits; returns `(tree, conflicted paths)`."""
+        base_tree = self.tree(base) if base else None
+        # Trivial cases need no merge
+        if base_tree == self.tree(ours):
+            return self.tree(theirs), []
+        if base_tree == self.tree(theirs):
+            return self.tree(ours), []
+        if self.has_merge_base:
+            return merge_tree(ours, theirs, f'--merge-base={base}', cwd=self.cwd)
+        scratch = commit_tree(self.tree(ours), [base] if base else [], b'scratch', cwd=self.cwd)
+        return merge_tree(scratch, theirs, *([] if base else ['--allow-unrelated-histories']), cwd=self.cwd)
+
+    def pick(self, commit, onto):
+        """Replay `commit` (a `Commit`, with one parent or none) onto `onto`; returns the new tree, or raises `Conflict`."""
+        parent = commit.parents[0] if commit.parents else None
+        if parent == onto:
+            return commit.tree
+        self.trees.setdefault(commit.sha, commit.tree)
+        tree, conflicts = self.merge(parent, onto, commit.sha)
+        if conflicts:
+            raise Conflict(commit.sha, conflicts)
+        return tree
+
+    def replay(self, commits, onto, committer=None):
+        """Pick each of `commits` (oldest first) onto the previous result, starting at `onto`.
+
+        Returns `[(old sha, new sha)]`; new commits keep their authors and messages. `committer` (an ident) replaces
+        each commit's committer, if given.
+        """
+        mapping = []
+        for commit in commits:
+            tree = self.pick(commit, onto)
+            onto = commit_tree(tree, [onto], commit.message, author=commit.author, committer=committer or commit.committer, cwd=self.cwd)
+            self.trees[onto] = tree
+            mapping.append((commit.sha, onto))
+        return mapping
+
+
+def squash_message(commits):
+    """Default message for a squash of `commits` (oldest first): their subjects, newest first, one paragraph each (as
+    `git commit-tree -m <subject> -m …` would write)."""
+    subjects = [ commit.message.split(b'\n', 1)[0] for commit in reversed(commits) ]
+    return b'\n\n'.join(subjects) + b'\n'
+
+
+def squash_groups(commits, ranges):
+    """Partition `commits` (oldest first, each the first parent of the next) into groups that each become one commit.
+
+    `ranges` are `(start, end)` SHA pairs: the commits in `start..end` (`start` exclusive; it may be `commits[0]`'s
+    parent) form one squashed group, and each other commit is a group of its own. Returns `[(commits, squashed)]`.
+    Raises `ValueError` for ranges that aren't part of `commits`, are empty, or overlap.
+    """
+    idx = { commit.sha: i for i, commit in enumerate(commits) }
+    base = commits[0].parents[0] if commits and commits[0].parents else None
+    spans = []
+    for start, end in ranges:
+        if end == base:
+            raise ValueError(f'{start[:7]}..{end[:7]} is empty')
+        if end not in idx or (start != base and start not in idx):
+            raise ValueError(f'{start[:7]}..{end[:7]} is not part of the (first-parent) history being rewritten')
+        lo = 0 if start == base else idx[start] + 1
+        hi = idx[end]
+        if hi < lo:
+            raise ValueError(f'{start[:7]}..{end[:7]} is empty')
+        spans.append((lo, hi))
+    spans.sort()
+    for (_, prev_hi), (lo, hi) in zip(spans, spans[1:]):
+        if lo <= prev_hi:
+            raise ValueError(f'Ranges overlap at {commits[lo].sha[:7]}')
+
+    groups = []
+    i = 0
+    for lo, hi in spans:
+        groups += [ ([commit], False) for commit in commits[i:lo] ]
+        groups.append((commits[lo:hi + 1], True))
+        i = hi + 1
+    groups += [ ([commit], False) for commit in commits[i:] ]
+    return groups
+
+
+def write_squashed(groups, base, ref, message=None, committer=None, cwd=None):
+    """Write one commit per group (from `squash_groups`) onto `base`, in one `FastImport` stream; returns the new SHAs.
+
+    Each new commit gets its group's last tree and first author, so no merging is needed. Unsquashed commits keep
+    their message (and any merge parents), and are reused as-is while nothing before them has changed; squashed
+    groups get `message` or `squash_message(group)`. `committer` (an ident) replaces rewritten commits' committers.
+    """
+    with FastImport(ref, cwd=cwd) as fi:
+        parent = base
+        new = []
+        for group, squashed in groups:
+            first, last = group[0], group[-1]
+            if not squashed and first.parents[:1] == [parent]:
+                parent = first.sha
+            else:
+                parent = fi.commit(
+                    tree=last.tree,
+                    parents=[parent] if squashed else [parent, *first.parents[1:]],
+                    message=(message or squash_message(group)) if squashed else first.message,
+                    author=first.author,
+                    committer=committer or last.committer,
+                )
+            new.append(parent)
+        marks = fi.close()
+    return [ marks.get(sha, sha) for sha in new ]
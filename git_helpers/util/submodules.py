@@ -0,0 +1,368 @@
+"""Read submodule state directly from `.gitmodules`, the superproject's index, and each submodule's git dir.
+
+Listing N submodules' checked-out SHAs, branches, and decorations takes one `git ls-files` call total (rather than one
+or more git processes per submodule): HEADs and refs are resolved in-process from loose refs and `packed-refs`.
+"""
+
+import os
+import re
+import zlib
+from dataclasses import dataclass, field
+from os.path import isdir, isfile, join
+from subprocess import check_output, DEVNULL
+
+GITLINK_MODE = '160000'
+SHA_RGX = re.compile(r'^[0-9a-f]{40}(?:[0-9a-f]{24})?$')
+SECTION_RGX = re.compile(r'^\[\s*submodule\s+"((?:[^"\\]|\\.)*)"\s*\]\s*(.*)$')
+KEY_RGX = re.compile(r'^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$')
+# In-process formatting supports these `git log --format` placeholders; anything else falls back to `git log`
+SIMPLE_FORMAT_RGX = re.compile(r'%(?:[HhdD%n])')
+ABBREV = 7
+
+
+def git(*args, cwd=None):
+    return check_output(['git', *args], cwd=cwd, stderr=DEVNULL).decode()
+
+
+def _unquote(value):
+    """Strip a git-config value's comment and quotes, and unescape it."""
+    out, quoted, i = '', False, 0
+    while i < len(value):
+        c = value[i]
+        if c == '"':
+            quoted = not quoted
+        elif c == '\\' and i + 1 < len(value):
+            i += 1
+            out += { 'n': '\n', 't': '\t', 'b': '\b' }.get(value[i], value[i])
+        elif c in '#;' and not quoted:
+            break
+        else:
+            out += c
+        i += 1
+    return out.strip()
+
+
+def parse_gitmodules(path):
+    """Parse a `.gitmodules` file into `{name: {key: value}}` (keys lowercased, as git treats them)."""
+    modules = {}
+    if not isfile(path):
+        return modules
+    section = None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            m = SECTION_RGX.match(line)
+            if m:
+                name = re.sub(r'\\(.)', r'\1', m[1])
+                section = modules.setdefault(name, {})
+                line = m[2]
+                if not line:
+                    continue
+            elif line.startswith('['):
+                # Some other section
+                section = None
+                continue
+            if section is None:
+                continue
+            m = KEY_RGX.match(line)
+            if m:
+                section[m[1].lower()] = _unquote(m[2]) if m[2] is not None else 'true'
+    return modules
+
+
+def gitlinks(root='.', ref=None):
+    """Return `{path: sha}` for gitlinks in the index (or in the tree at `ref`), from one `ls-files`/`ls-tree` call.
+
+    Conflicted index entries report "ours" (stage 2).
+    """
+    if ref:
+        out = git('ls-tree', '-r', '-z', '--full-tree', ref, cwd=root)
+    else:
+        out = git('ls-files', '-s', '-z', cwd=root)
+    links = {}
+    for entry in out.split('\0'):
+        if not entry.startswith(GITLINK_MODE):
+            continue
+        meta, path = entry.split('\t', 1)
+        if ref:
+            _, _, sha = meta.split()
+            links[path] = sha
+        else:
+            _, sha, stage = meta.split()
+            if stage in ('0', '2'):
+                links[path] = sha
+    return links
+
+
+def submodule_git_dir(root, path, name, super_git_dir):
+    """Locate a submodule's git dir: `<path>/.git` (a dir, or a `gitdir:` file), else `<super>/modules/<name>`."""
+    dotgit = join(root, path, '.git')
+    if isdir(dotgit):
+        return dotgit
+    if isfile(dotgit):
+        with open(dotgit, 'r') as f:
+            line = f.readline().strip()
+        if line.startswith('gitdir:'):
+            git_dir = line[len('gitdir:'):].strip()
+            return os.path.normpath(join(root, path, git_dir))
+    modules = join(super_git_dir, 'modules', name)
+    return modules if isdir(modules) else None
+
+
+def common_dir(git_dir):
+    """The dir holding refs/objects; differs from `git_dir` for linked worktrees."""
+    path = join(git_dir, 'commondir')
+    if isfile(path):
+        with open(path, 'r') as f:
+            return os.path.normpath(join(git_dir, f.read().strip()))
+    return git_dir
+
+
+def peel_loose(git_dir, sha):
+    """Peel an annotated tag stored as a loose object; returns the commit SHA it points to, `sha` itself if it isn't a
+    tag, or `None` if the object isn't loose (e.g. it was fetched into a pack)."""
+    path = join(common_dir(git_dir), 'objects', sha[:2], sha[2:])
+    seen = 0
+    while isfile(path) and seen < 10:
+        with open(path, 'rb') as f:
+            # Tag objects are small; the header and `object` line are in the first few hundred bytes
+            data = zlib.decompressobj().decompress(f.read(), 512)
+        header, _, body = data.partition(b'\0')
+        if not header.startswith(b'tag '):
+            return sha
+        sha = body.split(b'\n', 1)[0].split(b' ', 1)[1].decode()
+        path = join(common_dir(git_dir), 'objects', sha[:2], sha[2:])
+        seen += 1
+    return None
+
+
+def read_refs(git_dir):
+    """Return `({refname: sha}, {tag refname: peeled sha})` from `packed-refs` and loose refs (loose refs win).
+
+    Loose tags are peeled via their loose tag objects; if one's object is packed, its peeled SHA is looked up with one
+    `git for-each-ref` call.
+    """
+    base = common_dir(git_dir)
+    refs, peeled, unpeeled, symrefs = {}, {}, [], {}
+    packed = join(base, 'packed-refs')
+    if isfile(packed):
+        last = None
+        with open(packed, 'r') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('^'):
+                    if last:
+                        peeled[last] = line[1:]
+                    continue
+                sha, _, name = line.partition(' ')
+                refs[name] = sha
+                last = name
+    refs_dir = join(base, 'refs')
+    for dirpath, _, filenames in os.walk(refs_dir):
+        for filename in filenames:
+            path = join(dirpath, filename)
+            try:
+                with open(path, 'r') as f:
+                    sha = f.read().strip()
+            except OSError:
+                continue
+            name = os.path.relpath(path, base).replace(os.sep, '/')
+            if sha.startswith('ref:'):
+                symrefs[name] = sha[len('ref:'):].strip()
+            elif SHA_RGX.match(sha):
+                refs[name] = sha
+                peeled.pop(name, None)
+                if name.startswith('refs/tags/'):
+                    target = peel_loose(git_dir, sha)
+                    if target is None:
+                        unpeeled.append(name)
+                    elif target != sha:
+                        peeled[name] = target
+    # Symbolic refs (e.g. `refs/remotes/origin/HEAD`) decorate the commit their target points to
+    for name, target in symrefs.items():
+        if target in refs:
+            refs[name] = refs[target]
+    if unpeeled:
+        out = git('--git-dir', git_dir, 'for-each-ref', '--format=%(refname) %(*objectname)', *unpeeled)
+        for line in out.splitlines():
+            name, _, target = line.partition(' ')
+            if target:
+                peeled[name] = target
+    return refs, peeled
+
+
+def read_head(git_dir, refs=None):
+    """Return `(sha, branch)` for `git_dir`'s HEAD; `branch` is `None` when detached, `sha` is `None` when unborn."""
+    with open(join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    if not head.startswith('ref:'):
+        return head, None
+    target = head[len('ref:'):].strip()
+    if refs is None:
+        refs, _ = read_refs(git_dir)
+    branch = target[len('refs/heads/'):] if target.startswith('refs/heads/') else target
+    return refs.get(target), branch
+
+
+def decorations(sha, refs, peeled, branch=None):
+    """Names pointing at `sha`, in `git log --decorate` order: `HEAD -> <branch>`, then refs in reverse refname order."""
+    if not sha:
+        return []
+    names = []
+    for name in sorted(refs, reverse=True):
+        target = peeled.get(name, refs[name])
+        if target != sha:
+            continue
+        if name.startswith('refs/heads/'):
+            short = name[len('refs/heads/'):]
+            if short == branch:
+                continue
+            names.append(short)
+        elif name.startswith('refs/remotes/'):
+            names.append(name[len('refs/remotes/'):])
+        elif name.startswith('refs/tags/'):
+            names.append(f'tag: {name[len("refs/tags/"):]}')
+    head = f'HEAD -> {branch}' if branch else 'HEAD'
+    return [head] + names
+
+
+@dataclass
+class Submodule:
+    name: str
+    path: str
+    url: str = None
+    # SHA recorded in the superproject's index (or at the requested ref)
+    recorded: str = None
+    # SHA checked out in the submodule (`None` if not initialized)
+    head: str = None
+    branch: str = None
+    git_dir: str = None
+    decorations: list = field(default_factory=list)
+    # `git status --porcelain=v2` submodule flags (`S<c><m><u>`), when requested
+    dirty: str = None
+
+    @property
+    def initialized(self):
+        return self.git_dir is not None
+
+    @property
+    def moved(self):
+        """Whether the checked-out commit differs from the recorded one."""
+        return self.head is not None and self.head != self.recorded
+
+    def format(self, fmt):
+        """Render a `git log --format`-style string; supports `%H %h %d %D %n %%` in-process."""
+        def sub(m):
+            p = m[0][1]
+            if p == 'H':
+                return self.head or ''
+            if p == 'h':
+                return (self.head or '')[:ABBREV]
+            if p == 'D':
+                return ', '.join(self.decorations)
+            if p == 'd':
+                return f' ({", ".join(self.decorations)})' if self.decorations else ''
+            return { 'n': '\n', '%': '%' }[p]
+        return SIMPLE_FORMAT_RGX.sub(sub, fmt)
+
+
+def is_simple_format(fmt):
+    return '%' not in SIMPLE_FORMAT_RGX.sub('', fmt)
+
+
+def submodule_statuses(root='.'):
+    """Return `{path: 'S<c><m><u>'}` for all submodules, from one `git status --porcelain=v2` of the superproject."""
+    out = git('status', '--porcelain=v2', '-z', '--ignore-submodules=none', '--untracked-files=no', cwd=root)
+    statuses = {}
+    for entry in out.split('\0'):
+        # "1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>"; renames ("2 ...") have an extra field, and a trailing NUL-separated orig path
+        parts = entry.split(' ')
+        if parts[0] == '1' and len(parts) >= 9 and parts[2].startswith('S'):
+            statuses[' '.join(parts[8:])] = parts[2]
+        elif parts[0] == '2' and len(parts) >= 10 and parts[2].startswith('S'):
+            statuses[' '.join(parts[9:])] = parts[2]
+        elif parts[0] == 'u' and len(parts) >= 11 and parts[2].startswith('S'):
+            statuses[' '.join(parts[10:])] = parts[2]
+    return statuses
+
+
+def load_submodules(root=None, names=None, ref=None, dirty=False, decorate=True):
+    """Return `[Submodule]` for the superproject at `root` (default: the current repo's toplevel), in `.gitmodules` order.
+
+    `names` filters by submodule name or path; `ref` reads recorded SHAs from that commit instead of the index; `dirty`
+    adds a (recursive, so slower) `git status` of the superproject.
+    """
+    if root is None:
+        root = git('rev-parse', '--show-toplevel').strip()
+    super_git_dir = git('rev-parse', '--absolute-git-dir', cwd=root).strip()
+    modules = parse_gitmodules(join(root, '.gitmodules'))
+    links = gitlinks(root, ref=ref)
+    statuses = submodule_statuses(root) if dirty else {}
+
+    submodules = []
+    for name, config in modules.items():
+        path = config.get('path')
+        if not path:
+            continue
+        if names and name not in names and path not in names:
+            continue
+        sm = Submodule(name=name, path=path, url=config.get('url'), recorded=links.get(path))
+        sm.git_dir = submodule_git_dir(root, path, name, super_git_dir)
+        if sm.git_dir and isfile(join(sm.git_dir, 'HEAD')) and isdir(join(root, path)):
+            refs, peeled = read_refs(sm.git_dir)
+            sm.head, sm.branch = read_head(sm.git_dir, refs)
+            if decorate:
+                sm.decorations = decorations(sm.head, refs, peeled, sm.branch)
+        else:
+            sm.git_dir = None
+        sm.dirty = statuses.get(path)
+        submodules.append(sm)
+    return submodules
+
+
+def gitlinks_at(revs, path, cwd=None):
+    """Return `{rev: sha}` of the gitlink at `path` in each of `revs` (`None` where absent), via one `cat-file --batch`.
+
+    Only `path`'s parent tree is read for each rev, and the gitlink entry is picked out in-process.
+    """
+    parent, _, name = path.rstrip('/').rpartition('/')
+    name = name.encode()
+    stdin = ''.join(f'{rev}:{parent}\n' if parent else f'{rev}^{{tree}}\n' for rev in revs).encode()
+    out = check_output(['git', 'cat-file', '--batch'], input=stdin, cwd=cwd)
+    shas = {}
+    pos = 0
+    for rev in revs:
+        header_end = out.index(b'\n', pos)
+        header = out[pos:header_end].split()
+        pos = header_end + 1
+        if len(header) != 3:
+            # `<rev> missing` / `<rev> ambiguous`: no body follows
+            shas[rev] = None
+            continue
+        size = int(header[2])
+        if header[1] == b'tree':
+            # Binary entry SHAs are as long as the (hex) object names in the header: 20 bytes for SHA-1, 32 for SHA-256
+            shas[rev] = _tree_entry(out[pos:pos + size], name, mode=GITLINK_MODE.encode(), sha_len=len(header[0]) // 2)
+        else:
+            # e.g. `path`'s parent is a file at this rev
+            shas[rev] = None
+        # Object contents (of any type) are followed by a newline
+        pos += size + 1
+    return shas
+
+
+def _tree_entry(tree, name, mode, sha_len=20):
+    """Find `name` in a raw tree object's entries (`<mode> <name>\\0<binary sha>`); returns its hex SHA if it has `mode`."""
+    pos = 0
+    while pos < len(tree):
+        nul = tree.index(b'\0', pos)
+        entry_mode, _, entry_name = tree[pos:nul].partition(b' ')
+        sha = tree[nul + 1:nul + 1 + sha_len]
+        if entry_name == name:
+            return sha.hex() if entry_mode == mode else None
+        pos = nul + 1 + sha_len
+    return None
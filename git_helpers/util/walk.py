@@ -0,0 +1,223 @@
+"""Bounded history walks: commits are looked up in the commit-graph (parents and generation numbers, read straight
+from the mmap'd `.graph` files) where it has them, and otherwise read from one persistent `git cat-file --batch`, so a
+walk costs time proportional to the number of commits it visits, not to the size of the repo."""
+
+import mmap
+import struct
+from os.path import exists, join
+from subprocess import PIPE, Popen, check_output
+
+# `CDAT` parent values (see gitformat-commit-graph(5))
+PARENT_NONE = 0x70000000
+# Commits not in the commit-graph sort after all those in it (as with git's `GENERATION_NUMBER_INFINITY`): the graph is
+# closed under ancestry, so they can't be ancestors of anything in it
+GENERATION_INFINITY = 1 << 32
+
+
+class CatFile:
+    """A persistent `git cat-file --batch`; `read(rev)` returns `(type, body)`, or `None` for a missing object."""
+
+    def __init__(self, cwd=None):
+        self.proc = Popen(['git', 'cat-file', '--batch'], stdin=PIPE, stdout=PIPE, cwd=cwd)
+
+    def read(self, rev):
+        self.proc.stdin.write(rev.encode() + b'\n')
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if len(header) != 3:
+            # `<rev> missing` / `<rev> ambiguous`
+            return None
+        _, typ, size = header
+        body = self.proc.stdout.read(int(size))
+        self.proc.stdout.read(1)
+        return typ.decode(), body
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class GraphFile:
+    """One commit-graph file (`objects/info/commit-graph`, or a layer of a split chain)."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        sig, version, hash_version, num_chunks, _ = struct.unpack_from('>4sBBBB', data)
+        if sig != b'CGPH' or version != 1:
+            raise ValueError(f'{path}: unsupported commit-graph (signature {sig}, version {version})')
+        self.hash_len = 32 if hash_version == 2 else 20
+        chunks = dict(struct.unpack_from('>4sQ', data, 8 + 12 * idx) for idx in range(num_chunks))
+        self.fanout = chunks[b'OIDF']
+        self.oids = chunks[b'OIDL']
+        self.cdat = chunks[b'CDAT']
+        self.num = struct.unpack_from('>I', data, self.fanout + 255 * 4)[0]
+
+    def find(self, oid):
+        """Local index of `oid` (bytes), or `None`."""
+        first = oid[0]
+        lo = struct.unpack_from('>I', self.data, self.fanout + 4 * (first - 1))[0] if first else 0
+        hi = struct.unpack_from('>I', self.data, self.fanout + 4 * first)[0]
+        n = self.hash_len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.oids + mid * n
+            cur = self.data[start:start + n]
+            if cur == oid:
+                return mid
+            if cur < oid:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def oid(self, idx):
+        start = self.oids + idx * self.hash_len
+        return self.data[start:start + self.hash_len].hex()
+
+    def entry(self, idx):
+        """`(first parent's global position or None, generation, commit time)` for the commit at local index `idx`."""
+        parent, _, gen_date = struct.unpack_from('>IIQ', self.data, self.cdat + idx * (self.hash_len + 16) + self.hash_len)
+        # Top 30 bits: topological level ("generation number v1"); low 34 bits: commit time
+        return None if parent == PARENT_NONE else parent, gen_date >> 34, gen_date & ((1 << 34) - 1)
+
+
+class CommitGraph:
+    """A repo's commit-graph: a single file, or a split chain of layers (positions are global, base layer first)."""
+
+    def __init__(self, files):
+        self.files = files
+        self.offsets = []
+        offset = 0
+        for graph_file in files:
+            self.offsets.append(offset)
+            offset += graph_file.num
+
+    @classmethod
+    def load(cls, cwd=None):
+        """The repo's commit-graph, or `None` if it has none (or git is configured not to use one)."""
+        out = check_output(
+            ['git', 'rev-parse', '--git-path', 'objects/info', '--git-path', 'shallow'],
+            cwd=cwd,
+        ).decode().split('\n')
+        info_dir, shallow = out[0], out[1]
+        if cwd:
+            info_dir, shallow = join(cwd, info_dir), join(cwd, shallow)
+        enabled = check_output(['git', 'config', '--type=bool', '--default=true', 'core.commitGraph'], cwd=cwd).decode().strip()
+        if enabled != 'true' or exists(shallow):
+            return None
+        # Like git, prefer a single `commit-graph` file over a chain
+        single = join(info_dir, 'commit-graph')
+        if exists(single):
+            return cls([GraphFile(single)])
+        chain_dir = join(info_dir, 'commit-graphs')
+        chain = join(chain_dir, 'commit-graph-chain')
+        if not exists(chain):
+            return None
+        with open(chain, 'r') as f:
+            hashes = f.read().split()
+        return cls([ GraphFile(join(chain_dir, f'graph-{h}.graph')) for h in hashes ]) if hashes else None
+
+    def locate(self, pos):
+        for graph_file, offset in zip(reversed(self.files), reversed(self.offsets)):
+            if pos >= offset:
+                return graph_file, pos - offset
+        raise ValueError(f'Invalid commit-graph position {pos}')
+
+    def lookup(self, sha):
+        """`(first parent SHA or None, generation, commit time)`, or `None` if `sha` isn't in the graph."""
+        oid = bytes.fromhex(sha)
+        for graph_file in reversed(self.files):
+            idx = graph_file.find(oid)
+            if idx is not None:
+                parent, generation, date = graph_file.entry(idx)
+                if parent is not None:
+                    parent = self.oid(parent)
+                return parent, generation, date
+        return None
+
+    def oid(self, pos):
+        graph_file, idx = self.locate(pos)
+        return graph_file.oid(idx)
+
+
+class FirstParents:
+    """`lookup(sha)` → `(first parent SHA or None, sort key)`; sort keys order descendants after their ancestors.
+
+    Keys are `(generation, commit time)` for commits in the commit-graph, and `(GENERATION_INFINITY, commit time)`
+    otherwise (read via `cat-file`; ordering among those is then only a heuristic).
+    """
+
+    def __init__(self, cwd=None, graph=True):
+        self.graph = CommitGraph.load(cwd) if graph else None
+        self.cat_file = CatFile(cwd)
+
+    def lookup(self, sha):
+        if self.graph:
+            hit = self.graph.lookup(sha)
+            if hit:
+                parent, generation, date = hit
+                return parent, (generation, date)
+        obj = self.cat_file.read(sha)
+        if not obj or obj[0] != 'commit':
+            # Missing (e.g. beyond a shallow boundary): treat as a root
+            return None, (GENERATION_INFINITY, 0)
+        parent = None
+        date = 0
+        for line in obj[1].split(b'\n'):
+            if not line:
+                break
+            if parent is None and line.startswith(b'parent '):
+                parent = line[7:].decode()
+            elif line.startswith(b'committer '):
+                date = int(line.rsplit(b' ', 2)[1])
+        return parent, (GENERATION_INFINITY, date)
+
+    def close(self):
+        self.cat_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def first_parent_fork_point(a, b, parents):
+    """`(fork point, number of commits visited)`, where the fork point is the newest commit on both `a`'s and `b`'s
+    first-parent chains (or `None`, if they don't meet), and `parents` is a `FirstParents`.
+
+    Both chains are walked from their tips, always advancing the one whose current commit has the greater sort key,
+    until one steps onto a commit the other has already visited. Once two first-parent chains meet they coincide, so
+    that's the fork point whatever order the chains are walked in; the ordering just keeps either side from overshooting
+    it, so the walk visits about as many commits as are unique to the two sides.
+    """
+    seen = (set(), set())
+    cur = [a, b]
+    infos = [parents.lookup(a), parents.lookup(b)]
+    visited = 0
+    while cur[0] or cur[1]:
+        if cur[0] == cur[1]:
+            return cur[0], visited
+        if cur[1] is None:
+            side = 0
+        elif cur[0] is None:
+            side = 1
+        else:
+            side = 0 if infos[0][1] >= infos[1][1] else 1
+        sha = cur[side]
+        if sha in seen[1 - side]:
+            return sha, visited
+        seen[side].add(sha)
+        visited += 1
+        parent = infos[side][0]
+        cur[side] = parent
+        if parent:
+            infos[side] = parents.lookup(parent)
+    return None, visited
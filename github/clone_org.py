@@ -2,22 +2,43 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "click",
-#     "utz",
 #     "requests",
 # ]
 # ///
 
+import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import chdir, getcwd
+from os.path import exists
 from pathlib import Path
 from subprocess import check_call as sh
 from sys import exit
+from threading import Lock
+from time import monotonic
 
 # Add current directory to path for local imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from repos import repos as get_repos
+import object_pool
+
+
+STATE_FILE = '.clone_org.json'
+
+
+def load_state(path):
+    if not exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
 
 
 if __name__ == '__main__':
@@ -28,65 +49,130 @@ if __name__ == '__main__':
     parser.add_argument('dir',nargs='?',help='Directory to clone <org> into (default: <org>)')
     parser.add_argument('-h','--https',action='store_true',help='When set, clone with HTTPS URLs (default: SSH)')
     parser.add_argument('--help', action='help', help='Show this help message and exit')
-    parser.add_argument('-j','--num-jobs',default=-1,type=int,help='"clone" concurrency')
+    parser.add_argument('-j','--num-jobs',default=-1,type=int,help='"clone"/"fetch" concurrency (default: number of CPUs)')
+    parser.add_argument('-m','--mirror',action='store_true',help=f'Incremental mode: record each repo\'s `pushed_at` in {STATE_FILE}; on re-runs, only `fetch` repos that were pushed to since, and clone new ones')
     parser.add_argument('-n','--dry-run',action='store_true',help="When set, print repos that would be cloned, but don't clone them")
+    parser.add_argument('-P','--pool',help='Shared bare "object pool" repo (created if missing): all repos are fetched into it first, and clones borrow its objects via `objects/info/alternates` (see object_pool.py)')
+    parser.add_argument('-p','--partial',action='store_true',help='Make partial clones (`--filter=blob:none`); blobs are fetched on demand')
     parser.add_argument('-q','--quiet',action='store_true',help="When set, suppress logging output")
+    parser.add_argument('-r','--reference',help='Pass `--reference <repo>` to `git clone`, borrowing objects from a local repository')
     parser.add_argument('-S','--no-submodules',action='store_true',help='When set, clone repos but do not make them submodules of the current repo/directory')
     args, clone_args = parser.parse_known_args()
     org = args.org
     dir = args.dir or org
     https = args.https
+    mirror = args.mirror
     dry_run = args.dry_run
     quiet = args.quiet
     num_jobs = args.num_jobs
+    if num_jobs <= 0:
+        num_jobs = os.cpu_count() or 1
     submodules = not args.no_submodules
+    pool = os.path.abspath(args.pool) if args.pool else None
+
+    if args.partial:
+        clone_args = ['--filter=blob:none'] + clone_args
+    if args.reference:
+        clone_args = ['--reference', os.path.abspath(args.reference)] + clone_args
+    if pool:
+        clone_args = ['--reference', pool] + clone_args
 
     # Make org dir, cd into it
     Path(dir).mkdir(exist_ok=True, parents=True)
     chdir(dir)
-    sh(['git','init'])
+    if not exists('.git'):
+        sh(['git','init'])
 
     # Load repos for org
     repos = get_repos(org)
 
-    # Get clone URLs
-    urls = [
-        repo[('clone_url' if https else 'ssh_url')]
-        for repo in repos
-    ]
-
     if quiet:
         log = lambda *_,**__: ()
     else:
         log = print
 
-    # Print URLs to clone
-    if dry_run:
-        msg = f'Dry run: would clone {len(urls)} repos into {getcwd()}:'
-    else:
-        msg = f'Cloning {len(urls)} repos into {getcwd()}:'
+    # Decide what to do with each repo: clone new ones; in mirror mode, fetch ones pushed to since the last run
+    state = load_state(STATE_FILE) if mirror else {}
+    clones, fetches, skipped = [], [], []
+    for repo in repos:
+        name = repo['name']
+        if not exists(name):
+            clones.append(repo)
+        elif mirror and state.get(name, {}).get('pushed_at') != repo['pushed_at']:
+            fetches.append(repo)
+        else:
+            skipped.append(repo)
+
+    url = lambda repo: repo[('clone_url' if https else 'ssh_url')]
 
-    log('\n\t'.join([msg] + urls))
+    # Print URLs to clone/fetch
+    verb = 'Dry run: would' if dry_run else 'Will'
+    log('\n\t'.join([f'{verb} clone {len(clones)} repos into {getcwd()}:'] + [ url(repo) for repo in clones ]))
+    if fetches:
+        log('\n\t'.join([f'{verb} fetch {len(fetches)} changed repos:'] + [ repo['name'] for repo in fetches ]))
+    if skipped:
+        log(f'{len(skipped)} repos already present{" and unchanged" if mirror else ""}')
 
     if dry_run: exit(0)
 
-    if submodules:
-        base = ['git','submodule','add'] + clone_args
-    else:
-        base = ['git','clone'] + clone_args
+    if pool and (clones or fetches):
+        # Populate the pool once (forks share objects there), so clones only transfer what the pool lacks
+        object_pool.init(pool)
+        for repo in repos:
+            object_pool.add(pool, repo['full_name'], url(repo))
+        object_pool.maintain(pool, jobs=num_jobs)
+
+    state_lock = Lock()
 
-    def clone(url):
-        cmd = base + [url]
+    def record(repo):
+        if not mirror:
+            return
+        with state_lock:
+            state[repo['name']] = { 'pushed_at': repo['pushed_at'], 'url': url(repo) }
+            save_state(STATE_FILE, state)
+
+    def clone(repo):
+        cmd = ['git','clone'] + clone_args + [url(repo), repo['name']]
         log(f'Running: {cmd}')
         sh(cmd)
 
-    # Perform clones
-    try:
-        from joblib import Parallel, delayed
-        parallel = Parallel(n_jobs=num_jobs)
-        num_jobs = parallel.n_jobs
-        log(f'Cloning with {num_jobs}x parallelism')
-        parallel(delayed(clone)(url) for url in urls)
-    except ImportError:
-        log(f'Cloning with no parallelism')
-        [ clone(url) for url in urls ]
+    def fetch(repo):
+        sh(['git','-C',repo['name'],'fetch','--all','--prune','--quiet'])
+
+    def run(op, repo):
+        start = monotonic()
+        op(repo)
+        if pool and op is clone:
+            # Only edits the clone's alternates; pool membership is recorded serially below
+            object_pool.attach(pool, repo['name'], register=False)
+        record(repo)
+        return monotonic() - start
+
+    # Clones and fetches share one bounded pool; `git submodule add` touches the parent's index, so it runs serially after
+    tasks = [ (clone, repo) for repo in clones ] + [ (fetch, repo) for repo in fetches ]
+    failures = []
+    cloned, fetched = [], []
+    start = monotonic()
+    log(f'Running {len(tasks)} clones/fetches with {num_jobs}x parallelism')
+    with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        futures = { executor.submit(run, op, repo): (op, repo) for op, repo in tasks }
+        for future in as_completed(futures):
+            op, repo = futures[future]
+            try:
+                elapsed = future.result()
+                log(f'{repo["name"]}: {op.__name__} took {elapsed:.1f}s')
+                (cloned if op is clone else fetched).append(repo)
+            except Exception as e:
+                failures.append(repo)
+                log(f'{repo["name"]}: {op.__name__} failed: {e}')
+
+    if pool and cloned:
+        object_pool.register_members(pool, [ repo['name'] for repo in cloned ])
+
+    if submodules:
+        for repo in cloned:
+            sh(['git','submodule','add',url(repo),repo['name']])
+
+    log(f'Done in {monotonic() - start:.1f}s: {len(cloned)} cloned, {len(fetched)} fetched, {len(failures)} failed')
+    if failures:
+        exit(1)
@@ -4,10 +4,15 @@
 Looks up gist ID from git config `assets.gist`, falling back to `pr.gist`
 (for ghpr interop). Creates a new secret gist if none is configured, and saves
 the ID to `assets.gist` for future uploads.
+
+Inputs are hashed up front and looked up in a local index (content hash →
+published URL); only new content is uploaded, in a single commit and push.
 """
 
+import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
 from subprocess import check_call, check_output, CalledProcessError, DEVNULL
@@ -66,17 +71,43 @@ def get_or_create_gist(gist_id=None, description="Asset uploads"):
     return gist_id
 
 
+def index_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'git-helpers', 'gist-assets.json')
+
+
+def load_index(path):
+    """Load `{gist_id: {"user": ..., "urls": {blob_oid: url}}}`."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, path)
+
+
 def main():
     import argparse
 
     parser = argparse.ArgumentParser(description='Upload files to a GitHub Gist and get permanent URLs')
-    parser.add_argument('files', nargs='+', help='Files to upload')
+    parser.add_argument('files', nargs='+', help='Files (or directories) to upload')
     parser.add_argument('-a', '--alt', help='Alt text for markdown/img format')
     parser.add_argument('-b', '--branch', default='assets', help='Branch name in gist (default: assets)')
     parser.add_argument('-f', '--format', choices=['url', 'markdown', 'img', 'auto'], default='auto',
                         help='Output format (default: auto - markdown for images, url for others)')
     parser.add_argument('-g', '--gist', help='Gist ID to use (creates new if not specified)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Parallelism for hashing inputs (default: number of CPUs)')
     parser.add_argument('--local', action='store_true', help='Already in a local clone of the gist')
+    parser.add_argument('-N', '--no-index', action='store_true',
+                        help="Don't consult the local content-hash → URL index (it's still updated)")
 
     args = parser.parse_args()
 
@@ -84,23 +115,56 @@ def main():
     if not gist_id:
         sys.exit(1)
 
-    files = [(path, Path(path).name) for path in args.files]
-
-    results = gist_upload.upload_files_to_gist(
-        files,
-        gist_id,
-        branch=args.branch,
-        is_local_clone=args.local,
-        commit_msg='Add assets',
-    )
-
-    for orig_name, safe_name, url in results:
-        output = gist_upload.format_output(orig_name, url, args.format, args.alt)
-        print(output)
+    missing = [ path for path in args.files if not Path(path).exists() ]
+    for path in missing:
+        err(f"Error: File not found: {path}")
+    if missing:
+        sys.exit(1)
 
-    if not results:
+    files = list(gist_upload.expand_files([ (path, Path(path).name) for path in args.files ]))
+    if not files:
+        err("Error: No files to upload")
         sys.exit(1)
 
+    # Hash everything up front; content already published to this gist is served from the local index
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        oids = list(executor.map(lambda f: gist_upload.blob_oid(f[0]), files))
+
+    path = index_path()
+    index = load_index(path)
+    entry = index.setdefault(gist_id, {'urls': {}})
+    known = {} if args.no_index else entry['urls']
+
+    urls = [ known.get(oid) for oid in oids ]
+    # Upload each new blob once, even if several inputs share it
+    pending = {}
+    for f, oid, url in zip(files, oids, urls):
+        if not url and oid not in pending:
+            pending[oid] = f
+    if urls.count(None) < len(urls):
+        err(f"# {len(urls) - urls.count(None)} of {len(urls)} files already uploaded (per {path})")
+
+    if pending:
+        user = entry.get('user') or gist_upload.get_github_username()
+        results = gist_upload.upload_files_to_gist(
+            list(pending.values()),
+            gist_id,
+            branch=args.branch,
+            is_local_clone=args.local,
+            commit_msg='Add assets',
+            user=user,
+        )
+        if not results:
+            sys.exit(1)
+        entry['user'] = user
+        for oid, (_, _, url) in zip(pending, results):
+            entry['urls'][oid] = url
+        save_index(path, index)
+        urls = [ entry['urls'][oid] for oid in oids ]
+
+    for (_, name), url in zip(files, urls):
+        print(gist_upload.format_output(name, url, args.format, args.alt))
+
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Shared library for uploading files to GitHub Gists."""
 
+import hashlib
 import sys
 import os
 import re
@@ -73,18 +74,85 @@ def create_gist(description="Image assets", content="# Image Assets\nThis gist s
     return None
 
 
-def upload_files_to_gist(files, gist_id, branch='assets', is_local_clone=False, commit_msg=None, verbose=True, remote_name=None):
+def expand_files(files):
+    """Expand `(source_path, target_name)` pairs, streaming directories' files (recursively) in sorted order.
+
+    Gists are flat, so files under a directory are named by their path relative to it, with `/`s replaced by `-`.
+    """
+    for source_path, target_name in files:
+        if os.path.isdir(source_path):
+            for dirpath, dirnames, filenames in os.walk(source_path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    yield path, os.path.relpath(path, source_path).replace(os.sep, '-')
+        elif Path(source_path).exists():
+            yield source_path, target_name
+        else:
+            err(f"Error: File not found: {source_path}")
+
+
+def blob_oid(path):
+    """Compute `path`'s git blob OID in-process (same as `git hash-object --no-filters`)."""
+    h = hashlib.sha1()
+    h.update(f'blob {os.path.getsize(path)}\0'.encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_objects(paths, git_dir=None):
+    """Write blobs for all `paths` with one `git hash-object -w --stdin-paths` process; returns their OIDs, in order."""
+    if not paths:
+        return []
+    cmd = ['git'] + (['--git-dir', git_dir] if git_dir else []) + ['hash-object', '-w', '--no-filters', '--stdin-paths']
+    stdin = ''.join(f'{os.path.abspath(path)}\n' for path in paths)
+    oids = check_output(cmd, input=stdin.encode()).decode().split()
+    assert len(oids) == len(paths), f"Expected {len(paths)} OIDs from hash-object, got {len(oids)}"
+    return oids
+
+
+def ls_tree(ref, git_dir=None):
+    """Return `{name: (mode, type, oid)}` for the top-level entries of `ref`."""
+    cmd = ['git'] + (['--git-dir', git_dir] if git_dir else []) + ['ls-tree', '-z', ref]
+    entries = {}
+    for line in check_output(cmd).decode().split('\0'):
+        if not line:
+            continue
+        meta, name = line.split('\t', 1)
+        mode, typ, oid = meta.split(' ')
+        entries[name] = (mode, typ, oid)
+    return entries
+
+
+def fetch_branch(remote, branch, git_dir=None, shallow=False):
+    """Fetch `branch` from `remote`; returns its commit SHA, or `None` if the branch doesn't exist remotely."""
+    git = ['git'] + (['--git-dir', git_dir] if git_dir else [])
+    # Blobs aren't needed to list and extend the tip's tree
+    args = ['--depth=1', '--filter=blob:none'] if shallow else []
+    if run(git + ['fetch', '--quiet', *args, remote, f'refs/heads/{branch}'], stdout=DEVNULL, stderr=DEVNULL).returncode:
+        return None
+    return check_output(git + ['rev-parse', 'FETCH_HEAD']).decode().strip()
+
+
+def upload_files_to_gist(files, gist_id, branch='assets', is_local_clone=False, commit_msg=None, verbose=True, remote_name=None, user=None):
     """
     Upload files to a gist branch.
 
+    All blobs are written by one `hash-object --stdin-paths` process. Files whose content already exists in the branch's
+    tree aren't re-committed: they get URLs pointing at the existing copy (under its existing name) immediately, and if
+    nothing is new, nothing is committed or pushed.
+
     Args:
-        files: List of (source_path, target_name) tuples
+        files: List of (source_path, target_name) tuples; directories are expanded recursively (see `expand_files`)
         gist_id: Gist ID to upload to
         branch: Branch name (default: 'assets')
         is_local_clone: True if we're already in a clone of this gist
         commit_msg: Custom commit message (optional)
         verbose: Print progress messages
         remote_name: Name of the remote (auto-detected if not provided)
+        user: GitHub username, for URLs (looked up via `gh api user` if not provided)
 
     Returns:
         List of (original_name, safe_name, url) tuples
@@ -94,182 +162,100 @@ def upload_files_to_gist(files, gist_id, branch='assets', is_local_clone=False,
         return []
 
     # Get GitHub username
-    user = get_github_username()
+    user = user or get_github_username()
     if not user:
         err("Error: Could not determine GitHub username")
         return []
 
-    # Prepare file mappings
-    file_mapping = []
-    for source_path, target_name in files:
-        if not Path(source_path).exists():
-            err(f"Error: File not found: {source_path}")
-            continue
-
-        # Keep original filename - Git handles special characters
-        file_mapping.append((source_path, target_name, target_name))
-
+    # Keep original filenames - Git handles special characters
+    file_mapping = list(expand_files(files))
     if not file_mapping:
         return []
 
-    results = []
-
-    if is_local_clone:
-        # We're already in the gist repo, create assets on a separate branch without changing HEAD
-        temp_dir = tempfile.mkdtemp(prefix='assets_')
-
-        # Get the remote name if not provided
-        if not remote_name:
-            remote_name = get_gist_remote_name(gist_id)
+    temp_dir = None
+    git_dir = None
+    try:
+        if is_local_clone:
+            # We're already in the gist repo; build the branch without touching HEAD, the index, or the worktree
+            remote = remote_name or get_gist_remote_name(gist_id)
             if verbose:
-                err(f"Using remote '{remote_name}'")
-
-        try:
-            # Copy files to temp directory with sanitized names
-            temp_files = []
-            for source_path, orig_name, safe_name in file_mapping:
-                temp_path = Path(temp_dir) / safe_name
-                shutil.copy2(source_path, temp_path)
-                temp_files.append((orig_name, safe_name, temp_path))
+                err(f"Using remote '{remote}'")
+        else:
+            # A scratch bare repo, with just the branch tip's commit and trees (no blobs), is all we need
+            temp_dir = tempfile.mkdtemp(prefix='gist_')
+            git_dir = temp_dir
+            check_call(['git', 'init', '--quiet', '--bare', temp_dir])
+            remote = f"git@gist.github.com:{gist_id}.git"
+        git = ['git'] + (['--git-dir', git_dir] if git_dir else [])
+
+        parent = fetch_branch(remote, branch, git_dir=git_dir, shallow=not is_local_clone)
+        if verbose:
+            err(f"Fetched existing branch '{branch}'" if parent else f"Creating new branch '{branch}'")
+        entries = ls_tree(parent, git_dir=git_dir) if parent else {}
+        existing_by_oid = {}
+        for name, (mode, typ, oid) in entries.items():
+            if typ == 'blob':
+                existing_by_oid.setdefault(oid, name)
+
+        oids = hash_objects([ source_path for source_path, _ in file_mapping ], git_dir=git_dir)
+
+        # `(orig_name, name, commit)`: `commit` is `None` for files in the new commit
+        placements = []
+        added = {}
+        for (source_path, target_name), oid in zip(file_mapping, oids):
+            current = entries.get(target_name)
+            if current and current[2] == oid:
+                placements.append((target_name, target_name, parent))
+            elif oid in existing_by_oid:
+                placements.append((target_name, existing_by_oid[oid], parent))
+            elif oid in added:
+                placements.append((target_name, added[oid], None))
+            else:
+                added[oid] = target_name
+                entries[target_name] = ('100644', 'blob', oid)
+                placements.append((target_name, target_name, None))
                 if verbose:
-                    err(f"Staged {orig_name}")
+                    err(f"Staged {target_name}")
 
-            # Check if branch exists on remote
-            try:
-                output = check_output(['git', 'ls-remote', '--heads', remote_name, branch], stderr=DEVNULL).decode().strip()
-                branch_exists = bool(output)  # Empty output means branch doesn't exist
-            except:
-                branch_exists = False
+        num_existing = sum(1 for *_, commit in placements if commit)
+        if verbose and num_existing:
+            err(f"{num_existing} of {len(placements)} files already in '{branch}'")
 
-            if branch_exists:
-                # Fetch the branch without checking it out
-                check_call(['git', 'fetch', remote_name, f'{branch}:{branch}'], stderr=DEVNULL)
-                if verbose:
-                    err(f"Fetched existing branch '{branch}'")
-                parent_ref = branch
-            else:
-                # Create orphan commit for new branch
-                if verbose:
-                    err(f"Creating new branch '{branch}'")
-                parent_ref = None
-
-            # Build tree with all files
-            tree_entries = []
-
-            # Get existing tree if we have a parent
-            if parent_ref:
-                try:
-                    existing_tree = check_output(['git', 'ls-tree', parent_ref], stderr=DEVNULL).decode()
-                    # Keep existing files that we're not replacing
-                    new_files = {safe_name for _, safe_name, _ in temp_files}
-                    for line in existing_tree.strip().split('\n'):
-                        if line:
-                            parts = line.split('\t', 1)
-                            if len(parts) == 2:
-                                filename = parts[1]
-                                if filename not in new_files:
-                                    tree_entries.append(line)
-                except:
-                    pass
-
-            # Add new/updated files
-            for orig_name, safe_name, temp_path in temp_files:
-                blob_hash = check_output(['git', 'hash-object', '-w', str(temp_path)]).decode().strip()
-                tree_entries.append(f'100644 blob {blob_hash}\t{safe_name}')
-
-            # Create tree
-            tree_input = '\n'.join(tree_entries) + '\n'
-            tree_hash = check_output(['git', 'mktree'], input=tree_input.encode()).decode().strip()
+        commit_hash = parent
+        if added:
+            tree_input = ''.join(f'{mode} {typ} {oid}\t{name}\0' for name, (mode, typ, oid) in entries.items())
+            # `--missing`: existing entries' blobs weren't fetched (`--filter=blob:none`), and needn't be present locally
+            tree_hash = check_output(git + ['mktree', '--missing', '-z'], input=tree_input.encode()).decode().strip()
 
             # Create commit
             if not commit_msg:
                 commit_msg = f'Add assets'
-            commit_cmd = ['git', 'commit-tree', tree_hash, '-m', commit_msg]
-            if parent_ref:
-                commit_cmd.extend(['-p', parent_ref])
+            commit_cmd = git + ['commit-tree', tree_hash, '-m', commit_msg]
+            if parent:
+                commit_cmd.extend(['-p', parent])
             commit_hash = check_output(commit_cmd).decode().strip()
 
-            # Update branch ref
-            check_call(['git', 'update-ref', f'refs/heads/{branch}', commit_hash])
+            if is_local_clone:
+                check_call(git + ['update-ref', f'refs/heads/{branch}', commit_hash])
 
             # Push the branch
-            run_quiet(['git', 'push', remote_name, f'{branch}:{branch}'])
+            run_quiet(git + ['push', '--quiet', remote, f'{commit_hash}:refs/heads/{branch}'])
             if verbose:
-                err(f"Pushed to branch '{branch}'")
-
-            # Build results - use commit SHA instead of branch name for gist URLs
-            for orig_name, safe_name, _ in temp_files:
-                # URL-encode the filename for the URL
-                encoded_name = quote(safe_name)
-                url = f"https://gist.githubusercontent.com/{user}/{gist_id}/raw/{commit_hash}/{encoded_name}"
-                results.append((orig_name, safe_name, url))
-                if verbose:
-                    err(f"Uploaded: {url}")
-
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-
-    else:
-        # Need to clone the gist
-        temp_dir = tempfile.mkdtemp(prefix='gist_')
-
-        try:
-            gist_url = f"git@gist.github.com:{gist_id}.git"
-            run_quiet(['git', 'clone', gist_url, temp_dir])
-
-            os.chdir(temp_dir)
-
-            # Detect the clone's remote name (respects clone.defaultRemoteName)
-            clone_remote = check_output(['git', 'remote']).decode().strip().split('\n')[0]
-
-            # Create or switch to branch
-            try:
-                run_quiet(['git', 'checkout', '-b', branch])
-                if verbose:
-                    err(f"Created branch '{branch}'")
-            except CalledProcessError:
-                try:
-                    run_quiet(['git', 'checkout', branch])
-                    if verbose:
-                        err(f"Using existing branch '{branch}'")
-                except CalledProcessError:
-                    if verbose:
-                        err(f"Warning: Could not checkout branch '{branch}', using main")
-                    branch = 'main'
-
-            # Copy and add files
-            for source_path, orig_name, safe_name in file_mapping:
-                shutil.copy2(source_path, safe_name)
-                check_call(['git', 'add', safe_name])
-                if verbose:
-                    err(f"Added {orig_name}")
-
-            # Commit and push
-            if not commit_msg:
-                commit_msg = f'Add assets'
-            run_quiet(['git', 'commit', '-m', commit_msg])
-            run_quiet(['git', 'push', clone_remote, branch])
-
-            # Get the commit hash for the URL
-            commit_hash = check_output(['git', 'rev-parse', 'HEAD']).decode().strip()
-
-            # Build results - use commit SHA instead of branch name for gist URLs
-            for _, orig_name, safe_name in file_mapping:
-                # URL-encode the filename for the URL
-                encoded_name = quote(safe_name)
-                url = f"https://gist.githubusercontent.com/{user}/{gist_id}/raw/{commit_hash}/{encoded_name}"
-                results.append((orig_name, safe_name, url))
-                if verbose:
-                    err(f"Uploaded: {url}")
-
-        finally:
-            # Clean up
-            original_dir = Path.cwd().parent if Path.cwd().name.startswith('gist_') else Path.cwd()
-            os.chdir(original_dir)
+                err(f"Pushed {len(added)} new files to branch '{branch}'")
+
+        # Build results - use commit SHA instead of branch name for gist URLs
+        results = []
+        for orig_name, name, commit in placements:
+            # URL-encode the filename for the URL
+            url = f"https://gist.githubusercontent.com/{user}/{gist_id}/raw/{commit or commit_hash}/{quote(name)}"
+            results.append((orig_name, name, url))
+            if verbose:
+                err(f"{'Uploaded' if commit is None else 'Exists'}: {url}")
+        return results
+    finally:
+        if temp_dir:
             shutil.rmtree(temp_dir, ignore_errors=True)
 
-    return results
-
 
 def format_output(filename, url, format_type='auto', alt_text=None):
     """
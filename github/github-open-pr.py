@@ -3,6 +3,7 @@
 # requires-python = ">=3.10"
 # dependencies = [
 #     "click",
+#     "requests",
 # ]
 # ///
 """Open PR associated with the current branch."""
@@ -10,7 +11,6 @@
 import os
 import sys
 import re
-import json
 from subprocess import check_output, CalledProcessError
 from sys import stderr
 
@@ -18,6 +18,7 @@ from sys import stderr
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from git_helpers.util.branch_resolution import resolve_remote_ref
+from git_helpers.util.github_prs import find_prs, pick_pr
 
 from click import command, option
 
@@ -53,8 +54,9 @@ def get_github_repo_from_remote(remote):
 @command()
 @option('-r', '--remote', help='Specify remote (default: auto-detect)')
 @option('-b', '--branch', help='Specify branch (default: current branch)')
+@option('-f', '--refresh', is_flag=True, help='Ignore cached PR lookups for this branch/SHA')
 @option('-n', '--dry-run', is_flag=True, help='Show what would be done without opening')
-def main(remote, branch, dry_run):
+def main(remote, branch, refresh, dry_run):
     """Open PR associated with the current branch."""
 
     # Get current branch name if not specified
@@ -89,88 +91,29 @@ def main(remote, branch, dry_run):
     # Extract branch name from remote ref
     branch_name = ref_name if ref_name else branch
 
-    # Search for PRs in multiple places:
-    # 1. In the fork repo (e.g., ryan-williams/parquet2json with head limit)
-    # 2. In upstream repos with head repo:branch (e.g., ryan-williams:limit)
-
-    repos_to_search = [repo]
+    # One GraphQL query covers the repo, its parent (if it's a fork), and PRs from either; cached per remote head SHA
+    head_sha = None
+    if remote_ref:
+        try:
+            head_sha = check_output(['git', 'rev-parse', remote_ref]).decode().strip()
+        except CalledProcessError:
+            pass
 
-    # Check if there's a parent/upstream repo
     try:
-        parent_data_raw = check_output([
-            'gh', 'repo', 'view', repo,
-            '--json', 'parent'
-        ]).decode()
-        parent_data = json.loads(parent_data_raw)
-        if parent_data.get('parent'):
-            parent_owner = parent_data['parent']['owner']['login']
-            parent_name = parent_data['parent']['name']
-            parent_repo = f"{parent_owner}/{parent_name}"
-            repos_to_search.append(parent_repo)
-            stderr.write(f"Detected parent repo: {parent_repo}\n")
+        result = find_prs(repo, branch_name, head_sha=head_sha, refresh=refresh)
     except Exception as e:
-        stderr.write(f"Warning: Could not check for parent repo: {e}\n")
+        stderr.write(f"Error looking up PRs: {e}\n")
+        sys.exit(1)
 
-    pr_data = []
-    for search_repo in repos_to_search:
-        stderr.write(f"Searching for PR in {search_repo} with branch {branch_name}...\n")
+    if result['parent']:
+        stderr.write(f"Detected parent repo: {result['parent']}\n")
 
-        try:
-            # Search with just branch name (for PRs within the same repo)
-            pr_data_raw = check_output([
-                'gh', 'pr', 'list',
-                '--repo', search_repo,
-                '--head', branch_name,
-                '--json', 'number,url,state',
-                '--limit', '100'
-            ]).decode()
-            prs = json.loads(pr_data_raw)
-            if prs:
-                pr_data.extend(prs)
-
-            # If searching parent/upstream, also try with repo:branch format
-            if search_repo != repo:
-                head_with_repo = f"{repo.split('/')[0]}:{branch_name}"
-                stderr.write(f"Searching for PR in {search_repo} with head {head_with_repo}...\n")
-                pr_data_raw = check_output([
-                    'gh', 'pr', 'list',
-                    '--repo', search_repo,
-                    '--head', head_with_repo,
-                    '--json', 'number,url,state',
-                    '--limit', '100'
-                ]).decode()
-                prs = json.loads(pr_data_raw)
-                if prs:
-                    pr_data.extend(prs)
-        except CalledProcessError as e:
-            stderr.write(f"Error running gh pr list: {e}\n")
-            continue
-        except json.JSONDecodeError as e:
-            stderr.write(f"Error parsing PR data: {e}\n")
-            continue
-
-    if not pr_data:
+    pr = pick_pr(result['prs'])
+    if not pr:
         stderr.write(f"No PR found for branch {branch_name}\n")
         stderr.write(f"Create one with: gh pr create --repo {repo}\n")
         sys.exit(1)
-
-    # Select the appropriate PR
-    if len(pr_data) == 1:
-        pr_url = pr_data[0]['url']
-    else:
-        # Multiple PRs - prefer open ones
-        stderr.write(f"Multiple PRs found for branch {branch_name}:\n")
-        open_prs = [pr for pr in pr_data if pr['state'] == 'OPEN']
-
-        for pr in pr_data:
-            stderr.write(f"  #{pr['number']} ({pr['state']}): {pr['url']}\n")
-
-        if open_prs:
-            pr_url = open_prs[0]['url']
-            stderr.write(f"Using first open PR: #{open_prs[0]['number']}\n")
-        else:
-            pr_url = pr_data[0]['url']
-            stderr.write(f"Using first PR: #{pr_data[0]['number']}\n")
+    pr_url = pr['url']
 
     # Open the PR
     if dry_run:
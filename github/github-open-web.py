@@ -3,6 +3,7 @@
 # requires-python = ">=3.10"
 # dependencies = [
 #     "click",
+#     "requests",
 # ]
 # ///
 """Open GitHub repository or gist in web browser."""
@@ -11,12 +12,14 @@ import json
 import os
 import re
 import sys
+import webbrowser
 from subprocess import check_output, check_call, CalledProcessError, DEVNULL
 from sys import stderr
 
 # Add parent directory to path to import util modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from git_helpers.util.branch_resolution import resolve_remote_ref, get_default_branch
+from git_helpers.util.github_prs import find_prs, pick_pr
 
 import click
 
@@ -88,15 +91,43 @@ def parse_ref_arg(ref_arg):
         return None, ref_arg
 
 
+def open_pr(repo, branch, remote, refresh=False):
+    """Open the PR for `branch`, via a single GraphQL lookup, cached per SHA of `<remote>/<branch>` (the branch actually
+    looked up; uncached if there's no such remote-tracking ref)."""
+    if not repo:
+        stderr.write("Error: Could not determine GitHub repo for PR lookup\n")
+        exit(1)
+    if not branch:
+        branch = check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD']).decode().strip()
+    head_sha = None
+    if remote:
+        try:
+            head_sha = check_output(
+                ['git', 'rev-parse', '--verify', '-q', f'refs/remotes/{remote}/{branch}'],
+                stderr=DEVNULL,
+            ).decode().strip() or None
+        except CalledProcessError:
+            pass
+    result = find_prs(repo, branch, head_sha=head_sha, refresh=refresh)
+    pr = pick_pr(result['prs'])
+    if not pr:
+        stderr.write(f"No PR found for branch {branch}\n")
+        exit(1)
+    stderr.write(f"Opening: {pr['url']}\n")
+    webbrowser.open(pr['url'])
+
+
 @click.command('github-open-web')
 @click.option('-b', '--branch', help='Branch to open (defaults to current branch)')
 @click.option('-d', '--default', is_flag=True, help='Open default branch')
 @click.option('-r', '--remote', help='Git remote name to use (e.g. origin, upstream)')
 @click.option('-R', '--repo', help='Repository (owner/name format) or gist ID')
 @click.option('-g', '--gist', is_flag=True, help='Force gist mode')
+@click.option('-p', '--pr', is_flag=True, help="Open the branch's PR (in the repo or its parent), instead of the branch")
+@click.option('-f', '--refresh', is_flag=True, help='With -p/--pr, ignore cached PR lookups for this branch/SHA')
 @click.argument('ref_arg', required=False)
 @click.argument('branch_arg', required=False)
-def github_open_web(branch, default, remote, repo, gist, ref_arg, branch_arg):
+def github_open_web(branch, default, remote, repo, gist, pr, refresh, ref_arg, branch_arg):
     """Open GitHub repository or gist in web browser.
 
     REF_ARG: Optional remote name, branch name, or remote/branch (e.g. 'origin', 'main', 'origin/main')
@@ -196,6 +227,10 @@ def github_open_web(branch, default, remote, repo, gist, ref_arg, branch_arg):
                 stderr.write(f"Error: Remote '{effective_remote}' not found\n")
                 exit(1)
 
+        if pr:
+            open_pr(repo, branch or resolved_ref, effective_remote, refresh)
+            return
+
         # Build command with repository as positional argument
         if repo:
             cmd = ['gh', 'repo', 'view', repo, '--web']
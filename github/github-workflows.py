@@ -4,19 +4,23 @@
 # dependencies = [
 #     "click",
 #     "pyyaml",
+#     "requests",
 #     "utz",
 # ]
 # ///
-from datetime import timezone, datetime
-from os.path import basename, splitext, abspath, dirname
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone, datetime, timedelta
+import json
+from os.path import basename, splitext, abspath, dirname, exists
 from pathlib import Path
 import re
-import shlex
 import sys
 import time
+from uuid import uuid4
 import yaml
 
 from click import group, pass_context
+from requests import RequestException
 from utz import proc, err
 from utz.cli import flag, opt, arg
 
@@ -24,6 +28,7 @@ from utz.cli import flag, opt, arg
 sys.path.insert(0, dirname(dirname(abspath(__file__))))
 
 from git_helpers.util.branch_resolution import resolve_remote_ref
+from git_helpers.util.github_api import GitHubSession, backoff
 
 SSH_REMOTE_URL_RGX = re.compile(r'git@github\.com:(?P<repo>[^/]+/[^/]+?)(?:\.git)?')
 HTTPS_REMOTE_URL_RGX = re.compile(r'https://github\.com/(?P<repo>[^/]+/[^/]+?)(?:\.git)?')
@@ -90,11 +95,6 @@ def github_workflows_list(ctx):
         print(workflow_name)
 
 
-def get_runs(repo, workflow):
-    runs = proc.json('gh', 'run', 'list', '-R', repo, '-w', workflow, '--json', 'databaseId', log=None)
-    return [ run['databaseId'] for run in runs ]
-
-
 @github_workflows.command('runs')
 @pass_context
 @arg('workflow')
@@ -103,32 +103,277 @@ def github_workflows_runs(ctx, workflow):
     proc.run('gh', 'run', 'list', '-R', repo, '-w', workflow)
 
 
+AGE_RGX = re.compile(r'(?P<n>\d+)(?P<unit>[smhdw])')
+AGE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_cutoff(age):
+    """Parse an age (e.g. `30d`, `12h`, `2w`) or ISO date/datetime into a UTC cutoff datetime."""
+    m = AGE_RGX.fullmatch(age)
+    if m:
+        return datetime.now(timezone.utc) - timedelta(**{AGE_UNITS[m['unit']]: int(m['n'])})
+    cutoff = datetime.fromisoformat(age)
+    if not cutoff.tzinfo:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+    return cutoff
+
+
+# GitHub returns at most this many runs for a query using the `created`, `branch`, or `status` filters
+FILTERED_RESULTS_CAP = 1000
+
+
+def list_runs(gh, repo, workflow, statuses=(), branch=None, cutoff=None):
+    """Yield IDs of all of a workflow's runs (across all pages) matching the given filters.
+
+    A single status is filtered server-side; multiple are matched client-side against `status` or `conclusion`.
+    Filtered queries are capped at 1000 results, so they're paged through sliding `created` windows: runs come back
+    newest first, and each window asks for runs created at or before the oldest one seen so far, until a window comes
+    back short.
+    """
+    params = {}
+    if len(statuses) == 1:
+        params['status'] = statuses[0]
+    if branch:
+        params['branch'] = branch
+    created = f'<{cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")}' if cutoff else None
+    seen = set()
+    while True:
+        window = { **params, 'created': created } if created else params
+        num = new = 0
+        oldest = None
+        for run in gh.paginate(f'repos/{repo}/actions/workflows/{workflow}/runs', params=window, key='workflow_runs'):
+            num += 1
+            oldest = run['created_at']
+            # Windows overlap at their boundary timestamp
+            if run['id'] in seen:
+                continue
+            seen.add(run['id'])
+            new += 1
+            if len(statuses) > 1 and run['status'] not in statuses and run['conclusion'] not in statuses:
+                continue
+            yield run['id']
+        if not window or num < FILTERED_RESULTS_CAP:
+            return
+        if not new:
+            err(f"Warning: over {FILTERED_RESULTS_CAP} runs created at {oldest}; some may not have been listed")
+            return
+        created = f'<={oldest}'
+
+
+def load_checkpoint(path):
+    """Read a JSONL checkpoint; returns `(pending, filters, done)`, where `pending` (and `filters`, the listing's
+    arguments) are `None` if no listing was recorded."""
+    pending, filters, done = None, None, set()
+    if not path or not exists(path):
+        return pending, filters, done
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'pending' in entry:
+                pending = entry['pending']
+                filters = entry.get('filters')
+            elif 'done' in entry:
+                done.add(entry['done'])
+    return pending, filters, done
+
+
 @github_workflows.command('delete')
 @pass_context
+@opt('-a', '--older-than', help='Only delete runs created before this age (e.g. `30d`, `12h`, `2w`) or ISO date')
+@opt('-b', '--branch', help='Only delete runs from this branch')
+@opt('-C', '--checkpoint', help='JSONL file recording the run listing and completed deletions; re-running with the same file resumes where a previous invocation stopped')
+@opt('-j', '--jobs', type=int, default=8, help='Max concurrent DELETE requests (default: 8)')
 @flag('-n', '--dry-run')
+@opt('-s', '--status', help='Comma-delimited run statuses/conclusions to delete (e.g. `failure,cancelled`)')
+@flag('-v', '--verbose', help='Log API retries')
 @arg('workflow')
-def github_workflows_delete(ctx, dry_run, workflow):
+def github_workflows_delete(ctx, older_than, branch, checkpoint, jobs, dry_run, status, verbose, workflow):
+    """Delete all of a workflow's runs (optionally filtered by age/status/branch), concurrently."""
     repo = ctx.obj
-    run_ids = get_runs(repo, workflow)
-    for run_id in run_ids:
-        cmd = ['gh', 'api', '-X', 'DELETE', f'/repos/{repo}/actions/runs/{run_id}']
-        if dry_run:
-            err(f"DRY RUN: {shlex.join(cmd)}")
-        else:
-            err(shlex.join(cmd))
-            proc.run(*cmd, log=None)
+    gh = GitHubSession(pool_size=jobs, verbose=verbose)
+    statuses = status.split(',') if status else []
+    cutoff = parse_cutoff(older_than) if older_than else None
+
+    # Recorded with the listing, so a resumed run can't apply one invocation's listing to another's filters
+    filters = {'repo': repo, 'workflow': workflow, 'older_than': older_than, 'branch': branch, 'statuses': statuses}
+    pending, recorded, done = load_checkpoint(checkpoint)
+    if pending is None:
+        start = time.monotonic()
+        pending = list(list_runs(gh, repo, workflow, statuses=statuses, branch=branch, cutoff=cutoff))
+        err(f"Listed {len(pending)} runs in {time.monotonic() - start:.1f}s")
+        if checkpoint and not dry_run:
+            with open(checkpoint, 'a') as f:
+                f.write(json.dumps({'pending': pending, 'filters': filters}) + '\n')
+    elif recorded != filters:
+        err(f"Error: {checkpoint} was recorded with different arguments ({recorded}); pass the same ones, or a new checkpoint file")
+        exit(1)
+    else:
+        err(f"Resuming from {checkpoint}: {len(done)} of {len(pending)} runs already deleted")
+
+    run_ids = [ run_id for run_id in pending if run_id not in done ]
+    if dry_run:
+        for run_id in run_ids:
+            err(f"DRY RUN: DELETE /repos/{repo}/actions/runs/{run_id}")
+        return
+
+    checkpoint_file = open(checkpoint, 'a') if checkpoint else None
+    failures = []
+    num_done = 0
+    start = time.monotonic()
+
+    def delete(run_id):
+        # Errors are per-run, so one connection failure doesn't abort the whole batch
+        try:
+            return run_id, gh.delete(f'repos/{repo}/actions/runs/{run_id}'), None
+        except RequestException as e:
+            return run_id, None, e
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for run_id, resp, exc in executor.map(delete, run_ids):
+                if exc:
+                    failures.append(run_id)
+                    err(f"Failed to delete run {run_id}: {exc}")
+                # 404: already deleted (e.g. by a previous, interrupted invocation)
+                elif resp.status_code in (204, 404):
+                    num_done += 1
+                    if checkpoint_file:
+                        checkpoint_file.write(json.dumps({'done': run_id}) + '\n')
+                        checkpoint_file.flush()
+                    if verbose or num_done % 100 == 0:
+                        elapsed = time.monotonic() - start
+                        err(f"Deleted {num_done}/{len(run_ids)} runs ({num_done / elapsed:.1f}/s)")
+                else:
+                    failures.append(run_id)
+                    err(f"Failed to delete run {run_id}: {resp.status_code} {resp.text}")
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    err(f"Deleted {num_done} runs in {time.monotonic() - start:.1f}s")
+    if failures:
+        err(f"{len(failures)} deletions failed; re-run to retry them")
+        exit(1)
+
+
+def parse_inputs(field, raw_field):
+    """Build `workflow_dispatch` inputs from `-F`/`-f` `key=value` args (`-F` values may be `@<path>`, like `gh`)."""
+    inputs = {}
+    for f in field:
+        k, v = f.split('=', 1)
+        if v.startswith('@'):
+            with open(v[1:], 'r') as fd:
+                v = fd.read()
+        inputs[k] = v
+    for f in raw_field:
+        k, v = f.split('=', 1)
+        inputs[k] = v
+    return inputs
+
+
+def find_dispatched_run(gh, repo, workflow_id, ref, trigger_time, correlation_id=None, timeout=60):
+    """Poll (with backoff and ETag-conditional requests) for the run created by a dispatch.
+
+    If `correlation_id` is set, it must appear in the run's `display_title` (i.e. the workflow's `run-name` includes
+    the corresponding input); otherwise the earliest `workflow_dispatch` run on `ref` created since `trigger_time` wins.
+    """
+    params = {
+        'event': 'workflow_dispatch',
+        'created': f'>={trigger_time.strftime("%Y-%m-%dT%H:%M:%SZ")}',
+        'per_page': 20,
+    }
+    if ref:
+        params['branch'] = ref
+    for _ in backoff(timeout=timeout, initial=1, max_delay=8):
+        err(".", end="", flush=True)
+        try:
+            data, changed = gh.get_cached(f'repos/{repo}/actions/workflows/{workflow_id}/runs', params=params)
+        except Exception as e:
+            err(f"\nWarning: Failed to check runs: {e}")
+            continue
+        if not changed:
+            continue
+        runs = data['workflow_runs']
+        if correlation_id:
+            runs = [ run for run in runs if correlation_id in (run.get('display_title') or '') ]
+        if runs:
+            return min(runs, key=lambda run: run['created_at'])
+    return None
+
+
+def wait_for_jobs(gh, repo, run_id, timeout=60):
+    """Poll a run's jobs (with backoff and ETag-conditional requests) until at least one exists."""
+    for _ in backoff(timeout=timeout, initial=1, max_delay=5):
+        err(".", end="", flush=True)
+        try:
+            data, changed = gh.get_cached(f'repos/{repo}/actions/runs/{run_id}/jobs', params={'filter': 'latest'})
+        except Exception:
+            continue
+        if data['jobs']:
+            return data['jobs']
+    return []
+
+
+def state(obj):
+    """`status`, or `conclusion` once completed."""
+    if obj['status'] == 'completed':
+        return obj.get('conclusion') or obj['status']
+    return obj['status']
+
+
+def follow_run(gh, repo, run_id, logs=True, max_delay=15):
+    """Stream job/step status transitions (and each job's log, once it completes) until the run completes.
+
+    Returns the run's `conclusion`.
+    """
+    seen = {}
+    delay = 1
+    while True:
+        run, run_changed = gh.get_cached(f'repos/{repo}/actions/runs/{run_id}')
+        jobs, jobs_changed = gh.get_cached(f'repos/{repo}/actions/runs/{run_id}/jobs', params={'filter': 'latest'})
+        for job in jobs['jobs']:
+            job_state = state(job)
+            if seen.get(job['id']) != job_state:
+                seen[job['id']] = job_state
+                err(f"[{job['name']}] {job_state}")
+                if job['status'] == 'completed' and logs:
+                    resp = gh.request('GET', f'repos/{repo}/actions/jobs/{job["id"]}/logs')
+                    if resp.ok:
+                        sys.stdout.write(resp.text)
+                        sys.stdout.flush()
+                    else:
+                        err(f"[{job['name']}] Failed to fetch logs: {resp.status_code}")
+            for step in job.get('steps') or []:
+                key = (job['id'], step['number'])
+                step_state = state(step)
+                if seen.get(key) != step_state:
+                    seen[key] = step_state
+                    err(f"[{job['name']}] {step['number']}. {step['name']}: {step_state}")
+        if run['status'] == 'completed':
+            err(f"Run {run_id} {run['conclusion']}: {run['html_url']}")
+            return run['conclusion']
+        # Back off while nothing changes; snap back to fast polling on any update
+        delay = 1 if (run_changed or jobs_changed) else min(delay * 2, max_delay)
+        time.sleep(delay)
 
 
 @github_workflows.command('run')
 @pass_context
+@opt('-c', '--correlation-input', help="Workflow input to set to a unique ID, for matching the dispatched run by `display_title` (the workflow's `run-name` must include it); only needed when the dispatch API doesn't return the run ID")
+@opt('-F', '--field', multiple=True, help='Add an input in key=value format (`@<path>` reads the value from a file)')
+@opt('-f', '--raw-field', multiple=True, help='Add an input with a raw string value')
+@flag('-L', '--no-logs', help='With -t/--follow, only stream job/step status, not job logs')
 @flag('-O', '--no-open', help='Do not automatically open the job in browser')
 @opt('-r', '--ref', help='Git reference (branch, tag, or SHA) to run workflow from')
-@opt('-F', '--field', multiple=True, help='Add a field with a JSON value')
-@opt('-f', '--raw-field', multiple=True, help='Add a field with a raw string value')
+@flag('-t', '--follow', help='Stream job/step status (and job logs) until the run completes; exit non-zero unless it succeeds')
+@opt('-T', '--timeout', type=int, default=60, help='Seconds to wait for the run (and its first job) to appear')
+@flag('-v', '--verbose', help='Log API retries')
 @arg('workflow')
 @arg('args', nargs=-1)
-def github_workflows_run(ctx, no_open, ref, field, raw_field, workflow, args):
-    """Trigger a workflow and optionally open the job when it starts."""
+def github_workflows_run(ctx, correlation_input, field, raw_field, no_logs, no_open, ref, follow, timeout, verbose, workflow, args):
+    """Trigger a workflow and optionally open (or follow) the job when it starts."""
     repo = ctx.obj
 
     # Handle workflow name (remove .yml extension if present)
@@ -188,165 +433,101 @@ def github_workflows_run(ctx, no_open, ref, field, raw_field, workflow, args):
     except Exception as e:
         err(f"Warning: Failed to parse workflow file: {e}")
 
-    # If we couldn't get the name from the file, try to get it from gh workflow list
-    if not workflow_name:
-        try:
-            # List all workflows to find the one matching our filename
-            workflows = proc.json('gh', 'workflow', 'list', '--json', 'name,path', log=None)
-            for wf in workflows:
-                if basename(wf['path']) == basename(workflow_path):
-                    workflow_name = wf['name']
-                    err(f"Workflow name: '{workflow_name}' (from gh workflow list)")
-                    break
-        except Exception as e:
-            err(f"Warning: Failed to get workflow name from gh: {e}")
-
-    # Final fallback
-    if not workflow_name:
-        workflow_name = workflow_filename
-        err(f"Warning: Using filename as workflow name: {workflow_name}")
-
-    # If no ref specified, try to match current local ref with remote
-    if not ref:
-        ref, _ = resolve_remote_ref(verbose=True)
-
-    # Get timestamp before triggering (more reliable than checking existing runs)
-    trigger_time = datetime.now(timezone.utc)
+    # One pooled session for the dispatch and all subsequent polling
+    gh = GitHubSession(verbose=verbose)
+    workflow_file = basename(workflow_path)
 
-    # Get workflow ID for more reliable matching
+    # Get workflow ID (and name, if the file didn't have one) for more reliable matching
     workflow_id = None
     try:
-        workflows_data = proc.json('gh', 'api', f'/repos/{repo}/actions/workflows', log=None)
-        workflows = workflows_data['workflows']
-        for wf in workflows:
-            if basename(wf['path']) == basename(workflow_path):
+        for wf in gh.paginate(f'repos/{repo}/actions/workflows', key='workflows'):
+            if basename(wf['path']) == workflow_file:
                 workflow_id = wf['id']
+                if not workflow_name:
+                    workflow_name = wf['name']
+                    err(f"Workflow name: '{workflow_name}' (from GitHub API)")
                 err(f"Workflow ID: {workflow_id} (name: '{workflow_name}')")
                 break
     except Exception as e:
         err(f"Warning: Could not get workflow ID: {e}")
 
-    # Build command with options
-    workflow_file = basename(workflow_path)
-    cmd = ['gh', 'workflow', 'run', workflow_file]
-
-    # Add ref if specified
-    if ref:
-        cmd.extend(['--ref', ref])
-
-    # Add field options
-    for f in field:
-        cmd.extend(['-F', f])
-    for f in raw_field:
-        cmd.extend(['-f', f])
+    # Final fallback
+    if not workflow_name:
+        workflow_name = workflow_filename
+        err(f"Warning: Using filename as workflow name: {workflow_name}")
 
-    # Add any remaining args
-    cmd.extend(list(args))
+    # If no ref specified, try to match current local ref with remote
+    if not ref:
+        ref, _ = resolve_remote_ref(verbose=True)
 
-    proc.run(cmd)
+    inputs = parse_inputs(field, raw_field)
+    correlation_id = None
+    if correlation_input:
+        correlation_id = uuid4().hex
+        inputs[correlation_input] = correlation_id
 
-    if no_open:
+    # Get timestamp before triggering (more reliable than checking existing runs)
+    trigger_time = datetime.now(timezone.utc).replace(microsecond=0)
+
+    run = None
+    if args:
+        # Extra `gh workflow run` args can't be expressed via the API; dispatch via `gh`, then correlate by polling
+        cmd = ['gh', 'workflow', 'run', workflow_file, '-R', repo]
+        if ref:
+            cmd.extend(['--ref', ref])
+        for k, v in inputs.items():
+            cmd.extend(['-f', f'{k}={v}'])
+        cmd.extend(list(args))
+        proc.run(cmd)
+    else:
+        if not ref:
+            ref = gh.get(f'repos/{repo}')['default_branch']
+        body = {'ref': ref, 'inputs': inputs, 'return_run_details': True}
+        err(f"Dispatching {workflow_file} on {ref}" + (f" with inputs {inputs}" if inputs else ""))
+        resp = gh.post(f'repos/{repo}/actions/workflows/{workflow_id or workflow_file}/dispatches', json=body)
+        if not resp.ok:
+            err(f"Error: Failed to dispatch workflow: {resp.status_code} {resp.text}")
+            exit(1)
+        if resp.status_code == 200 and resp.content:
+            details = resp.json()
+            run_id = details.get('workflow_run_id')
+            if run_id:
+                run = {'id': run_id, 'html_url': details.get('html_url')}
+                err(f"Dispatched workflow run: {run_id}")
+
+    if no_open and not follow:
         return
 
-    # Poll for new workflow run
-    err("Waiting for workflow to start", end="")
-    new_run_id = None
-    for attempt in range(30):
-        time.sleep(2)
-        err(".", end="", flush=True)
-        try:
-            # Get runs for this specific workflow file
-            if workflow_id:
-                # Use workflow ID if we have it (most reliable)
-                runs = proc.json(
-                    'gh', 'api', f'/repos/{repo}/actions/workflows/{workflow_id}/runs',
-                    '-q', '.workflow_runs[:10]'
-                )
-            else:
-                # Fallback to listing by workflow file
-                runs = proc.json(
-                    'gh', 'run', 'list',
-                    '-w', basename(workflow_path),
-                    '-L', '10',
-                    '--json', 'databaseId,workflowName,status,headBranch,createdAt,event'
-                )
-
-            # Look for a run created after we triggered it
-            for run in runs:
-                # Parse creation time
-                created_at = run.get('created_at') or run.get('createdAt')
-                if not created_at:
-                    continue
-
-                run_time = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-
-                # Check if this run was created after we triggered
-                if run_time < trigger_time:
-                    continue
-
-                # Check branch if specified
-                run_branch = run.get('head_branch') or run.get('headBranch')
-                if ref and run_branch != ref:
-                    continue
-
-                # Check if it's a workflow_dispatch event (what we triggered)
-                if run.get('event') == 'workflow_dispatch' or attempt > 10:
-                    new_run_id = run.get('id') or run.get('databaseId')
-                    err()
-                    err(f"Found new workflow run: {new_run_id} (branch: {run_branch}, created: {created_at})")
-                    break
-
-            if new_run_id:
-                break
-
-        except Exception as e:
-            if attempt == 0:
-                err(f"\nWarning: Failed to check runs: {e}")
-            pass
-
-    if not new_run_id:
-        err("\nTimed out waiting for workflow to start")
-        exit(1)
-
-    # Poll for job to start
-    err("Waiting for job to start", end="")
-    job_started = False
-    for attempt in range(30):
-        time.sleep(1)
-        err(".", end="", flush=True)
-        try:
-            jobs = proc.json(
-                'gh', 'run', 'view', str(new_run_id),
-                '--json', 'jobs'
-            ).get('jobs', [])
-            if len(jobs) > 0:
-                job_started = True
-                break
-        except:
-            pass
-
-    err()
+    if not run:
+        if not workflow_id:
+            err("Error: Can't find the dispatched run without a workflow ID")
+            exit(1)
+        err("Waiting for workflow to start", end="")
+        run = find_dispatched_run(gh, repo, workflow_id, ref, trigger_time, correlation_id=correlation_id, timeout=timeout)
+        err()
+        if not run:
+            err("Timed out waiting for workflow to start")
+            exit(1)
+        err(f"Found new workflow run: {run['id']} (branch: {run.get('head_branch')}, created: {run.get('created_at')})")
+
+    run_id = run['id']
+    run_url = run.get('html_url') or f'https://github.com/{repo}/actions/runs/{run_id}'
+
+    if not no_open:
+        err("Waiting for job to start", end="")
+        jobs = wait_for_jobs(gh, repo, run_id, timeout=timeout)
+        err()
+        if jobs:
+            err("Job started, opening...")
+            proc.run('open', jobs[-1]['html_url'])  # Open the last (most recent) job
+        else:
+            err("Job didn't start in time, opening workflow run instead...")
+            proc.run('open', run_url)
 
-    if job_started:
-        err("Job started, opening...")
-        # Get the job URL and open it
-        try:
-            data = proc.json(
-                'gh', 'run', 'view', str(new_run_id),
-                '--json', 'databaseId,jobs'
-            )
-            if data['jobs']:
-                job_url = data['jobs'][-1]['url']  # Get the last (most recent) job
-                proc.run('open', job_url)
-            else:
-                raise Exception("No jobs found")
-        except Exception as e:
-            err(f"Failed to open job: {e}")
-            # Fallback to opening the run
-            proc.run('gh', 'run', 'view', '--web', new_run_id)
-    else:
-        err("Job didn't start in time, opening workflow run instead...")
-        proc.run('gh', 'run', 'view', '--web', new_run_id)
+    if follow:
+        conclusion = follow_run(gh, repo, run_id, logs=not no_logs)
+        if conclusion != 'success':
+            exit(1)
 
 
 if __name__ == '__main__':
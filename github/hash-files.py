@@ -1,17 +1,275 @@
 #!/usr/bin/env python
 # Standalone script that mimics GitHub Actions' hashFiles helper
 # See also: https://gist.github.com/ryan-williams/2e616363c68072bf67cad675fcb18f3b
+#
+# Like `hashFiles(...)`, each argument is a glob pattern relative to the current directory (the "workspace"):
+# `*`/`?`/`[…]` match within a path segment, `**` matches any number of segments, dotfiles match, a pattern matching a
+# directory matches everything under it, and `!`-prefixed patterns exclude (later patterns override earlier ones).
+# The output is the sha256 of the concatenated per-file sha256 digests, in the order GitHub's globber visits files
+# (each include pattern's search path in pattern order, skipping any under another's; within each, depth-first, with
+# each directory's entries sorted by name), or an empty line if nothing matched; e.g. `hash-files b a` hashes `b`
+# then `a`.
+#
+# Candidate files come from the git index (plus untracked, non-ignored files) rather than a filesystem walk (pass
+# `-W/--walk` to walk the filesystem instead). Note that this skips gitignored files, which GitHub's `hashFiles` does
+# hash (e.g. a `*.lock` or build output present in the workspace) unless they're named literally; use `-W` to match
+# GitHub exactly in such cases. Files are hashed in parallel via `mmap`, and per-file digests are cached by (path,
+# size, mtime, inode), so unchanged files aren't re-read.
 import hashlib
+import json
+import mmap
+import os
+import re
 import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import check_output, CalledProcessError, DEVNULL
 
 
-sha256 = hashlib.sha256()
+GLOB_CHARS = re.compile(r'[*?\[]')
+BUF_SIZE = 1 << 20
+# Files modified this recently may change again within the filesystem's mtime granularity; don't cache their digests
+RACY_SECS = 2
 
-for path in sys.argv[1:]:
-    file_sha256 = hashlib.sha256()
-    with open(path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            file_sha256.update(byte_block)
-    sha256.update(file_sha256.digest())
 
-print(sha256.hexdigest())
+def translate(pattern):
+    """Convert a `hashFiles` glob (relative, '/'-separated) to a regex that also matches descendants of matched dirs."""
+    rgx = ''
+    segments = pattern.split('/')
+    for idx, segment in enumerate(segments):
+        last = idx == len(segments) - 1
+        if segment == '**':
+            rgx += '.*' if last else '(?:.*/)?'
+            continue
+        i = 0
+        while i < len(segment):
+            c = segment[i]
+            if c == '*':
+                rgx += '[^/]*'
+            elif c == '?':
+                rgx += '[^/]'
+            elif c == '[':
+                negated = segment[i + 1:i + 2] in ('!', '^')
+                start = i + 2 if negated else i + 1
+                end = segment.find(']', start)
+                if end <= start:
+                    # Unterminated or empty (`[]`, `[!]`): a literal `[`
+                    rgx += re.escape(c)
+                else:
+                    cls = segment[start:end].replace('\\', '\\\\').replace('[', '\\[')
+                    # A negated class still never matches across segments
+                    rgx += f'[^/{cls}]' if negated else f'[{cls}]'
+                    i = end
+            else:
+                rgx += re.escape(c)
+            i += 1
+        if not last:
+            rgx += '/'
+    return re.compile(f'{rgx}(?:/.*)?', re.S)
+
+
+def search_root(rel):
+    """The literal directory prefix of a pattern (or the whole pattern, if it has no glob chars); `''` is the root."""
+    segments = rel.split('/')
+    for idx, segment in enumerate(segments):
+        if GLOB_CHARS.search(segment):
+            return '/'.join(segments[:idx])
+    return rel
+
+
+def parse_patterns(args, root):
+    """Return `[(negate, literal_path, search_root, regex)]`, with patterns made relative to `root`.
+
+    Patterns resolving outside `root` are dropped, as GitHub ignores files outside the workspace.
+    """
+    patterns = []
+    for arg in args:
+        for pattern in arg.split('\n'):
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negate = False
+            while pattern.startswith('!'):
+                negate = not negate
+                pattern = pattern[1:]
+            path = os.path.normpath(os.path.join(root, pattern))
+            if path != root and not path.startswith(root + os.sep):
+                sys.stderr.write(f'Skipping pattern outside {root}: {pattern}\n')
+                continue
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            if rel == '.':
+                rel = '**'
+            literal = None if GLOB_CHARS.search(rel) else rel
+            patterns.append((negate, literal, search_root(rel), translate(rel)))
+    return patterns
+
+
+def matches(path, patterns):
+    matched = False
+    for negate, _, _, rgx in patterns:
+        if rgx.fullmatch(path):
+            matched = not negate
+    return matched
+
+
+def candidate_files(root, walk=False):
+    """Relative paths of files under `root`: from the git index (plus untracked, non-ignored files), or a walk."""
+    if not walk:
+        try:
+            out = check_output(
+                ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--deduplicate'],
+                cwd=root,
+                stderr=DEVNULL,
+            )
+            return [ path for path in out.decode().split('\0') if path ]
+        except (CalledProcessError, FileNotFoundError):
+            pass
+    paths = []
+    for dirpath, _, filenames in os.walk(root, followlinks=True):
+        rel_dir = os.path.relpath(dirpath, root)
+        for filename in filenames:
+            path = filename if rel_dir == '.' else os.path.join(rel_dir, filename)
+            paths.append(path.replace(os.sep, '/'))
+    return paths
+
+
+def under(path, root):
+    return not root or path == root or path.startswith(f'{root}/')
+
+
+def search_roots(patterns):
+    """Include patterns' search roots, in pattern order, minus duplicates and any under another (like GitHub's)."""
+    roots = [ root for negate, _, root, _ in patterns if not negate ]
+    return [
+        root for idx, root in enumerate(roots)
+        if root not in roots[:idx] and not any(under(root, other) for other in roots if other != root)
+    ]
+
+
+def visit_order(path):
+    """Sort key within a search root, like GitHub's globber: depth-first, each directory's entries sorted by name."""
+    return path.split('/')
+
+
+def walk_order(path, roots):
+    """Sort key across search roots: the (first) root containing `path`, then `visit_order` within it."""
+    idx = next((idx for idx, root in enumerate(roots) if under(path, root)), len(roots))
+    return idx, visit_order(path)
+
+
+def cache_path():
+    try:
+        git_dir = check_output(['git', 'rev-parse', '--absolute-git-dir'], stderr=DEVNULL).decode().strip()
+        return os.path.join(git_dir, 'git-helpers', 'hash-files.json')
+    except (CalledProcessError, FileNotFoundError):
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache_home, 'git-helpers', 'hash-files.json')
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def hash_file(path, size):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if size:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    h.update(m)
+                return h.digest()
+            except (OSError, ValueError):
+                # Not mmap-able (e.g. a pipe or special file); fall back to large buffered reads
+                f.seek(0)
+        for block in iter(lambda: f.read(BUF_SIZE), b''):
+            h.update(block)
+    return h.digest()
+
+
+def main():
+    parser = ArgumentParser(description="Compute GitHub Actions' `hashFiles(...)` of the given glob patterns")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Files to hash concurrently (default: number of CPUs)')
+    parser.add_argument('-l', '--list', action='store_true', help='Print matched files (and their sha256s) to stderr')
+    parser.add_argument('-N', '--no-cache', action='store_true', help='Ignore (and don\'t update) the per-file digest cache')
+    parser.add_argument('-W', '--walk', action='store_true', help='Enumerate files by walking the filesystem, instead of via the git index')
+    parser.add_argument('patterns', nargs='+', help='Glob patterns (or literal paths); `!`-prefixed patterns exclude')
+    args = parser.parse_args()
+
+    root = os.path.realpath(os.environ.get('GITHUB_WORKSPACE') or os.getcwd())
+    patterns = parse_patterns(args.patterns, root)
+
+    # Literal paths are checked directly, so ignored/untracked files passed explicitly are still hashed
+    paths = set(candidate_files(root, walk=args.walk) if any(not literal for _, literal, _, _ in patterns) else [])
+    for negate, literal, _, _ in patterns:
+        if not literal or negate:
+            continue
+        full = os.path.join(root, literal)
+        if os.path.isdir(full):
+            paths.update(f'{literal}/{path}' for path in candidate_files(full, walk=args.walk))
+        elif os.path.exists(full):
+            paths.add(literal)
+
+    files = []
+    for path in paths:
+        if not matches(path, patterns):
+            continue
+        abspath = os.path.join(root, path)
+        try:
+            st = os.stat(abspath)
+        except OSError:
+            # Deleted from the worktree but still in the index, or a dangling symlink
+            continue
+        if not os.path.isfile(abspath):
+            continue
+        files.append((path, abspath, st))
+
+    roots = search_roots(patterns)
+    files.sort(key=lambda f: walk_order(f[0], roots))
+
+    cache_file = None if args.no_cache else cache_path()
+    cache = load_cache(cache_file) if cache_file else {}
+    now = time.time()
+
+    def digest(f):
+        path, abspath, st = f
+        key = f'{st.st_size}:{st.st_mtime_ns}:{st.st_ino}'
+        cached = cache.get(abspath)
+        if cached and cached[0] == key:
+            return bytes.fromhex(cached[1]), False
+        d = hash_file(abspath, st.st_size)
+        return d, now - st.st_mtime > RACY_SECS and (key, d.hex())
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(digest, files))
+
+    sha256 = hashlib.sha256()
+    updated = False
+    for (path, abspath, _), (d, entry) in zip(files, results):
+        sha256.update(d)
+        if entry:
+            cache[abspath] = list(entry)
+            updated = True
+        if args.list:
+            sys.stderr.write(f'{d.hex()}  {path}\n')
+
+    if cache_file and updated:
+        save_cache(cache_file, cache)
+
+    print(sha256.hexdigest() if files else '')
+
+
+if __name__ == '__main__':
+    main()
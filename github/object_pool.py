@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""Maintain a shared bare "object pool" repository that many clones borrow objects from via `objects/info/alternates`.
+
+Each pooled repo is a remote of the pool, named `<owner>/<repo>` (so same-named repos from different owners don't
+collide), and fetched into its own `refs/remotes/<owner>/<repo>/*` namespace, so forks and vendored copies are stored
+once. Member clones list the pool in their alternates; after the pool is repacked, `repack -a -d -l` in each member
+drops the objects it can now borrow.
+
+Usage:
+
+    object_pool.py init <pool>
+    object_pool.py add <pool> <owner>/<repo> <url>
+    object_pool.py attach <pool> <repo>...
+    object_pool.py maintain [-j N] <pool>
+"""
+
+import os
+import sys
+from functools import partial
+from os.path import abspath, exists, join
+from subprocess import check_call, check_output, CalledProcessError, DEVNULL
+from time import monotonic
+
+
+err = partial(print, file=sys.stderr)
+
+
+def git(pool, *args, **kwargs):
+    return check_call(['git', '-C', pool, *args], **kwargs)
+
+
+def git_lines(pool, *args):
+    try:
+        return [ line for line in check_output(['git', '-C', pool, *args], stderr=DEVNULL).decode().split('\n') if line ]
+    except CalledProcessError:
+        return []
+
+
+def init(pool):
+    """Create the pool (if it doesn't exist) as a bare repo that never prunes objects members may borrow."""
+    if exists(join(pool, 'objects')):
+        return
+    check_call(['git', 'init', '--quiet', '--bare', pool])
+    git(pool, 'config', 'gc.auto', '0')
+    git(pool, 'config', 'gc.pruneExpire', 'never')
+    git(pool, 'config', 'core.logAllRefUpdates', 'false')
+    git(pool, 'config', 'repack.writeBitmaps', 'true')
+    git(pool, 'config', 'fetch.writeCommitGraph', 'true')
+
+
+def remotes(pool):
+    return git_lines(pool, 'remote')
+
+
+def add(pool, name, url):
+    """Add pool remote `name` (`<owner>/<repo>`), fetching its branches and tags into `refs/remotes/<name>/`."""
+    if '/' not in name:
+        raise ValueError(f'Expected a pool remote name of the form `<owner>/<repo>`: {name}')
+    if name in remotes(pool):
+        return
+    git(pool, 'remote', 'add', name, url)
+    git(pool, 'config', '--replace-all', f'remote.{name}.fetch', f'+refs/heads/*:refs/remotes/{name}/heads/*')
+    git(pool, 'config', '--add', f'remote.{name}.fetch', f'+refs/tags/*:refs/remotes/{name}/tags/*')
+    git(pool, 'config', f'remote.{name}.tagOpt', '--no-tags')
+
+
+def attach(pool, repo, register=True):
+    """Point `repo` (a worktree or bare repo, including submodules) at the pool via `objects/info/alternates`.
+
+    With `register=False`, only `repo`'s alternates are touched (safe to run for many repos concurrently); the caller
+    then records them with one `register()` call, since concurrent `git config` writes to the pool contend for its
+    `config.lock`.
+    """
+    pool_objects = abspath(join(pool, 'objects'))
+    alternates = check_output(['git', '-C', repo, 'rev-parse', '--git-path', 'objects/info/alternates']).decode().strip()
+    if not os.path.isabs(alternates):
+        alternates = join(repo, alternates)
+    existing = []
+    if exists(alternates):
+        with open(alternates, 'r') as f:
+            existing = [ line.strip() for line in f if line.strip() ]
+    if pool_objects not in existing:
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        with open(alternates, 'a') as f:
+            f.write(f'{pool_objects}\n')
+    if register:
+        register_members(pool, [repo])
+
+
+def register_members(pool, repos):
+    """Record `repos` as pool members (whose objects `repack` dedupes against the pool), skipping known ones."""
+    existing = set(members(pool))
+    for repo in dict.fromkeys(abspath(repo) for repo in repos):
+        if repo not in existing:
+            git(pool, 'config', '--add', 'pool.member', repo)
+
+
+def members(pool):
+    return git_lines(pool, 'config', '--get-all', 'pool.member')
+
+
+def fetch(pool, jobs=8):
+    """Fetch all pool remotes, `jobs` at a time."""
+    git(pool, 'fetch', '--all', '--prune', '--quiet', f'--jobs={jobs}')
+
+
+def repack(pool):
+    """Repack the pool into one pack (with bitmap), then drop objects from members that they can borrow from it.
+
+    The pool keeps unreachable objects (`-k`): a member may still reference a commit that was force-pushed away upstream.
+    """
+    git(pool, 'repack', '-a', '-d', '-k', '-q', '--write-bitmap-index')
+    for member in members(pool):
+        if not exists(member):
+            err(f'Skipping missing member {member}')
+            continue
+        # `-l`: pack only objects not available from alternates
+        check_call(['git', '-C', member, 'repack', '-a', '-d', '-l', '-q'])
+
+
+def maintain(pool, jobs=8):
+    start = monotonic()
+    fetch(pool, jobs=jobs)
+    err(f'Fetched {len(remotes(pool))} remotes into {pool} in {monotonic() - start:.1f}s')
+    start = monotonic()
+    repack(pool)
+    err(f'Repacked pool and {len(members(pool))} members in {monotonic() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Maintain a shared "object pool" repository for many clones')
+    subparsers = parser.add_subparsers(dest='cmd', required=True)
+    p = subparsers.add_parser('init', help='Create a bare pool repository')
+    p.add_argument('pool')
+    p = subparsers.add_parser('add', help='Register a repo URL with the pool')
+    p.add_argument('pool')
+    p.add_argument('name', help='`<owner>/<repo>`')
+    p.add_argument('url')
+    p = subparsers.add_parser('attach', help="Add the pool to repos' `objects/info/alternates`")
+    p.add_argument('pool')
+    p.add_argument('repos', nargs='+')
+    p = subparsers.add_parser('maintain', help='Fetch all pool remotes, repack the pool, and dedupe members against it')
+    p.add_argument('-j', '--jobs', default=8, type=int, help='Concurrent fetches (default: 8)')
+    p.add_argument('pool')
+    args = parser.parse_args()
+
+    if args.cmd == 'init':
+        init(args.pool)
+    elif args.cmd == 'add':
+        add(args.pool, args.name, args.url)
+    elif args.cmd == 'attach':
+        for repo in args.repos:
+            attach(args.pool, repo, register=False)
+        register_members(args.pool, args.repos)
+    elif args.cmd == 'maintain':
+        maintain(args.pool, jobs=args.jobs)
@@ -6,13 +6,18 @@
 # ]
 # ///
 
-from requests import get as GET
+import os
+import sys
 
-def repos(org, sort='updated'):
-    resp = GET(f'https://api.github.com/orgs/{org}/repos?sort={sort}')
-    resp.raise_for_status()
-    repos = resp.json()
-    return repos
+# Add parent directory to path for local imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from git_helpers.util.github_api import GitHubSession
+
+
+def repos(org, sort='updated', gh=None):
+    '''List all of an org's repos (following pagination; the API returns at most 100 per page).'''
+    gh = gh or GitHubSession()
+    return list(gh.paginate(f'orgs/{org}/repos', params={'sort': sort}))
 
 if __name__ == '__main__':
     from argparse import ArgumentParser
@@ -0,0 +1,200 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "click",
+# ]
+# ///
+#
+# Write/update the repo's commit-graph (with changed-path Bloom filters), multi-pack-index, and reachability bitmaps.
+#
+# History walks (`git graph`, `glg`, `git-blob-first-commit`, `git-branch-point`, …) use these when present: the
+# commit-graph stores parents and generation numbers (so walks and `--graph`/`--date-order` sorting needn't parse each
+# commit), and the Bloom filters let path-limited walks (`git log -- <path>`) skip commits that can't touch the path.
+#
+#     git-maintain-graph.py      # incremental: pack loose objects, add a commit-graph layer for new commits (cheap; runs after `git fetch-x`)
+#     git-maintain-graph.py -f   # full: repack into one pack, rewrite the commit-graph as one layer
+#     git-maintain-graph.py -b   # then time this repo's log/graph helpers with all of the above disabled vs. enabled
+
+from glob import glob
+from os import environ, pathsep
+from os.path import abspath, dirname, exists, getmtime, isdir, join
+from subprocess import DEVNULL, PIPE, CalledProcessError, run
+from sys import stderr
+from time import monotonic
+
+import click
+
+ROOT = dirname(dirname(abspath(__file__)))
+# Config that disables everything this script writes, for `-b`'s "before" timings
+DISABLE = {
+    'core.commitGraph': 'false',
+    'core.multiPackIndex': 'false',
+    'pack.useBitmaps': 'false',
+}
+
+
+def err(msg=''):
+    stderr.write(f'{msg}\n')
+
+
+def git(*args):
+    return run(['git', *args], stdout=PIPE, stderr=DEVNULL).stdout.decode().strip()
+
+
+def git_path(path):
+    return git('rev-parse', '--git-path', path)
+
+
+def num_loose():
+    for line in git('count-objects', '-v').splitlines():
+        key, _, val = line.partition(': ')
+        if key == 'count':
+            return int(val)
+    return 0
+
+
+def midx_current():
+    """Whether a multi-pack-index (with bitmap) exists, and is newer than every pack."""
+    pack_dir = git_path('objects/pack')
+    midx = join(pack_dir, 'multi-pack-index')
+    if not exists(midx) or not glob(join(pack_dir, 'multi-pack-index-*.bitmap')):
+        return False
+    mtime = getmtime(midx)
+    return all(getmtime(pack) <= mtime for pack in glob(join(pack_dir, 'pack-*.pack')))
+
+
+def step(label, cmd, quiet):
+    start = monotonic()
+    run(cmd, check=True)
+    if not quiet:
+        err(f'{label}: {monotonic() - start:.2f}s')
+
+
+def maintain(full, quiet):
+    progress = [] if quiet or not stderr.isatty() else ['--progress']
+    q = ['-q'] if quiet else []
+    if full:
+        step('repack', ['git', 'repack', '-a', '-d', *q, '--write-midx', '--write-bitmap-index'], quiet)
+    elif num_loose() or not midx_current():
+        # Without `-a`, only loose objects are packed (into a new pack); existing packs stay, indexed by the MIDX
+        step('repack (loose objects)', ['git', 'repack', '-d', *q, '--write-midx', '--write-bitmap-index'], quiet)
+    # `--split` appends a layer with just the new commits (merging small layers as it goes); `--changed-paths` is
+    # needed for Bloom filters to be computed for them
+    split = '--split=replace' if full else '--split'
+    step('commit-graph', ['git', 'commit-graph', 'write', '--reachable', split, '--changed-paths', *progress], quiet)
+
+
+def bench_env(disable=False):
+    # Helpers call each other as `git <name>`, so put them all on the `$PATH`, as `.git-rc` does
+    dirs = [ d for d in sorted(glob(join(ROOT, '*'))) if isdir(d) ]
+    env = { **environ, 'PATH': pathsep.join([ environ.get('PATH', ''), *dirs ]) }
+    if not disable:
+        return env
+    count = int(env.get('GIT_CONFIG_COUNT', 0))
+    for idx, (key, value) in enumerate(DISABLE.items(), start=count):
+        env[f'GIT_CONFIG_KEY_{idx}'] = key
+        env[f'GIT_CONFIG_VALUE_{idx}'] = value
+    env['GIT_CONFIG_COUNT'] = str(count + len(DISABLE))
+    return env
+
+
+def default_path():
+    """A recently-modified file that still exists, for the path-limited benchmarks."""
+    recent = git('log', '-n', '50', '--format=', '--name-only', '--diff-filter=AM', 'HEAD').splitlines()
+    tracked = set(git('ls-files').splitlines())
+    for path in recent:
+        if path in tracked:
+            return path
+    return next(iter(sorted(tracked)), None)
+
+
+def benchmarks(path, upstream):
+    yield 'git graph', [join(ROOT, 'graph', 'git-graph')]
+    yield 'git graph-all', [join(ROOT, 'graph', 'git-graph-all')]
+    if path:
+        # `glg` prompts when its pattern matches several files; this is the `git log` it runs for one
+        yield f'glg {path}', ['git', 'log', '-p', '--follow', '--', path]
+        yield f'git log -- {path}', ['git', 'log', '--format=%h', '--', path]
+        blob = git('rev-parse', f'HEAD:{path}')
+        if blob:
+            yield f'git-blob-first-commit {blob[:10]}', [join(ROOT, 'cat-file', 'git-blob-first-commit'), '-c', blob]
+    if upstream:
+        yield f'git-branch-point {upstream}', [join(ROOT, 'merge-base', 'git-branch-point'), upstream, 'HEAD']
+    yield 'git rev-list --count --all', ['git', 'rev-list', '--count', '--all']
+
+
+def time_cmd(cmd, repeat, env=None):
+    """Fastest of `repeat` runs of `cmd`; raises `CalledProcessError` (with stderr) if it fails."""
+    best = None
+    for _ in range(repeat):
+        start = monotonic()
+        res = run(cmd, stdout=DEVNULL, stderr=PIPE, env=env)
+        elapsed = monotonic() - start
+        if res.returncode:
+            raise CalledProcessError(res.returncode, cmd, stderr=res.stderr)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command()
+@click.option('-b', '--bench', is_flag=True, help="Afterwards, time this repo's log/graph helpers with the commit-graph, MIDX, and bitmaps disabled (\"before\") vs. enabled (\"after\")")
+@click.option('-B', '--bench-only', is_flag=True, help='Only run the benchmarks (implies -b)')
+@click.option('-f', '--full', is_flag=True, help='Repack all objects into one pack, and rewrite the commit-graph as a single layer')
+@click.option('-p', '--path', help='File to use for the path-limited benchmarks (default: a recently-modified one)')
+@click.option('-q', '--quiet', is_flag=True, help="Don't log steps or progress")
+@click.option('-r', '--repeat', type=int, default=3, show_default=True, help='Run each benchmark this many times, reporting the fastest')
+@click.option('-u', '--upstream', help='Ref to compare HEAD against in the `git-branch-point` benchmark (default: `@{u}`, then `$DEFAULT_REMOTE/HEAD`)')
+def main(bench, bench_only, full, path, quiet, repeat, upstream):
+    """Write/update the commit-graph (with Bloom filters), multi-pack-index, and bitmaps; optionally benchmark them."""
+    if not git('rev-parse', '--git-dir'):
+        raise click.ClickException('Not in a git repository')
+    if not bench_only:
+        start = monotonic()
+        try:
+            maintain(full, quiet)
+        except CalledProcessError as e:
+            raise click.ClickException(f'{" ".join(e.cmd[:3])} exited {e.returncode}')
+        if not quiet:
+            chain = git_path('objects/info/commit-graphs/commit-graph-chain')
+            layers = sum(1 for _ in open(chain)) if exists(chain) else 0
+            packs = len(glob(join(git_path('objects/pack'), 'pack-*.pack')))
+            err(f'Done in {monotonic() - start:.2f}s: {layers} commit-graph layers, {packs} packs')
+    if not (bench or bench_only):
+        return
+
+    path = path or default_path()
+    if not upstream:
+        remote_head = f'{environ.get("DEFAULT_REMOTE", "origin")}/HEAD'
+        upstream = next((ref for ref in ('@{u}', remote_head) if git('rev-parse', '-q', '--verify', ref)), None)
+    off, on = bench_env(disable=True), bench_env()
+    rows = []
+    failed = []
+    for label, cmd in benchmarks(path, upstream):
+        try:
+            before = time_cmd(cmd, repeat, env=off)
+            after = time_cmd(cmd, repeat, env=on)
+            rows.append((label, before, after, None))
+        except CalledProcessError as e:
+            # Not a timing: the helper broke (e.g. bad args, or a missing dependency)
+            lines = e.stderr.decode(errors='replace').strip().splitlines()
+            rows.append((label, None, None, f'exited {e.returncode}{f": {lines[-1]}" if lines else ""}'))
+            failed.append(label)
+        if not quiet:
+            stderr.write(f'\r{len(rows)} benchmarks run')
+            stderr.flush()
+    if not quiet:
+        err()
+    width = max(len(label) for label, *_ in rows)
+    print(f'{"command":<{width}}  {"before":>8}  {"after":>8}  speedup')
+    for label, before, after, error in rows:
+        if error:
+            print(f'{label:<{width}}  failed: {error}')
+        else:
+            print(f'{label:<{width}}  {before:7.3f}s  {after:7.3f}s  {before / after if after else 0:6.1f}x')
+    if failed:
+        raise click.ClickException(f'{len(failed)} of {len(rows)} benchmarks failed: {", ".join(failed)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "click",
+# ]
+# ///
+#
+# Rewrite author/committer identities and dates across history, streaming `git fast-export` through in-process
+# filters into `git fast-import` (thousands of commits per second; no shell or checkout per commit).
+#
+#     git-rewrite-history.py -e old@example.com='New Name <new@example.com>'   # all branches and tags
+#     git-rewrite-history.py -m main~100..main                                 # apply .mailmap to a range
+#     git-rewrite-history.py -n -C @{u}..HEAD                                  # report commits whose committer date would be reset
+#
+# Each rewritten ref's previous value is saved under `refs/git-helpers/original/`; as with `git filter-branch`, an existing
+# backup there (from a previous rewrite) must be deleted first, or overwritten with `-f`.
+
+from os.path import abspath, dirname, join
+from subprocess import DEVNULL, PIPE, run
+import sys
+from sys import stderr
+from time import monotonic
+
+import click
+
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.history import IdentFilter, Mailmap, Progress, parse_offset, parse_person, rewrite_history
+from git_helpers.util.refs import EPHEMERAL_NS
+
+
+def err(msg=''):
+    stderr.write(f'{msg}\n')
+
+
+def git_config(key):
+    return run(['git', 'config', key], stdout=PIPE, stderr=DEVNULL).stdout.decode().strip() or None
+
+
+def default_mailmap_paths():
+    root = run(['git', 'rev-parse', '--show-toplevel'], stdout=PIPE, stderr=DEVNULL).stdout.decode().strip()
+    return [ join(root, '.mailmap') if root else None, git_config('mailmap.file') ]
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.option('-a', '--author', help='Set every commit\'s author to this `Name <email>`')
+@click.option('-A', '--author-date-is-committer-date', is_flag=True, help="Set each commit's author date to its committer date")
+@click.option('-c', '--committer', help='Set every commit\'s committer to this `Name <email>`')
+@click.option('-C', '--committer-date-is-author-date', is_flag=True, help="Set each commit's committer date to its author date")
+@click.option('-e', '--email', 'emails', multiple=True, help='`<old email>=<new email>` or `<old email>=Name <new email>`: rewrite authors/committers/taggers with this email (repeatable)')
+@click.option('-f', '--force', is_flag=True, help='Overwrite an existing backup of original refs (from a previous rewrite)')
+@click.option('-m', '--mailmap', is_flag=True, help='Apply the repo\'s mailmap (`.mailmap` and `mailmap.file`)')
+@click.option('-M', '--mailmap-file', 'mailmap_files', multiple=True, help='Apply this mailmap file (repeatable; implies -m)')
+@click.option('-n', '--dry-run', is_flag=True, help='Report the commits that would change, without writing anything')
+@click.option('-o', '--date-offset', help='Shift author and committer dates: `[+|-]<number>[s|m|h|d]` (`+` adds; otherwise subtracts, as in `git set-committer-info -d`)')
+@click.option('-q', '--quiet', is_flag=True, help="Don't log progress or changed commits")
+@click.argument('revs', nargs=-1, type=click.UNPROCESSED)
+def main(author, author_date_is_committer_date, committer, committer_date_is_author_date, emails, force, mailmap, mailmap_files, dry_run, date_offset, quiet, revs):
+    """Rewrite identities/dates in `revs` (default: `--branches --tags`; e.g. `main~100..main`), via fast-export/fast-import."""
+    if author_date_is_committer_date and committer_date_is_author_date:
+        raise click.UsageError('-A and -C are mutually exclusive')
+
+    email_map = {}
+    for spec in emails:
+        old, sep, new = spec.partition('=')
+        if not sep or not old or not new:
+            raise click.BadParameter(f'{spec}: expected <old email>=[Name <]<new email>[>]', param_hint='-e/--email')
+        email_map[old.strip().encode().lower()] = parse_person(new)
+    if mailmap or mailmap_files:
+        mailmap = Mailmap.load(*(mailmap_files or default_mailmap_paths()))
+        if not mailmap:
+            err('Warning: mailmap is empty')
+    try:
+        offset = parse_offset(date_offset) if date_offset else 0
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='-o/--date-offset')
+    for flag, person in (('-a/--author', author), ('-c/--committer', committer)):
+        if person and parse_person(person)[0] is None:
+            raise click.BadParameter(f'{person}: expected `Name <email>`', param_hint=flag)
+
+    ident_filter = IdentFilter(
+        mailmap=mailmap or None,
+        emails=email_map,
+        author=parse_person(author) if author else None,
+        committer=parse_person(committer) if committer else None,
+        committer_date_is_author_date=committer_date_is_author_date,
+        author_date_is_committer_date=author_date_is_committer_date,
+        date_offset=offset,
+    )
+    if ident_filter == IdentFilter():
+        raise click.UsageError('Nothing to rewrite; pass at least one of -a, -A, -c, -C, -e, -m/-M, -o')
+
+    progress = None if quiet else Progress()
+
+    def on_change(oid, kind, old, new):
+        if dry_run and not quiet:
+            stderr.write('\r')
+            err(f'{oid[:10] if oid else "(tag)"} {kind}: {old.decode(errors="replace")} -> {new.decode(errors="replace")}')
+
+    start = monotonic()
+    try:
+        stats = rewrite_history(
+            # Never rewrite this script's (or other helpers') private refs, e.g. via `--all`
+            [f'--exclude={EPHEMERAL_NS}/*', *(revs or ['--branches', '--tags'])],
+            ident_filter,
+            dry_run=dry_run,
+            on_change=on_change,
+            progress=progress,
+            backup_ns=f'{EPHEMERAL_NS}/original',
+            overwrite_backup=force,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    if progress:
+        progress.write(stats, end='\n')
+    elapsed = monotonic() - start
+    verb = 'would change' if dry_run else 'changed'
+    err(
+        f'{len(stats.changed)} of {stats.commits} commits {verb} ({stats.rewritten} rewritten in all), '
+        f'{stats.changed_tags} of {stats.tags} tags {verb}, {len(stats.refs)} refs, in {elapsed:.2f}s'
+    )
+    if not dry_run and (stats.rewritten or stats.changed_tags):
+        err(f'Original refs saved under {EPHEMERAL_NS}/original/')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,20 @@
 # ///
 import shlex
 from functools import partial
-from subprocess import check_call, CalledProcessError, check_output
+from os.path import abspath, dirname
+from subprocess import check_call, CalledProcessError, check_output, PIPE, run as run_proc
+import sys
 from sys import stderr
+from time import monotonic
 
 import click
 
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.refs import EPHEMERAL_NS, update_refs
+from git_helpers.util.rewrite import FastImport, committer_ident, read_commits
+
 
 def err(msg=''):
     stderr.write(msg)
@@ -69,40 +78,63 @@ def get_sha(ref=None, **kwargs):
 
 @click.command(help='Rebase a DAG of Git commits onto a new base commit. -b/--base and -o/--onto commits must have identical trees (which also ensures no conflicts arise)')
 @click.option('-b', '--base', help='Current base commit (likely the parent of the root of the DAG you want to rebase onto)')
-@click.option('-n', '--dry-run', is_flag=True, help="")
+@click.option('-C', '--preserve-committer', is_flag=True, help="Keep each commit's committer name/email/date (default: use the current committer identity and time, like `git commit --amend`)")
+@click.option('-n', '--dry-run', is_flag=True, help="Print the commits that would be rewritten, but don't write anything")
 @click.option('-o', '--onto')
 @click.argument('branch')
-def main(base, dry_run, onto, branch):
+def main(base, preserve_committer, dry_run, onto, branch):
+    """Rewrite every commit in `base..branch` with parents remapped onto `onto`.
+
+    Trees are reused, so nothing is merged or checked out: commits are read in one `git log` pass, written through one
+    `git fast-import` stream, and `branch` is moved in one `update-ref`. The worktree is touched at most once, to check
+    out `branch` at the end (if it isn't already checked out; its tree is unchanged).
+    """
     try:
-        run('git', 'diff', '--quiet', f'{base}..{onto}')
+        run('git', 'diff', '--quiet', base, onto)
     except CalledProcessError:
         raise RuntimeError(f"Git trees don't match: {base} != {onto}")
 
-    shas = list(filter(None, lines('git', 'log', '--format=%H', '--reverse', '--topo-order', f'{base}..{branch}')))
-    print('\n'.join(shas))
-    run('git', 'checkout', branch, dry_run=dry_run)
-    run('git', 'reset', '--hard', onto, dry_run=dry_run)
     base_sha = get_sha(base)
     onto_sha = get_sha(onto)
+    branch_ref = line('git', 'rev-parse', '--symbolic-full-name', branch)
+    if not branch_ref.startswith('refs/heads/'):
+        raise ValueError(f'{branch} is not a local branch')
+    commits = read_commits('--reverse', '--topo-order', f'{base_sha}..{branch_ref}')
+    err(f'Rewriting {len(commits)} commits from {base_sha[:7]} onto {onto_sha[:7]}')
+    in_dag = { commit.sha for commit in commits } | { base_sha }
+    for commit in commits:
+        for parent in commit.parents:
+            if parent not in in_dag:
+                raise RuntimeError(f"{commit.sha}'s parent {parent} is not {base} or a descendant of it")
+    if dry_run or not commits:
+        for commit in commits:
+            print(commit.sha)
+        return
+
+    start = monotonic()
+    committer = None if preserve_committer else committer_ident()
     rebased_commits = { base_sha: onto_sha }
-    for sha in shas:
-        parents = check_output([ 'git', 'rev-list', '--parents', '-n1', sha ]).decode().rstrip('\n').split(' ')[1:]
-        for parent in parents:
-            if parent not in rebased_commits:
-                raise RuntimeError(f"{sha}'s parent {parent} not found in rebased_commits {rebased_commits}")
-        rebased_parents = [ rebased_commits[parent] for parent in parents ]
-        tree = line('git', 'log', '-1', '--format=%T', sha)
-        body = output('git', 'log', '-1', '--format=%B', sha)
-        commit_tree_cmd = ['git', 'commit-tree', tree, '-m', body]
-        for parent in rebased_parents:
-            commit_tree_cmd += [ '-p', parent ]
-        new_sha_wip = line(*commit_tree_cmd, dry_run=dry_run)
-        err(f'WIP new SHA: {sha} -> {new_sha_wip}')
-        run('git', 'reset', '--hard', new_sha_wip)
-        run('git', 'commit', '--amend', '--allow-empty', '-C', sha, dry_run=dry_run)
-        new_sha = get_sha(dry_run=dry_run)
-        err(f'New SHA: {sha} -> {new_sha}')
-        rebased_commits[sha] = new_sha
+    scratch = f'{EPHEMERAL_NS}/rebase-dag'
+    with FastImport(scratch) as fi:
+        for commit in commits:
+            rebased_commits[commit.sha] = fi.commit(
+                tree=commit.tree,
+                parents=[ rebased_commits[parent] for parent in commit.parents ],
+                message=commit.message,
+                author=commit.author,
+                committer=commit.committer if preserve_committer else committer,
+            )
+        marks = fi.close()
+
+    for commit in commits:
+        err(f'New SHA: {commit.sha} -> {marks[rebased_commits[commit.sha]]}')
+    new_tip = marks[rebased_commits[commits[-1].sha]]
+    update_refs({ branch_ref: new_tip, scratch: None }, msg=f'rebase-dag: {base_sha[:7]} -> {onto_sha[:7]}')
+    err(f'Rewrote {len(commits)} commits in {monotonic() - start:.2f}s; {branch} is now {new_tip}')
+
+    current = run_proc(['git', 'symbolic-ref', '-q', 'HEAD'], stdout=PIPE).stdout.decode().strip()
+    if current != branch_ref:
+        run('git', 'checkout', branch)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,178 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "click",
+# ]
+# ///
+#
+# Rebase a stack (or any tree) of branches in memory, replaying each commit once, and update all branches atomically.
+#
+# Commits reachable from any of the branches (but not from the base) are read in one `git log` pass, replayed oldest
+# first with `git merge-tree` + `git commit-tree` (a commit shared by several branches is replayed once), and all
+# branch refs move in one `git update-ref --stdin` transaction. As with `git rebase`, merges aren't replayed, and commits
+# whose patches are already in the new base are dropped. On any conflict, no refs are changed, and each
+# affected branch is reported with the commit that conflicted (and the paths).
+#
+# Two ways to choose what goes where:
+#
+#     git-rebase-stack.py -o <onto> -b <base> <branch>...   # replay <base>..<branches> onto <onto> (cf. git-rebase-sequence)
+#     git-rebase-stack.py -u <branch>...                    # replay each branch onto its upstream (cf. git-rebase-branches)
+
+from collections import defaultdict
+from os.path import abspath, dirname
+from subprocess import PIPE, check_output, run
+import sys
+from sys import exit, stderr
+from time import monotonic
+
+import click
+
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.refs import update_refs
+from git_helpers.util.rewrite import Conflict, Replayer, commit_tree, committer_ident, read_commits
+
+
+def err(msg=''):
+    stderr.write(f'{msg}\n')
+
+
+def git(*args):
+    return check_output(['git', *args]).decode().strip()
+
+
+def branch_ref(branch):
+    ref = git('rev-parse', '--symbolic-full-name', branch)
+    if not ref.startswith('refs/heads/'):
+        raise click.BadParameter(f'{branch} is not a local branch')
+    return ref
+
+
+def patch_equivalent(onto, refs):
+    """SHAs of (non-merge) commits in `refs` whose patches are already in `onto`, which `git rebase` would drop."""
+    dropped = set()
+    for ref in refs:
+        out = git('rev-list', '--cherry-mark', '--right-only', '--no-merges', f'{onto}...{ref}')
+        dropped.update( line[1:] for line in out.splitlines() if line.startswith('=') )
+    return dropped
+
+
+def rebase_group(replayer, onto, base, refs, committer):
+    """Replay `base..refs` onto `onto`, dropping commits already in `onto`; returns `({ref: new sha}, {ref: Conflict})`.
+
+    A conflicting commit (and everything built on it) is skipped, so each branch's first conflict is reported.
+    """
+    onto_sha = git('rev-parse', f'{onto}^{{commit}}')
+    commits = read_commits('--reverse', '--topo-order', *refs, f'^{base}')
+    dropped = patch_equivalent(onto_sha, refs) if commits else set()
+    mapping = {}
+    failed = {}
+    for commit in commits:
+        if len(commit.parents) > 1:
+            failed[commit.sha] = Conflict(commit.sha, ['(merge commit; not supported)'])
+            continue
+        [parent] = commit.parents or [None]
+        if parent in failed:
+            failed[commit.sha] = failed[parent]
+            continue
+        new_parent = mapping.get(parent, onto_sha)
+        if commit.sha in dropped:
+            err(f'Dropping {commit.sha[:7]} (already in {onto})')
+            mapping[commit.sha] = new_parent
+            continue
+        try:
+            tree = replayer.pick(commit, new_parent)
+        except Conflict as e:
+            failed[commit.sha] = e
+            continue
+        mapping[commit.sha] = commit_tree(tree, [new_parent], commit.message, author=commit.author, committer=committer)
+        replayer.trees[mapping[commit.sha]] = tree
+
+    updates, conflicts = {}, {}
+    for ref in refs:
+        tip = git('rev-parse', ref)
+        if tip in failed:
+            conflicts[ref] = failed[tip]
+        else:
+            # Branches with no commits past `base` land on `onto`
+            updates[ref] = mapping.get(tip, onto_sha)
+    return updates, conflicts
+
+
+@click.command()
+@click.option('-b', '--base', help='Commits reachable from here are not replayed (default: `onto`)')
+@click.option('-n', '--dry-run', is_flag=True, help="Replay everything and report results, but don't move any refs")
+@click.option('-o', '--onto', help='New base for the stack')
+@click.option('-u', '--upstream', is_flag=True, help="Rebase each branch onto its upstream (`@{u}`), instead of -o/-b; branches sharing an upstream are replayed together")
+@click.argument('branches', nargs=-1, required=True)
+def main(base, dry_run, onto, upstream, branches):
+    """Rebase a stack of branches in memory, replaying each commit once, and update all branch refs atomically."""
+    start = monotonic()
+    refs = [ branch_ref(branch) for branch in branches ]
+    old_tips = { ref: git('rev-parse', ref) for ref in refs }
+
+    groups = defaultdict(list)
+    if upstream:
+        if onto or base:
+            raise click.UsageError('-u/--upstream is incompatible with -o/--onto and -b/--base')
+        for ref in refs:
+            name = ref[len('refs/heads/'):]
+            res = run(['git', 'rev-parse', '--symbolic-full-name', f'{name}@{{u}}'], stdout=PIPE, stderr=PIPE)
+            if res.returncode:
+                raise click.UsageError(f'{name} has no upstream')
+            groups[res.stdout.decode().strip()].append(ref)
+    else:
+        if not onto:
+            raise click.UsageError('Pass -o/--onto (or -u/--upstream)')
+        groups[onto] = refs
+
+    replayer = Replayer()
+    committer = committer_ident()
+    updates, conflicts = {}, {}
+    for group_onto, group_refs in groups.items():
+        # Like `git rebase <upstream>`, replay commits not already reachable from the new base
+        group_base = base or group_onto
+        group_updates, group_conflicts = rebase_group(replayer, group_onto, group_base, group_refs, committer)
+        updates.update(group_updates)
+        conflicts.update(group_conflicts)
+
+    for ref in refs:
+        name = ref[len('refs/heads/'):]
+        if ref in conflicts:
+            e = conflicts[ref]
+            err(f'{name}: conflict in {e.commit[:7]}: {", ".join(e.paths)}')
+        elif updates[ref] == old_tips[ref]:
+            err(f'{name}: up to date ({old_tips[ref][:7]})')
+        else:
+            err(f'{name}: {old_tips[ref][:7]} -> {updates[ref][:7]}')
+
+    if conflicts:
+        err(f'{len(conflicts)} of {len(refs)} branches conflicted; no refs updated')
+        exit(1)
+    if dry_run:
+        err(f'Dry run: would update {len(refs)} branches')
+        return
+
+    moved = { ref: sha for ref, sha in updates.items() if sha != old_tips[ref] }
+    current = run(['git', 'symbolic-ref', '-q', 'HEAD'], stdout=PIPE).stdout.decode().strip()
+    if current in moved:
+        # Carry the index/worktree (and any local changes) from the old tip to the new one, before any refs move (it
+        # refuses to overwrite local changes, and then nothing has changed)
+        if run(['git', 'read-tree', '-m', '-u', old_tips[current], moved[current]]).returncode:
+            err('Failed to update the index/worktree; no refs updated')
+            exit(1)
+    try:
+        # Verify each ref still points where we read it, so a concurrent update fails the whole transaction
+        update_refs(moved, msg='rebase-stack', old=old_tips)
+    except RuntimeError as e:
+        if current in moved:
+            run(['git', 'read-tree', '-m', '-u', moved[current], old_tips[current]])
+        err(f'{e}; no refs updated')
+        exit(1)
+    err(f'Updated {len(moved)} branches in {monotonic() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
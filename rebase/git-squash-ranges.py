@@ -0,0 +1,103 @@
+#!/usr/bin/env -S uv run
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "click",
+# ]
+# ///
+#
+# Squash any number of ranges of a branch's (first-parent) history, each into one commit, without rebasing.
+#
+# Squashed commits take the tree of their range's last commit, so nothing needs merging: the branch's history since the
+# earliest range is read in one `git log` pass, the new chain is written in one `git fast-import` stream, and the
+# branch moves in one `git update-ref`. The branch's tree doesn't change, so the index and worktree are untouched.
+#
+#     git-squash-ranges.py A..B C..D   # squash A..B and C..D (each `start` exclusive), re-parenting everything else
+
+from os.path import abspath, dirname
+from subprocess import check_output
+import sys
+from sys import stderr
+from time import monotonic
+
+import click
+
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.refs import EPHEMERAL_NS, update_refs
+from git_helpers.util.rewrite import committer_ident, read_commits, squash_groups, write_squashed
+
+
+def err(msg=''):
+    stderr.write(f'{msg}\n')
+
+
+def git(*args):
+    return check_output(['git', *args]).decode().strip()
+
+
+def subject(commit):
+    return commit.message.decode(errors='replace').split('\n', 1)[0]
+
+
+@click.command()
+@click.option('-b', '--branch', default='HEAD', help='Branch to rewrite (default: the current branch)')
+@click.option('-C', '--preserve-committer', is_flag=True, help="Keep re-parented commits' committer info (instead of the current user and time)")
+@click.option('-F', '--file', 'message_file', type=click.File('rb'), help='Read the squashed commit message from this file (one range only)')
+@click.option('-m', '--message', help='Squashed commit message (one range only; default: subjects of the squashed commits)')
+@click.option('-n', '--dry-run', is_flag=True, help='Print the new history, without writing anything')
+@click.argument('ranges', nargs=-1, required=True)
+def main(branch, preserve_committer, message_file, message, dry_run, ranges):
+    """Squash each `<start>..<end>` range of a branch into one commit, in one pass, without touching the worktree."""
+    if message_file:
+        message = message_file.read()
+    elif message is not None:
+        message = message.encode()
+    if message is not None and len(ranges) > 1:
+        raise click.UsageError('-m/-F can only be used with one range')
+
+    pairs = []
+    for spec in ranges:
+        start, sep, end = spec.partition('..')
+        if not sep or not start or not end or end.startswith('.'):
+            raise click.BadParameter(f'{spec}: expected <start>..<end>')
+        pairs.append((start, end))
+    shas = git('rev-parse', *(f'{rev}^{{commit}}' for pair in pairs for rev in pair)).split()
+    pairs = list(zip(shas[0::2], shas[1::2]))
+
+    branch_ref = git('rev-parse', '--symbolic-full-name', branch)
+    if not branch_ref.startswith('refs/heads/'):
+        raise click.BadParameter(f'{branch} is not a local branch')
+    tip = git('rev-parse', branch_ref)
+    # The earliest rev given (all must be on the branch's first-parent chain, which `squash_groups` checks)
+    base = git('merge-base', '--octopus', *shas)
+
+    start_time = monotonic()
+    commits = read_commits('--reverse', '--first-parent', f'{base}..{tip}')
+    try:
+        groups = squash_groups(commits, pairs)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    if dry_run:
+        for group, squashed in groups:
+            first, last = group[0], group[-1]
+            if not squashed:
+                print(f'  {first.sha[:7]} {subject(first)}')
+            else:
+                print(f'* {first.sha[:7]}^..{last.sha[:7]} ({len(group)} commits): {subject(first)}')
+        return
+
+    committer = None if preserve_committer else committer_ident()
+    scratch = f'{EPHEMERAL_NS}/squash-ranges'
+    new = write_squashed(groups, base, scratch, message=message, committer=committer)
+    new_tip = new[-1]
+    update_refs({ branch_ref: new_tip, scratch: None }, msg=f'squash-ranges: {" ".join(ranges)}', old={ branch_ref: tip })
+    num_squashed = sum(len(group) for group, squashed in groups if squashed)
+    reparented = sum(not squashed and sha != group[0].sha for (group, squashed), sha in zip(groups, new))
+    err(f'Squashed {num_squashed} commits into {len(pairs)} and re-parented {reparented} in {monotonic() - start_time:.2f}s; {branch_ref[len("refs/heads/"):]} is now {new_tip[:7]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,21 +6,100 @@
 # ]
 # ///
 import shlex
+import sys
 from os import environ as env
+from os.path import abspath, dirname
+from shutil import copyfile
+from subprocess import check_output
+from tempfile import TemporaryDirectory
 
 from utz import err
 from utz import proc
 from utz.cli import arg, cmd, flag, opt
 
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.rewrite import Conflict, Replayer, commit_tree, committer_ident, read_commits
+
+
+def index_tree(all, dry_run):
+    """Tree of the index (after staging tracked changes, with `all`); a dry run stages into a scratch copy of the index."""
+    if not all:
+        return proc.line('git', 'write-tree', log=None)
+    if not dry_run:
+        proc.run('git', 'add', '-u', log=None)
+        return proc.line('git', 'write-tree', log=None)
+    with TemporaryDirectory() as tmpdir:
+        index = f'{tmpdir}/index'
+        copyfile(proc.line('git', 'rev-parse', '--git-path', 'index', log=None), index)
+        tmp_env = { **env, 'GIT_INDEX_FILE': index }
+        check_output(['git', 'add', '-u'], env=tmp_env)
+        return check_output(['git', 'write-tree'], env=tmp_env).decode().strip()
+
+
+def fast_throw(all, message, dry_run, dst):
+    """Fold the staged (or, with `all`, tracked) changes into `dst` and replay `dst..HEAD` in memory.
+
+    The index/worktree are only touched if the result differs from what's staged, and are updated before the branch ref
+    moves (once), so a failure leaves HEAD where it was.
+    Returns `False` (having changed nothing) if the replay hits a conflict, or history contains merges.
+    """
+    head = proc.line('git', 'rev-parse', 'HEAD', log=None)
+    commits = read_commits('--reverse', '--topo-order', f'{dst}..{head}')
+    if any(len(commit.parents) > 1 for commit in commits):
+        err(f'{dst}..HEAD contains merge commits; falling back to `git rebase -i`')
+        return False
+    tree = index_tree(all, dry_run)
+    replayer = Replayer()
+    if tree == replayer.tree(head):
+        err('No changes to throw')
+        sys.exit(1)
+
+    [dst_commit] = read_commits('-1', dst)
+    committer = committer_ident()
+    # The changes to throw, as a commit on top of HEAD
+    changes = commit_tree(tree, [head], (message or f'Temporary commit, to be squashed into {dst}').encode())
+    try:
+        dst_tree, conflicts = replayer.merge(head, dst, changes)
+        if conflicts:
+            raise Conflict(dst, conflicts)
+        new_dst = commit_tree(dst_tree, dst_commit.parents, dst_commit.message, author=dst_commit.author, committer=committer)
+        mapping = replayer.replay(commits, new_dst, committer=committer)
+    except Conflict as e:
+        err(f'{e}; falling back to `git rebase -i`')
+        return False
+
+    new_head = mapping[-1][1] if mapping else new_dst
+    err(f'{dst[:7]} -> {new_dst[:7]}')
+    for old, new in mapping:
+        err(f'{old[:7]} -> {new[:7]}')
+    if dry_run:
+        err(f'Dry run: would move HEAD from {head[:7]} to {new_head[:7]}')
+        return True
+
+    new_tree = replayer.tree(new_head)
+    if new_tree != tree:
+        # Carry the worktree from the staged tree to the result (keeping unstaged changes); this refuses to clobber
+        # unstaged changes, so it runs before HEAD moves
+        proc.run('git', 'read-tree', '-m', '-u', tree, new_tree, log=None)
+    proc.run('git', 'update-ref', '-m', f'throw: onto {dst[:7]}', 'HEAD', new_head, head, log=None)
+    err(f'HEAD: {head[:7]} -> {new_head[:7]}')
+    return True
+
 
 @cmd('git-throw')
 @flag('-a', '--all', help='Stage all tracked files before committing (pass -a to git commit).')
 @opt('-m', '--message', help='Optional message to use for ephemeral commit (before it is squashed onto the commit pointed to by `dst`).')
-@opt('-n', '--dry-run', count=True, help="1x: commit changes, print rebase todo list; 2x: don't commit changes, show simulated rebase todo list")
+@opt('-n', '--dry-run', count=True, help="1x: commit changes, print rebase todo list; 2x: don't commit changes, show simulated rebase todo list. Without -R, first reports the in-memory result (changing nothing)")
+@flag('-R', '--rebase', help="Skip the in-memory fast path (`merge-tree` + `commit-tree`), and always use `git rebase -i`")
 @arg('dst')
-def main(all, message, dry_run, dst):
+def main(all, message, dry_run, rebase, dst):
     """"Throw" (squash) uncommitted changes onto an arbitrary previous commit."""
     dst = proc.line('git', 'log', '-1', '--format=%H', dst)
+    if not rebase and fast_throw(all, message, dry_run, dst):
+        return
+
     roots = proc.lines('git', 'rev-list', '--max-parents=0', 'HEAD')
     root = roots[0] if len(roots) == 1 else None
     if not message:
@@ -6,66 +6,157 @@
 #     "utz",
 # ]
 # ///
+#
+# Drive a rebase through submodule (gitlink) conflicts automatically.
+#
+# At each stop, every conflicted gitlink's base/ours/theirs SHAs are read from the index in one `git ls-files -u`, and
+# each conflicted submodule's ancestry question is answered by one `git merge-base --independent` (all submodules
+# concurrently). When one side fast-forwards the other (or one side didn't change the gitlink), the descendant is
+# staged (all resolutions in one `git update-index --index-info`), checked out in the submodule, and the rebase
+# continues. It stops, and reports, only on true divergences or non-submodule conflicts.
+#
+# Usage:
+#
+#     git-rebase-submodule.py [opts] [-- <git rebase args>]   # start a rebase (if none is in progress) and drive it
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists, join
+from subprocess import DEVNULL, PIPE, run as sp_run
+from sys import exit, stderr
 
 import click
-from utz import cd, process
-from utz.process import check, lines, run
+from utz import process
 
+GITLINK_MODE = '160000'
 
-def parse_submodule_commits(ref, submodule):
 
-    skipping = True
-    for line in lines('git', 'show', '--submodule=log', ref, '--', submodule):
-        if line.startswith('Submodule '):
-            skipping = False
-            continue
-        elif skipping:
+def log(msg):
+    stderr.write(f'{msg}\n')
+
+
+def rebase_in_progress():
+    return any(
+        exists(process.line('git', 'rev-parse', '--git-path', name, log=None))
+        for name in ('rebase-merge', 'rebase-apply')
+    )
+
+
+def unmerged_entries():
+    """Return `{path: {stage: (mode, sha)}}` for all unmerged index entries, from one `git ls-files -u`."""
+    out = process.output('git', 'ls-files', '-u', '-z', log=None).decode()
+    entries = {}
+    for entry in out.split('\0'):
+        if not entry:
             continue
+        meta, path = entry.split('\t', 1)
+        mode, sha, stage = meta.split()
+        entries.setdefault(path, {})[int(stage)] = (mode, sha)
+    return entries
 
 
+def classify(path, stages):
+    """Decide how to resolve one conflicted gitlink; returns `(sha or None, reason)`."""
+    base = stages.get(1, (None, None))[1]
+    ours = stages.get(2, (None, None))[1]
+    theirs = stages.get(3, (None, None))[1]
+    if not ours or not theirs:
+        return None, 'deleted on one side'
+    if ours == theirs:
+        return ours, 'both sides agree'
+    if theirs == base:
+        return ours, 'only ours changed'
+    if ours == base:
+        return theirs, 'only theirs changed'
 
+    if not exists(join(path, '.git')):
+        return None, 'submodule not initialized'
+    res = sp_run(['git', '-C', path, 'merge-base', '--independent', ours, theirs], stdout=PIPE, stderr=DEVNULL)
+    if res.returncode:
+        return None, f'missing commit(s) in submodule ({ours[:7]}, {theirs[:7]}); try fetching it'
+    independent = res.stdout.decode().split()
+    if len(independent) == 1:
+        [descendant] = independent
+        return descendant, f'{"theirs" if descendant == theirs else "ours"} fast-forwards {"ours" if descendant == theirs else "theirs"}'
+    return None, f'diverged: ours {ours[:7]}, theirs {theirs[:7]} (base {(base or "-")[:7]})'
 
-@click.command()
-@click.option('-b', '--base', help='')
-@click.option('-n', '--new', help='')
-@click.option('-p', '--parent', help='')
-@click.argument('submodule')
-def main(base, new, parent, submodule):
-    # [ first, *rest ] = lines('git', 'log', '--format=%h %s', f'{base}^')
-    # rebase_lines = [
-    #     f'edit {first}',
-    #     *[ f'pick {line}' for line in rest ],
-    # ]
 
-    if not new:
-        ls_tree_line = process.line('git', 'ls-tree', 'HEAD', submodule)
-        [ mode, tpe, sha, name ] = list(filter(None, ls_tree_line.split(' ')))
-        if tpe != 'commit' or name != submodule:
-            raise RuntimeError(f'Unrecognized output from `git ls-tree HEAD {submodule}`: {ls_tree_line}')
-        new = sha
+def stage(resolutions):
+    """Replace each path's conflict stages with a single stage-0 gitlink, in one `update-index --index-info` call."""
+    index_info = ''.join(f'{GITLINK_MODE} {sha} 0\t{path}\n' for path, sha in resolutions.items())
+    sp_run(['git', 'update-index', '--index-info'], input=index_info.encode(), check=True)
 
-    if not parent:
-        parent = f'{base}^'
 
-    hashes = lines('git', 'log', '--format=%H', f'{parent}..{new}', '--', submodule)
+def checkout(path, sha):
+    if sp_run(['git', '-C', path, 'checkout', '-q', '--detach', sha], stdout=DEVNULL, stderr=DEVNULL).returncode:
+        log(f'{path}: staged {sha[:7]}, but couldn\'t check it out in the submodule')
 
-    sed_cmd = "sed -i -e '1s/^pick/edit/'"  # edit the first commit
-    run(
-        'git', 'rebase', '-i', parent,
-        env={
-            'EDITOR': sed_cmd,
-            'GIT_SEQUENCE_EDITOR': sed_cmd,
-        }
-    )
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.option('-C', '--no-checkout', is_flag=True, help="Stage resolved gitlinks without checking them out in the submodules")
+@click.option('-j', '--jobs', type=int, default=8, help='Submodules to inspect concurrently (default: 8)')
+@click.option('-n', '--dry-run', is_flag=True, help='Report how the current stop\'s conflicts would be resolved, then exit')
+@click.option('-v', '--verbose', is_flag=True, help='Log each resolution')
+@click.argument('rebase_args', nargs=-1, type=click.UNPROCESSED)
+def main(no_checkout, jobs, dry_run, verbose, rebase_args):
+    """Rebase, automatically resolving submodule conflicts where one side fast-forwards the other."""
+    if not rebase_in_progress():
+        if not rebase_args:
+            raise click.UsageError('No rebase in progress; pass `git rebase` args (after `--`) to start one')
+        if sp_run(['git', 'rebase', *rebase_args]).returncode == 0:
+            return
+
+    resolved_total = 0
+    stops = 0
     while True:
-        if check('git', 'rebase', '--continue'):
-            # Rebase continued successfully to completion! We are done here.
+        entries = unmerged_entries()
+        if not entries:
+            if not rebase_in_progress():
+                break
+            # Stopped for a reason other than a conflict (e.g. an `edit` step); leave it to the user
+            if stops:
+                log(f'Rebase stopped without conflicts; resolved {resolved_total} submodule conflicts so far')
+            else:
+                log('Rebase is stopped without conflicts; nothing to resolve')
+            exit(0)
+        stops += 1
+
+        gitlinks = { path: stages for path, stages in entries.items() if any(mode == GITLINK_MODE for mode, _ in stages.values()) }
+        others = sorted(set(entries) - set(gitlinks))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = dict(zip(gitlinks, executor.map(lambda item: classify(*item), gitlinks.items())))
+
+        resolutions = { path: sha for path, (sha, _) in results.items() if sha }
+        unresolved = { path: reason for path, (sha, reason) in results.items() if not sha }
+        if verbose or dry_run:
+            for path, (sha, reason) in results.items():
+                log(f'{path}: {f"-> {sha[:7]}" if sha else "unresolved"} ({reason})')
+
+        if dry_run:
+            for path in others:
+                log(f'{path}: non-submodule conflict')
+            exit(1 if unresolved or others else 0)
+
+        if resolutions:
+            stage(resolutions)
+            resolved_total += len(resolutions)
+            if not no_checkout:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    list(executor.map(lambda item: checkout(*item), resolutions.items()))
+
+        if unresolved or others:
+            log(f'Resolved {resolved_total} submodule conflicts; stopping on:')
+            for path, reason in unresolved.items():
+                log(f'  {path}: {reason}')
+            for path in others:
+                log(f'  {path}: non-submodule conflict')
+            exit(1)
+
+        res = sp_run(['git', '-c', 'core.editor=true', 'rebase', '--continue'], stdout=DEVNULL if not verbose else None)
+        if res.returncode == 0 and not rebase_in_progress():
             break
 
-        with cd(submodule):
-            run('git', 'checkout', TODO)
+    log(f'Rebase complete; resolved {resolved_total} submodule conflicts across {stops} stops')
 
-        run('git', 'add', submodule)
 
 if __name__ == '__main__':
     main()
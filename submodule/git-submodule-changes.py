@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""Report which submodules moved between two superproject revisions, and by how many commits.
+
+Gitlinks are diffed with one `git diff-tree` (or, with no `to`, compared against submodules' checked-out HEADs, read
+in-process); per-submodule `rev-list --left-right --count` (and optional `log`) calls run concurrently.
+
+Usage:
+
+    git-submodule-changes.py [from=HEAD [to]]
+
+Row columns: path, old..new SHAs, commits added (`+`) and removed (`-`), and a status for added/deleted submodules or
+SHAs missing from the submodule's object store.
+"""
+
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, dirname, join
+from subprocess import run, PIPE, DEVNULL
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.submodules import GITLINK_MODE, git, gitlinks, load_submodules, parse_gitmodules, submodule_git_dir
+
+
+def diff_gitlinks(from_rev, to_rev):
+    """Return `[(path, old, new)]` for gitlinks that differ between two revisions, from one `git diff-tree -r`.
+
+    `old`/`new` are `None` where the submodule was added/deleted.
+    """
+    out = git('diff-tree', '-r', '-z', '--no-commit-id', '--no-renames', from_rev, to_rev)
+    fields = out.split('\0')
+    changes = []
+    for meta, path in zip(fields[0::2], fields[1::2]):
+        if not meta.startswith(':'):
+            continue
+        old_mode, new_mode, old, new, _ = meta[1:].split(' ')
+        if GITLINK_MODE not in (old_mode, new_mode):
+            continue
+        changes.append((
+            path,
+            old if old_mode == GITLINK_MODE else None,
+            new if new_mode == GITLINK_MODE else None,
+        ))
+    return changes
+
+
+def diff_checked_out(from_rev):
+    """Like `diff_gitlinks`, but against each submodule's checked-out HEAD."""
+    recorded = gitlinks(ref=from_rev)
+    changes = []
+    for sm in load_submodules(decorate=False):
+        old = recorded.get(sm.path)
+        if sm.head and old != sm.head:
+            changes.append((sm.path, old, sm.head))
+    return changes
+
+
+def count(git_dir, old, new, log_limit):
+    """Return a row dict with `added`/`removed` counts (and up to `log_limit` added commits' summaries)."""
+    if not git_dir:
+        return { 'status': 'not initialized' }
+    res = run(['git', '--git-dir', git_dir, 'rev-list', '--left-right', '--count', f'{old}...{new}'], stdout=PIPE, stderr=DEVNULL)
+    if res.returncode:
+        return { 'status': 'missing commits' }
+    removed, added = map(int, res.stdout.decode().split())
+    row = { 'added': added, 'removed': removed }
+    if log_limit and added:
+        res = run(
+            ['git', '--git-dir', git_dir, 'log', f'-n{log_limit}', '--format=%h %s', f'{old}..{new}'],
+            stdout=PIPE, stderr=DEVNULL,
+        )
+        row['log'] = res.stdout.decode().splitlines()
+    return row
+
+
+def main():
+    parser = ArgumentParser(description='Report submodules that moved between two superproject revisions, with commit counts')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Submodules to count concurrently (default: number of CPUs)')
+    parser.add_argument('-J', '--json', action='store_true', help='Print a JSON array of rows')
+    parser.add_argument('-l', '--log', type=int, default=0, metavar='N', help="Also show up to N added commits' summaries per submodule")
+    parser.add_argument('from_rev', nargs='?', default='HEAD', metavar='from', help='Superproject revision to compare from (default: HEAD)')
+    parser.add_argument('to_rev', nargs='?', metavar='to', help="Superproject revision to compare to (default: submodules' checked-out HEADs)")
+    args = parser.parse_args()
+
+    root = git('rev-parse', '--show-toplevel').strip()
+    os.chdir(root)
+    changes = diff_checked_out(args.from_rev) if args.to_rev is None else diff_gitlinks(args.from_rev, args.to_rev)
+
+    super_git_dir = git('rev-parse', '--absolute-git-dir').strip()
+    names = { config['path']: name for name, config in parse_gitmodules(join(root, '.gitmodules')).items() if 'path' in config }
+
+    def process(change):
+        path, old, new = change
+        row = { 'path': path, 'old': old, 'new': new }
+        if not old:
+            return { **row, 'status': 'added' }
+        if not new:
+            return { **row, 'status': 'deleted' }
+        git_dir = submodule_git_dir(root, path, names.get(path, path), super_git_dir)
+        return { **row, **count(git_dir, old, new, args.log) }
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        rows = list(executor.map(process, changes))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    width = max((len(row['path']) for row in rows), default=0)
+    for row in rows:
+        shas = f'{(row["old"] or "-")[:7]:>7}..{(row["new"] or "-")[:7]:<7}'
+        if 'added' in row:
+            detail = f'+{row["added"]} -{row["removed"]}'
+        else:
+            detail = row['status']
+        print(f'{row["path"]:<{width}}  {shas}  {detail}')
+        for line in row.get('log', []):
+            print(f'{"":<{width}}    {line}')
+    sys.stderr.write(f'{len(rows)} submodules changed\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -32,20 +32,28 @@
 # - find the first conflicted submodule
 # - look up all the above "heads" in the parent repo
 # - see what commit the conflicted submodule is at for each parent head
-# - put ephemeral tags into the submodule repo itself, reflecting the relevant parent heads
-#   - these tags get prefixed with "parent/", e.g. "parent/ORIG_HEAD", "parent/REBASE_HEAD", etc.
+#   (one `git cat-file --batch` read for all heads)
+# - put ephemeral refs into the submodule repo itself, reflecting the relevant parent heads
+#   - these live under "refs/git-helpers/parent/", e.g. "refs/git-helpers/parent/ORIG_HEAD", and are created (and
+#     deleted) in one `update-ref --stdin` transaction, so they never show up as (or collide with) real tags
 # - run a `git graph` in the submodule, that shows a graph of how all the parent's pointers relate
-# - clean up the ephemeral tags / exit
+# - clean up the ephemeral refs / exit
 
 
-from os import chdir, getcwd
-from os.path import expanduser
-import re
-from subprocess import CalledProcessError, DEVNULL, check_call, check_output
+from os.path import abspath, dirname
+from subprocess import CalledProcessError, check_call, check_output
 import sys
 
 from click import command
-from utz.cli import arg, flag, opt
+from utz.cli import arg, flag
+
+# Add parent directory to path for local imports
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.refs import EPHEMERAL_NS, ephemeral_refs
+from git_helpers.util.submodules import gitlinks_at
+
+REFS_NS = f'{EPHEMERAL_NS}/parent'
 
 
 def read_sha(name):
@@ -61,52 +69,28 @@ def lines(*args):
     return output(*args).split('\n')
 
 
-def get_shas_for_head(parent_sha, submodule):
-    line = output('git', 'ls-tree', parent_sha, submodule).strip()
-    if not line:
-        return None
-    child = re.split('\s+', line, 3)[2]
-    return dict(
-        parent=parent_sha,
-        child=child,
-    )
-
-
 def stderr(*args):
     for arg in args:
         sys.stderr.write('%s\n' % arg)
 
 
-class cd:
-    """Context manager for changing the current working directory"""
-    def __init__(self, path):
-        self.path = expanduser(path)
-
-    def __enter__(self):
-        self.prevPath = getcwd()
-        chdir(str(self.path))
-
-    def __exit__(self, etype, value, traceback):
-        chdir(str(self.prevPath))
-
-
 @command()
 @flag('-v', '--verbose', help='Debug log to stderr')
 @arg('submodule', required=False)
 def main(submodule, verbose):
     if verbose:
-        err = stderr
+        log = stderr
     else:
-        def err(*args): pass
+        def log(*args): pass
 
     if not submodule:
         submodules = [ line[3:] for line in lines('git', 'status', '--porcelain') if line.startswith('UU') ]
         if not submodules:
-            err('No conflicted submodules found')
-            return
+            stderr('No conflicted submodules found')
+            sys.exit(1)
         elif len(submodules) > 1:
             submodule = submodules[0]
-            err(f'Inspecting first conflicted submodule: {submodule}')
+            stderr(f'Inspecting first conflicted submodule: {submodule}')
             # raise RuntimeError(f'{len(submodules)} conflicted submodules found, unsure which to choose')
         else:
             [submodule] = submodules
@@ -118,42 +102,41 @@ def main(submodule, verbose):
 
     merge_base = output('git', 'merge-base', rebase_head, head)
 
-    heads = {
-        name: get_shas_for_head(parent_sha, submodule)
-        for name, parent_sha in {
-            'REBASE_HEAD': rebase_head,
-            'ORIG_HEAD': orig_head,
-            'HEAD': head,
-            'ONTO': onto,
-            'BASE': merge_base,
-        }.items()
+    parent_shas = {
+        'REBASE_HEAD': rebase_head,
+        'ORIG_HEAD': orig_head,
+        'HEAD': head,
+        'ONTO': onto,
+        'BASE': merge_base,
     }
-
-    with cd(submodule):
-        tags = []
+    children = gitlinks_at(list(set(parent_shas.values())), submodule)
+
+    shas = {}
+    for name, parent_sha in parent_shas.items():
+        child_sha = children[parent_sha]
+        if not child_sha:
+            stderr(f'Skipping {name}: no {submodule} gitlink at {parent_sha[:7]}')
+            continue
+        log(f'{name}: parent {parent_sha}, {submodule} {child_sha}')
+        shas[name] = child_sha
+
+    with ephemeral_refs(shas, ns=REFS_NS, cwd=submodule) as refs:
         try:
-            for name, shas in heads.items():
-                if not shas:
-                    print(f'Skipping {name}, no shas found')
-                    continue
-                tag = f'parent/{name}'
-                parent_sha = shas['parent']
-                child_sha = shas['child']
-                err(f'{name}: parent {parent_sha}, {submodule} {child_sha}')
-                check_call([ 'git', 'tag', tag, child_sha, ])
-                tags.append(tag)
-
-            check_call([ 'git', 'graph', 'HEAD', ] + tags)
+            check_call(
+                [
+                    'git', 'graph',
+                    # Show the ephemeral refs (outside the default decoration namespaces) alongside the usual ones
+                    *[ f'--decorate-refs={ns}' for ns in (f'{REFS_NS}/', 'refs/heads/', 'refs/remotes/', 'refs/tags/', 'HEAD') ],
+                    'HEAD',
+                    *refs,
+                ],
+                cwd=submodule,
+            )
         except CalledProcessError as e:
             if e.returncode == 141:
-                err(f'Suppressing returncode 141 from `git graph`; most likely a SIGPIPE artifact due to using `less +%S` as Git pager, cf. https://www.ingeniousmalarkey.com/2016/07/git-log-exit-code-141.html')
+                log(f'Suppressing returncode 141 from `git graph`; most likely a SIGPIPE artifact due to using `less +%S` as Git pager, cf. https://www.ingeniousmalarkey.com/2016/07/git-log-exit-code-141.html')
             else:
                 raise
-        finally:
-            fd = None if verbose else DEVNULL
-            for tag in tags:
-                check_call(['git', 'tag','-d', tag], stderr=fd, stdout=fd)
-
 
 
 if __name__ == '__main__':
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Show every submodule's (recursively) branch, ahead/behind, and dirty state, computed concurrently.
+
+Each submodule gets one `git status --porcelain=v2 --branch` (which uses the untracked cache and fsmonitor, where
+configured), run from a thread pool; the same task then discovers that submodule's own submodules (in-process, see
+`git_helpers.util.submodules`; skipped for leaves without a `.gitmodules`), which are queued as it completes, and rows
+print as soon as they're ready.
+
+Row columns: path, branch (or "(detached)"), HEAD, upstream ahead/behind, and status counts:
+`S` staged, `M` modified, `U` unmerged, `?` untracked; `*` marks a HEAD that differs from the SHA recorded in the parent.
+"""
+
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os.path import abspath, dirname, isfile, join
+from subprocess import check_output, CalledProcessError, DEVNULL
+from time import monotonic
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from git_helpers.util.submodules import load_submodules
+
+
+def parse_status(out):
+    """Parse `git status --porcelain=v2 --branch -z` output into a dict of branch info and change counts."""
+    status = { 'oid': None, 'branch': None, 'upstream': None, 'ahead': None, 'behind': None,
+               'staged': 0, 'modified': 0, 'unmerged': 0, 'untracked': 0 }
+    entries = iter(out.split('\0'))
+    for entry in entries:
+        if not entry:
+            continue
+        kind = entry[0]
+        if kind == '#':
+            key, _, value = entry[2:].partition(' ')
+            if key == 'branch.oid':
+                status['oid'] = None if value == '(initial)' else value
+            elif key == 'branch.head':
+                status['branch'] = None if value == '(detached)' else value
+            elif key == 'branch.upstream':
+                status['upstream'] = value
+            elif key == 'branch.ab':
+                ahead, behind = value.split()
+                status['ahead'], status['behind'] = int(ahead), -int(behind)
+        elif kind in '12':
+            xy = entry[2:4]
+            status['staged'] += xy[0] != '.'
+            status['modified'] += xy[1] != '.'
+            if kind == '2':
+                # Renames/copies are followed by the original path
+                next(entries, None)
+        elif kind == 'u':
+            status['unmerged'] += 1
+        elif kind == '?':
+            status['untracked'] += 1
+    return status
+
+
+def submodule_status(root, sm, untracked):
+    cmd = [
+        'git', '-C', join(root, sm.path), 'status', '--porcelain=v2', '--branch', '-z',
+        # Nested submodules get their own rows
+        '--ignore-submodules=all',
+        f'--untracked-files={"normal" if untracked else "no"}',
+    ]
+    start = monotonic()
+    try:
+        out = check_output(cmd, stderr=DEVNULL).decode()
+    except CalledProcessError as e:
+        return { 'error': f'git status exited {e.returncode}' }
+    return { **parse_status(out), 'secs': round(monotonic() - start, 3) }
+
+
+def initialized_submodules(root):
+    """`root`'s initialized submodules; leaves (no `.gitmodules`) are skipped without running git."""
+    if not isfile(join(root, '.gitmodules')):
+        return []
+    try:
+        return [ sm for sm in load_submodules(root=root, decorate=False) if sm.initialized ]
+    except CalledProcessError:
+        return []
+
+
+def status_task(root, sm, untracked, recursive):
+    """Run in a worker: `(status row fields, nested submodules)` for `sm`."""
+    status = submodule_status(root, sm, untracked)
+    children = initialized_submodules(join(root, sm.path)) if recursive else []
+    return status, children
+
+
+def is_dirty(row):
+    return bool(
+        row.get('error')
+        or row.get('staged') or row.get('modified') or row.get('unmerged') or row.get('untracked')
+        or row.get('ahead') or row.get('behind')
+        or row['moved']
+    )
+
+
+def format_row(row, width):
+    if row.get('error'):
+        return f'{row["path"]:<{width}}  {row["error"]}'
+    branch = row['branch'] or '(detached)'
+    head = (row['head'] or '-')[:7]
+    moved = '*' if row['moved'] else ' '
+    ab = ''
+    if row['ahead'] or row['behind']:
+        ab = f'+{row["ahead"]}/-{row["behind"]}'
+    counts = ' '.join(
+        f'{n}{flag}'
+        for flag, n in (('S', row['staged']), ('M', row['modified']), ('U', row['unmerged']), ('?', row['untracked']))
+        if n
+    )
+    return f'{row["path"]:<{width}}  {moved}{head}  {branch:<20}  {ab:<9}  {counts}'
+
+
+def main():
+    parser = ArgumentParser(description="Show submodules' (recursively) branch, ahead/behind, and dirty state")
+    parser.add_argument('-d', '--dirty', action='store_true', help='Only show submodules with changes, ahead/behind their upstream, or moved from the recorded SHA')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Concurrent `git status` calls (default: number of CPUs)')
+    parser.add_argument('-J', '--json', action='store_true', help='Print one JSON object per submodule (JSON Lines)')
+    parser.add_argument('-R', '--no-recursive', action='store_true', help="Don't descend into nested submodules")
+    parser.add_argument('-U', '--no-untracked', action='store_true', help="Don't look for untracked files (faster)")
+    args = parser.parse_args()
+
+    top = check_output(['git', 'rev-parse', '--show-toplevel']).decode().strip()
+    width = 0
+    counts = { 'total': 0, 'shown': 0 }
+    start = monotonic()
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        pending = {}
+
+        def enqueue(rel_root, submodules):
+            nonlocal width
+            root = join(top, rel_root) if rel_root else top
+            for sm in submodules:
+                path = join(rel_root, sm.path) if rel_root else sm.path
+                width = max(width, len(path))
+                future = executor.submit(status_task, root, sm, not args.no_untracked, not args.no_recursive)
+                pending[future] = (path, sm)
+
+        enqueue('', initialized_submodules(top))
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, sm = pending.pop(future)
+                status, children = future.result()
+                enqueue(path, children)
+                row = {
+                    'path': path,
+                    'name': sm.name,
+                    'head': sm.head,
+                    'recorded': sm.recorded,
+                    'moved': sm.moved,
+                    'branch': sm.branch,
+                    **status,
+                }
+                counts['total'] += 1
+                if args.dirty and not is_dirty(row):
+                    continue
+                counts['shown'] += 1
+                if args.json:
+                    print(json.dumps(row), flush=True)
+                else:
+                    print(format_row(row, width), flush=True)
+
+    sys.stderr.write(f'{counts["total"]} submodules ({counts["shown"]} shown) in {monotonic() - start:.2f}s\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''Tests for util/github_api.py: retry decisions, pagination, conditional GETs, and retries, against a local stub server.
+
+Run via:
+
+    nosetests
+'''
+
+import time
+
+from requests import Response
+
+from git_helpers.util.github_api import GitHubSession
+
+from github_stub import StubGitHub
+
+
+def response(status, headers=None, text=''):
+    resp = Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = text.encode()
+    return resp
+
+
+def session(stub, **kwargs):
+    return GitHubSession(token='t', api_url=stub.url, **kwargs)
+
+
+def test_retry_delay():
+    delay = GitHubSession.retry_delay
+    assert delay(response(200), 0) is None
+    assert delay(response(404), 0) is None
+    assert delay(response(403, {'Retry-After': '7'}), 0) == 7.
+    reset = int(time.time()) + 30
+    assert 29 <= delay(response(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset)}), 0) <= 32
+    # Secondary rate limits without `Retry-After` back off from a minute
+    assert delay(response(403, text='You have exceeded a secondary rate limit'), 1) == 120.
+    assert delay(response(429), 0) == 60.
+    # A plain permission error isn't retried
+    assert delay(response(403, text='Resource not accessible'), 0) is None
+    assert delay(response(502), 2) == 4.
+
+
+def test_paginate():
+    items = list(range(7))
+
+    def routes(method, path, query, headers):
+        assert headers['Authorization'] == 'Bearer t'
+        params = dict(kv.split('=') for kv in query.split('&'))
+        page, per_page = int(params.get('page', 1)), int(params['per_page'])
+        body = { 'total_count': len(items), 'runs': items[(page - 1) * per_page:page * per_page] }
+        links = {}
+        if page * per_page < len(items):
+            links['Link'] = f'<{stub.url}/repos/o/r/runs?per_page={per_page}&page={page + 1}>; rel="next"'
+        return 200, links, body
+
+    with StubGitHub(routes) as stub, session(stub) as gh:
+        assert list(gh.paginate('repos/o/r/runs', key='runs', per_page=3)) == items
+        assert [ query for _, _, query in stub.requests ] == ['per_page=3', 'per_page=3&page=2', 'per_page=3&page=3']
+
+
+def test_get_cached():
+    def routes(method, path, query, headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, None
+        return 200, {'ETag': '"v1"'}, { 'n': 1 }
+
+    with StubGitHub(routes) as stub, session(stub) as gh:
+        assert gh.get_cached('repos/o/r') == ({ 'n': 1 }, True)
+        assert gh.get_cached('repos/o/r') == ({ 'n': 1 }, False)
+        # Different params are cached separately
+        assert gh.get_cached('repos/o/r', params={ 'x': 1 }) == ({ 'n': 1 }, True)
+        assert len(stub.requests) == 3
+
+
+def test_request_retries():
+    statuses = [429, 429, 200]
+
+    def routes(method, path, query, headers):
+        # `Retry-After: 0` keeps the test from sleeping
+        return statuses.pop(0), {'Retry-After': '0'}, {}
+
+    with StubGitHub(routes) as stub, session(stub, max_retries=2) as gh:
+        assert gh.request('GET', 'x').status_code == 200
+        assert len(stub.requests) == 3
+
+    statuses = [429, 429]
+    with StubGitHub(routes) as stub, session(stub, max_retries=1) as gh:
+        # Out of retries: the last response is returned
+        assert gh.request('GET', 'x').status_code == 429
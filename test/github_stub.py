@@ -0,0 +1,50 @@
+'''A local stand-in for the GitHub API, for tests: serves canned responses from a thread, and records requests.'''
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import urlsplit
+
+
+class StubGitHub:
+    '''`routes(method, path, query, headers)` returns `(status, headers, body)` (`body`: JSON-able, or `None`).
+
+    Use as a context manager; `url` is the API base URL, `requests` lists `(method, path, query)` as received.
+    '''
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self):
+                parts = urlsplit(self.path)
+                stub.requests.append((self.command, parts.path, parts.query))
+                status, headers, body = stub.routes(self.command, parts.path, parts.query, self.headers)
+                data = b'' if body is None else json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            do_GET = do_HEAD = do_POST = do_DELETE = respond
+
+            def log_message(self, *_):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = Thread(target=self.server.serve_forever, kwargs={ 'poll_interval': .05 }, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,120 @@
+'''Tests for github/hash-files.py's glob semantics and file ordering.
+
+Run via:
+
+    nosetests
+'''
+
+import hashlib
+import os
+import sys
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import dirname, join
+from subprocess import check_output
+
+from scratch_repo import scratch_dir
+
+SCRIPT = join(dirname(dirname(__file__)), 'github', 'hash-files.py')
+spec = spec_from_file_location('hash_files', SCRIPT)
+hash_files = module_from_spec(spec)
+spec.loader.exec_module(hash_files)
+
+translate = hash_files.translate
+
+
+def match(pattern, path):
+    return bool(translate(pattern).fullmatch(path))
+
+
+def test_star_within_segment():
+    assert match('src/*.py', 'src/a.py')
+    assert not match('src/*.py', 'src/sub/a.py')
+    assert match('*', '.hidden')
+
+
+def test_globstar():
+    assert match('src/**/*.py', 'src/a.py')
+    assert match('src/**/*.py', 'src/x/y/a.py')
+    assert not match('src/**/*.py', 'lib/a.py')
+    assert match('**', 'a/b/c')
+
+
+def test_question_mark():
+    assert match('f?.txt', 'f1.txt')
+    assert not match('f?.txt', 'f/.txt')
+
+
+def test_dir_matches_descendants():
+    assert match('src', 'src/a/b.txt')
+    assert not match('src', 'srcx/b.txt')
+
+
+def test_classes():
+    assert match('[ab].txt', 'a.txt')
+    assert not match('[ab].txt', 'c.txt')
+    assert match('[!a].txt', 'b.txt')
+    assert match('[^a].txt', 'b.txt')
+    assert not match('[!a].txt', 'a.txt')
+    assert not match('x[!a]y', 'x/y')
+
+
+def test_empty_and_unterminated_classes_are_literal():
+    assert match('a[]', 'a[]')
+    assert match('a[!]', 'a[!]')
+    assert match('a[b', 'a[b')
+    assert not match('a[b', 'ab')
+
+
+def test_special_chars_are_literal():
+    assert match('a+b(1).txt', 'a+b(1).txt')
+    assert not match('a.txt', 'abtxt')
+
+
+def test_negation_order():
+    patterns = hash_files.parse_patterns(['**', '!*.log', 'keep.log'], '/ws')
+    assert hash_files.matches('a.txt', patterns)
+    assert not hash_files.matches('drop.log', patterns)
+    assert hash_files.matches('keep.log', patterns)
+
+
+def test_patterns_outside_root_are_skipped():
+    assert hash_files.parse_patterns(['../x', '/etc/passwd'], '/ws') == []
+
+
+def test_visit_order():
+    paths = ['b.txt', 'a/z.txt', 'a.txt', 'a/b/c.txt', 'A.txt']
+    assert sorted(paths, key=hash_files.visit_order) == ['A.txt', 'a/b/c.txt', 'a/z.txt', 'a.txt', 'b.txt']
+
+
+def test_search_roots():
+    patterns = hash_files.parse_patterns(['b.txt', 'a/*.py', '!a', 'a/b/**', 'b.txt', 'c/**/x'], '/ws')
+    assert hash_files.search_roots(patterns) == ['b.txt', 'a', 'c']
+    assert hash_files.search_roots(hash_files.parse_patterns(['x', '*.txt'], '/ws')) == ['']
+
+
+def baseline(root, paths):
+    '''The original hash-files.py: hash literal paths, in argument order.'''
+    sha256 = hashlib.sha256()
+    for path in paths:
+        with open(join(root, path), 'rb') as f:
+            sha256.update(hashlib.sha256(f.read()).digest())
+    return sha256.hexdigest()
+
+
+def test_pattern_order():
+    with scratch_dir() as root:
+        for path in ('a.txt', 'b.txt', 'd/c.txt', 'd/a/z.txt'):
+            os.makedirs(join(root, dirname(path)), exist_ok=True)
+            with open(join(root, path), 'w') as f:
+                f.write(path)
+
+        def run(*patterns):
+            return check_output([sys.executable, SCRIPT, '-W', '-N', *patterns], cwd=root).decode().strip()
+
+        # Literal paths are hashed in argument order, as before
+        assert run('b.txt', 'a.txt') == baseline(root, ['b.txt', 'a.txt'])
+        assert run('a.txt', 'b.txt') == baseline(root, ['a.txt', 'b.txt'])
+        assert run('b.txt', 'a.txt') != run('a.txt', 'b.txt')
+        # Each pattern's search root in turn; depth-first, by name, within each
+        assert run('d/**', 'a.txt') == baseline(root, ['d/a/z.txt', 'd/c.txt', 'a.txt'])
+        assert run('*.txt', 'd') == baseline(root, ['a.txt', 'b.txt', 'd/a/z.txt', 'd/c.txt'])
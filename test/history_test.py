@@ -0,0 +1,227 @@
+'''Tests for util/history.py's ident parsing, mailmap lookups, ident filtering, and fast-export stream rewriting.
+
+Run via:
+
+    nosetests
+'''
+
+from io import BytesIO
+from os import remove
+from os.path import join
+
+from git_helpers.util.history import (
+    IdentFilter, Mailmap, Stats, filter_stream, parse_offset, parse_person, rewrite_history, split_ident,
+)
+
+from scratch_repo import git, raises, scratch_repo
+
+BACKUP_NS = 'refs/git-helpers/original'
+
+
+def mailmap(*lines):
+    m = Mailmap()
+    for line in lines:
+        m.add_line(line)
+    return m
+
+
+def test_split_ident():
+    assert split_ident(b'A B <a@b.c> 1700000000 -0500') == (b'A B', b'a@b.c', b'1700000000 -0500')
+    assert split_ident(b'<a@b.c> 1 +0000') == (b'', b'a@b.c', b'1 +0000')
+    assert raises(lambda: split_ident(b'A a@b.c 1 +0000'), ValueError)
+
+
+def test_ident_filter_empty_name():
+    f = IdentFilter(emails={ b'a@x.org': (None, b'b@x.org') })
+    assert f.tag(b'<a@x.org> 1 +0000') == b'<b@x.org> 1 +0000'
+
+
+def test_parse_offset():
+    assert parse_offset('1s') == -1
+    assert parse_offset('+2h') == 7200
+    assert parse_offset('-3d') == -3 * 86400
+    assert parse_offset('+90') == 90
+    for bad in ('', 'h', '1w', '1.5h'):
+        assert raises(lambda: parse_offset(bad), ValueError), bad
+
+
+def test_parse_person():
+    assert parse_person('Jane Doe <jane@x.org>') == (b'Jane Doe', b'jane@x.org')
+    assert parse_person(' jane@x.org ') == (None, b'jane@x.org')
+
+
+def test_mailmap_forms():
+    m = mailmap(
+        b'Proper Name <commit@x.org>\n',
+        b'<proper@x.org> <old@x.org>  # comment\n',
+        b'Both <both@x.org> <BOTH-OLD@x.org>\n',
+        b'Named <named@x.org> Bad Name <shared@x.org>\n',
+    )
+    # Name only, keyed by email
+    assert m.map(b'whoever', b'commit@x.org') == (b'Proper Name', b'commit@x.org')
+    # Email only
+    assert m.map(b'Old', b'old@x.org') == (b'Old', b'proper@x.org')
+    # Emails match case-insensitively
+    assert m.map(b'Old', b'both-old@X.ORG') == (b'Both', b'both@x.org')
+    # Name + email: only that name is mapped
+    assert m.map(b'bad name', b'shared@x.org') == (b'Named', b'named@x.org')
+    assert m.map(b'Other', b'shared@x.org') == (b'Other', b'shared@x.org')
+    assert m.map(b'X', b'unknown@x.org') == (b'X', b'unknown@x.org')
+
+
+def test_mailmap_merges_entries():
+    m = mailmap(b'Proper <a@x.org>\n', b'<new@x.org> <a@x.org>\n')
+    assert m.map(b'a', b'a@x.org') == (b'Proper', b'new@x.org')
+
+
+def test_mailmap_ignores_blank_and_comment_lines():
+    assert not mailmap(b'\n', b'# Name <a@b>\n')
+
+
+def test_ident_filter_order():
+    f = IdentFilter(
+        mailmap=mailmap(b'Mapped <mapped@x.org> <a@x.org>\n'),
+        emails={ b'mapped@x.org': (None, b'final@x.org') },
+        committer=(b'Bot', b'bot@x.org'),
+    )
+    author, committer = f.commit(b'A <a@x.org> 100 +0000', b'C <c@x.org> 200 +0100')
+    # mailmap, then `emails` (keeping the mapped name)
+    assert author == b'Mapped <final@x.org> 100 +0000'
+    # `committer` overrides unconditionally, keeping the date
+    assert committer == b'Bot <bot@x.org> 200 +0100'
+
+
+def test_ident_filter_dates():
+    author, committer = IdentFilter(date_offset=-60).commit(b'A <a@x.org> 100 +0000', b'C <c@x.org> 200 -0700')
+    assert (author, committer) == (b'A <a@x.org> 40 +0000', b'C <c@x.org> 140 -0700')
+    author, committer = IdentFilter(committer_date_is_author_date=True).commit(b'A <a@x.org> 100 +0000', b'C <c@x.org> 200 -0700')
+    assert committer == b'C <c@x.org> 100 +0000'
+    author, committer = IdentFilter(author_date_is_committer_date=True).commit(b'A <a@x.org> 100 +0000', b'C <c@x.org> 200 -0700')
+    assert author == b'A <a@x.org> 200 -0700'
+    assert IdentFilter(date_offset=5).tag(b'T <t@x.org> 100 +0000') == b'T <t@x.org> 105 +0000'
+
+
+def commit(ref, mark, oid, author, msg, parent=None):
+    lines = [
+        b'commit %s\n' % ref,
+        b'mark :%d\n' % mark,
+        b'original-oid %s\n' % oid,
+        b'author %s 100 +0000\n' % author,
+        b'committer %s 100 +0000\n' % author,
+        b'data %d\n%s' % (len(msg), msg),
+    ]
+    if parent:
+        lines.append(b'from :%d\n' % parent)
+    return b''.join(lines) + b'\n'
+
+
+STREAM = b''.join([
+    commit(b'refs/heads/main', 1, b'a' * 40, b'Keep <keep@x.org>', b'first\ncommitter Fake <x> 0 +0000\n'),
+    commit(b'refs/heads/main', 2, b'b' * 40, b'Old <old@x.org>', b'second\n', parent=1),
+    commit(b'refs/heads/main', 3, b'c' * 40, b'Keep <keep@x.org>', b'third\n', parent=2),
+    commit(b'refs/heads/other', 4, b'd' * 40, b'Keep <keep@x.org>', b'other\n', parent=1),
+    b'tag v1\nfrom :1\noriginal-oid %s\ntagger Old <old@x.org> 100 +0000\ndata 3\nv1\n\n' % (b'e' * 40),
+    b'done\n',
+])
+
+
+def test_filter_stream():
+    f = IdentFilter(emails={ b'old@x.org': (b'New', b'new@x.org') })
+    out = BytesIO()
+    stats = Stats()
+    changes = []
+    done = filter_stream(BytesIO(STREAM), out, f, stats, on_change=lambda *args: changes.append(args))
+    assert done
+    assert stats.commits == 4
+    assert stats.tags == 1
+    assert stats.changed_tags == 1
+    assert stats.changed == ['b' * 40]
+    # The changed commit, and its descendant; not its parent, or the sibling branch
+    assert stats.rewritten == 2
+    assert list(stats.refs) == ['refs/heads/main', 'refs/heads/other', 'refs/tags/v1']
+    assert [ (oid, kind) for oid, kind, _, _ in changes ] == [('b' * 40, 'author'), ('b' * 40, 'committer'), ('e' * 40, 'tagger')]
+    # Only ident lines change (not message payloads that look like them), and `done` isn't copied
+    expected = STREAM.replace(b'Old <old@x.org>', b'New <new@x.org>')[:-len(b'done\n')]
+    assert out.getvalue() == expected
+
+
+def test_filter_stream_unchanged():
+    stats = Stats()
+    out = BytesIO()
+    assert filter_stream(BytesIO(STREAM), out, IdentFilter(), stats)
+    assert stats.rewritten == 0 and not stats.changed and not stats.changed_tags
+    assert out.getvalue() == STREAM[:-len(b'done\n')]
+
+
+def test_filter_stream_truncated():
+    stats = Stats()
+    assert not filter_stream(BytesIO(STREAM[:-len(b'done\n')]), None, IdentFilter(), stats)
+    assert stats.commits == 4
+
+
+def make_repo(repo):
+    '''Two commits by (author and committer) a@example.com, and an annotated tag by t@example.com.'''
+    for msg in ('one', 'two'):
+        git(repo, 'commit', '-q', '--allow-empty', '-m', msg, env={ 'GIT_COMMITTER_EMAIL': 'a@example.com' })
+    git(repo, 'tag', '-a', 'v1', '-m', 'v1', env={ 'GIT_COMMITTER_EMAIL': 't@example.com' })
+
+
+def rewrite(repo, emails, **kwargs):
+    return rewrite_history(['--branches', '--tags'], IdentFilter(emails=emails), backup_ns=BACKUP_NS, cwd=repo, **kwargs)
+
+
+def refs(repo):
+    return git(repo, 'for-each-ref', '--format=%(refname) %(objectname)')
+
+
+def test_rewrite_history_backup():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        before = refs(repo)
+        stats = rewrite(repo, { b'a@example.com': (None, b'b@example.com') })
+        assert stats.rewritten == 2
+        assert git(repo, 'log', '--format=%ae %ce', 'main') == 'b@example.com b@example.com\nb@example.com b@example.com'
+        backup = git(repo, 'for-each-ref', '--format=%(refname:lstrip=3) %(objectname)', f'{BACKUP_NS}/')
+        assert sorted(backup.splitlines()) == sorted(before.splitlines())
+
+        # A second rewrite would clobber the backup
+        assert raises(lambda: rewrite(repo, { b'b@example.com': (None, b'c@example.com') }), RuntimeError)
+        assert git(repo, 'log', '-1', '--format=%ae', 'main') == 'b@example.com'
+        rewrite(repo, { b'b@example.com': (None, b'c@example.com') }, overwrite_backup=True)
+        assert git(repo, 'log', '-1', '--format=%ae', 'main') == 'c@example.com'
+
+
+def test_rewrite_history_failed_import():
+    '''A failed fast-import leaves no backup behind (which would block the retry).'''
+    with scratch_repo() as repo:
+        make_repo(repo)
+        lock = join(repo, '.git', 'refs', 'heads', 'main.lock')
+        open(lock, 'w').close()
+        assert raises(lambda: rewrite(repo, { b'a@example.com': (None, b'b@example.com') }), RuntimeError)
+        assert git(repo, 'for-each-ref', f'{BACKUP_NS}/') == ''
+        remove(lock)
+        rewrite(repo, { b'a@example.com': (None, b'b@example.com') })
+        assert git(repo, 'log', '-1', '--format=%ae', 'main') == 'b@example.com'
+
+
+def test_rewrite_history_empty_name():
+    with scratch_repo() as repo:
+        # `git commit` refuses empty names, but imported histories can have them
+        tree = git(repo, 'mktree', input=b'')
+        body = f'tree {tree}\nauthor <a@example.com> 1700000000 +0000\ncommitter C <c@example.com> 1700000000 +0000\n\none\n'
+        sha = git(repo, 'hash-object', '-w', '-t', 'commit', '--stdin', input=body.encode())
+        git(repo, 'update-ref', 'refs/heads/main', sha)
+        rewrite(repo, { b'a@example.com': (None, b'b@example.com') })
+        assert git(repo, 'log', '-1', '--format=[%an] %ae') == '[] b@example.com'
+
+
+def test_rewrite_history_tag_only():
+    '''Changing only a tagger rewrites (and backs up) the tag, though no commits change.'''
+    with scratch_repo() as repo:
+        make_repo(repo)
+        before = refs(repo)
+        stats = rewrite(repo, { b't@example.com': (None, b'u@example.com') })
+        assert (stats.rewritten, stats.changed_tags) == (0, 1)
+        assert git(repo, 'for-each-ref', '--format=%(taggeremail)', 'refs/tags/v1') == '<u@example.com>'
+        backup = git(repo, 'for-each-ref', '--format=%(refname:lstrip=3) %(objectname)', f'{BACKUP_NS}/')
+        assert sorted(backup.splitlines()) == sorted(before.splitlines())
@@ -0,0 +1,42 @@
+'''Tests for util/refs.py (batched, transactional ref updates).
+
+Run via:
+
+    nosetests
+'''
+
+from git_helpers.util.refs import ephemeral_refs, update_refs
+
+from scratch_repo import git, raises, scratch_repo
+
+
+def make_repo(repo):
+    '''`main` and `other`, one commit each.'''
+    git(repo, 'commit', '-q', '--allow-empty', '-m', 'main')
+    git(repo, 'checkout', '-q', '--orphan', 'other')
+    git(repo, 'commit', '-q', '--allow-empty', '-m', 'other')
+    git(repo, 'checkout', '-q', 'main')
+
+
+def test_update_refs():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        main, other = git(repo, 'rev-parse', 'main', 'other').split()
+        update_refs({ 'refs/heads/a': main, 'refs/heads/b': other }, cwd=repo)
+        assert git(repo, 'rev-parse', 'a', 'b').split() == [main, other]
+        # A stale `old` value fails the whole transaction
+        assert raises(lambda: update_refs({ 'refs/heads/a': other, 'refs/heads/b': None }, cwd=repo, old={ 'refs/heads/b': main }), RuntimeError)
+        assert git(repo, 'rev-parse', 'a', 'b').split() == [main, other]
+        update_refs({ 'refs/heads/a': other, 'refs/heads/b': None }, cwd=repo, old={ 'refs/heads/a': main })
+        assert git(repo, 'for-each-ref', '--format=%(refname)', 'refs/heads/a', 'refs/heads/b') == 'refs/heads/a'
+        assert git(repo, 'rev-parse', 'a') == other
+
+
+def test_ephemeral_refs():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        main = git(repo, 'rev-parse', 'main')
+        with ephemeral_refs({ 'x': main }, cwd=repo) as refs:
+            assert refs == ['refs/git-helpers/tmp/x']
+            assert git(repo, 'rev-parse', refs[0]) == main
+        assert not git(repo, 'for-each-ref', 'refs/git-helpers')
@@ -0,0 +1,106 @@
+'''Tests for util/rewrite.py (squash grouping, commit parsing, in-memory replay).
+
+Run via:
+
+    nosetests
+'''
+
+from os.path import join
+
+from git_helpers.util.rewrite import Commit, Conflict, Replayer, read_commits, split_ident, squash_groups, squash_message
+
+from scratch_repo import git, raises, scratch_repo
+
+DATES = { 'GIT_AUTHOR_DATE': '@1700000000 +0000', 'GIT_COMMITTER_DATE': '@1700000000 +0000' }
+
+
+def make_repo(repo):
+    '''`main` (base ─ 1 ─ 2 ─ 3, each appending a line to `f`) and `other` (base ─ edits `g`).'''
+    for name in ('f', 'g'):
+        with open(join(repo, name), 'w') as f:
+            f.write('base\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-qm', 'base', env=DATES)
+    for n in range(1, 4):
+        with open(join(repo, 'f'), 'a') as f:
+            f.write(f'{n}\n')
+        git(repo, 'commit', '-qam', f'commit {n}\n\nbody {n}', env=DATES)
+    git(repo, 'checkout', '-q', '-b', 'other', 'main~3')
+    with open(join(repo, 'g'), 'w') as f:
+        f.write('other\n')
+    git(repo, 'commit', '-qam', 'other', env=DATES)
+    git(repo, 'checkout', '-q', 'main')
+
+
+def fake_commits(n):
+    '''`n` linear `Commit`s, `c1` … `cn`, on top of `c0`.'''
+    return [ Commit(sha=f'c{i}', parents=[f'c{i - 1}'], tree=f't{i}', author=b'', committer=b'', message=b'm%d\n\nbody\n' % i) for i in range(1, n + 1) ]
+
+
+def groups(commits, ranges):
+    return [ ([ c.sha for c in group ], squashed) for group, squashed in squash_groups(commits, ranges) ]
+
+
+def test_squash_groups():
+    commits = fake_commits(5)
+    assert groups(commits, []) == [ ([f'c{i}'], False) for i in range(1, 6) ]
+    assert groups(commits, [('c1', 'c3')]) == [(['c1'], False), (['c2', 'c3'], True), (['c4'], False), (['c5'], False)]
+    # `start` may be the first commit's parent; ranges may be given in any order
+    assert groups(commits, [('c3', 'c5'), ('c0', 'c2')]) == [(['c1', 'c2'], True), (['c3'], False), (['c4', 'c5'], True)]
+
+
+def test_squash_groups_invalid():
+    commits = fake_commits(5)
+    for ranges in ([('c3', 'c3')], [('c4', 'c2')], [('c0', 'c0')], [('c1', 'c9')], [('c0', 'c3'), ('c2', 'c4')]):
+        assert raises(lambda: squash_groups(commits, ranges), ValueError), ranges
+
+
+def test_squash_message():
+    assert squash_message(fake_commits(3)) == b'm3\n\nm2\n\nm1\n'
+
+
+def test_split_ident():
+    assert split_ident(b'A B <a@b.c> 1700000000 +0100') == ('A B', 'a@b.c', '1700000000 +0100')
+
+
+def test_read_commits():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        commits = read_commits('--reverse', 'main', cwd=repo)
+        assert [ c.sha for c in commits ] == git(repo, 'rev-list', '--reverse', 'main').split()
+        base, c1 = commits[:2]
+        assert base.parents == [] and c1.parents == [base.sha]
+        assert c1.tree == git(repo, 'rev-parse', f'{c1.sha}^{{tree}}')
+        assert c1.message == b'commit 1\n\nbody 1\n'
+        assert c1.author == b'A <a@example.com> 1700000000 +0000'
+        assert c1.committer == b'C <c@example.com> 1700000000 +0000'
+        assert read_commits('main..main', cwd=repo) == []
+
+
+def test_replay():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        commits = read_commits('--reverse', 'main~3..main', cwd=repo)
+        onto = git(repo, 'rev-parse', 'other')
+        mapping = Replayer(cwd=repo).replay(commits, onto, committer=b'R <r@example.com> 1800000000 +0000')
+        assert [ old for old, _ in mapping ] == [ c.sha for c in commits ]
+        tip = mapping[-1][1]
+        assert git(repo, 'rev-parse', f'{tip}~3') == onto
+        assert git(repo, 'show', f'{tip}:f') == 'base\n1\n2\n3'
+        assert git(repo, 'show', f'{tip}:g') == 'other'
+        assert git(repo, 'log', '-1', '--format=%an|%cn|%ct|%B', tip) == 'A|R|1800000000|commit 3\n\nbody 3'
+
+
+def test_replay_conflict():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        # Dropping "commit 1" leaves "commit 2"'s context missing
+        commits = read_commits('--reverse', 'main~2..main', cwd=repo)
+        onto = git(repo, 'rev-parse', 'main~3')
+        try:
+            Replayer(cwd=repo).replay(commits, onto)
+        except Conflict as e:
+            assert e.commit == commits[0].sha
+            assert e.paths == ['f']
+        else:
+            assert False
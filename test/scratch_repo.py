@@ -0,0 +1,48 @@
+'''Shared fixtures for tests that run git: a fixed identity, a `git()` runner, and throwaway repos.'''
+
+import os
+from contextlib import contextmanager
+from shutil import rmtree
+from subprocess import check_output
+from tempfile import mkdtemp
+
+ENV = {
+    **os.environ,
+    'GIT_AUTHOR_NAME': 'A', 'GIT_AUTHOR_EMAIL': 'a@example.com',
+    'GIT_COMMITTER_NAME': 'C', 'GIT_COMMITTER_EMAIL': 'c@example.com',
+}
+
+
+def git(repo, *args, env=None, **kwargs):
+    '''Run `git <args>` in `repo`, as `ENV`'s identity (plus `env` overrides); returns stripped stdout.'''
+    return check_output(['git', *args], cwd=repo, env={ **ENV, **(env or {}) }, **kwargs).decode().strip()
+
+
+@contextmanager
+def scratch_repo(branch='main'):
+    '''Yield the path of a new, empty repo (with `branch` unborn), deleting it afterwards.'''
+    repo = mkdtemp()
+    try:
+        git(repo, 'init', '-q', '-b', branch)
+        yield repo
+    finally:
+        rmtree(repo)
+
+
+@contextmanager
+def scratch_dir():
+    '''Yield the path of a new, empty (non-repo) directory, deleting it afterwards.'''
+    path = mkdtemp()
+    try:
+        yield path
+    finally:
+        rmtree(path)
+
+
+def raises(fn, exc=Exception):
+    '''Whether `fn()` raises `exc`.'''
+    try:
+        fn()
+    except exc:
+        return True
+    return False
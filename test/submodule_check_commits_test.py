@@ -0,0 +1,97 @@
+'''Tests for submodule/github-submodule-check-commits, run against a local stub of the GitHub API.
+
+Run via:
+
+    nosetests
+'''
+
+import json
+import sys
+from os.path import dirname, join
+from subprocess import PIPE, run
+from unittest import SkipTest
+
+from github_stub import StubGitHub
+from scratch_repo import ENV, git, scratch_repo
+
+SCRIPT = join(dirname(dirname(__file__)), 'submodule', 'github-submodule-check-commits')
+PRESENT = '1' * 40
+MISSING = '2' * 40
+SUBMODULES = [
+    ('ok', 'https://github.com/o/present.git', PRESENT),
+    ('missing-commit', 'git@github.com:o/present.git', MISSING),
+    ('missing-repo', 'https://github.com/o/gone', PRESENT),
+    ('flaky', 'https://github.com/o/flaky.git', PRESENT),
+    ('elsewhere', 'https://gitlab.com/o/x.git', PRESENT),
+]
+
+
+def routes(method, path, query, headers):
+    assert method == 'HEAD'
+    assert headers['Authorization'] == 'Bearer test-token'
+    _, _, owner, repo, _, sha = path.split('/')
+    if repo == 'gone':
+        return 404, {}, None
+    if repo == 'flaky':
+        return 500, {}, None
+    return (200 if sha == PRESENT else 422), {}, None
+
+
+def make_superproject(repo):
+    for path, url, sha in SUBMODULES:
+        git(repo, 'config', '-f', '.gitmodules', f'submodule.{path}.path', path)
+        git(repo, 'config', '-f', '.gitmodules', f'submodule.{path}.url', url)
+        git(repo, 'update-index', '--add', '--cacheinfo', f'160000,{sha},{path}')
+    # In `.gitmodules`, but with no gitlink
+    git(repo, 'config', '-f', '.gitmodules', 'submodule.unlinked.path', 'unlinked')
+    git(repo, 'config', '-f', '.gitmodules', 'submodule.unlinked.url', 'https://github.com/o/present')
+    git(repo, 'add', '.gitmodules')
+    git(repo, 'commit', '-qm', 'submodules')
+
+
+def check_commits(repo, stub, *args):
+    try:
+        import utz  # noqa: F401
+    except ImportError:
+        raise SkipTest('utz not installed')
+    # `-t 0`: don't retry the stub's 5xx
+    env = { **ENV, 'GH_TOKEN': 'test-token' }
+    return run([sys.executable, SCRIPT, '-a', stub.url, '-t', '0', *args], cwd=repo, env=env, stdout=PIPE, stderr=PIPE)
+
+
+def test_json_report():
+    with scratch_repo() as repo:
+        make_superproject(repo)
+        with StubGitHub(routes) as stub:
+            proc = check_commits(repo, stub, '-J')
+        assert proc.returncode == 1
+        report = json.loads(proc.stdout)
+        statuses = { r['path']: (r['status'], r.get('code')) for r in report['submodules'] }
+        assert statuses == {
+            'ok': ('ok', 200),
+            'missing-commit': ('missing', 422),
+            'missing-repo': ('missing', 404),
+            'flaky': ('error', 500),
+            'elsewhere': ('skipped', None),
+            'unlinked': ('skipped', None),
+        }
+        assert report['counts'] == { 'ok': 1, 'missing': 2, 'error': 1, 'skipped': 2 }
+        # Only GitHub submodules with gitlinks are probed, once each
+        assert sorted(path for _, path, _ in stub.requests) == sorted([
+            f'/repos/o/present/commits/{PRESENT}',
+            f'/repos/o/present/commits/{MISSING}',
+            f'/repos/o/gone/commits/{PRESENT}',
+            f'/repos/o/flaky/commits/{PRESENT}',
+        ])
+
+
+def test_names_and_exit_code():
+    with scratch_repo() as repo:
+        make_superproject(repo)
+        with StubGitHub(routes) as stub:
+            proc = check_commits(repo, stub, 'ok', 'elsewhere')
+            assert proc.returncode == 0
+            assert proc.stdout == b''
+            proc = check_commits(repo, stub, 'missing-commit')
+        assert proc.returncode == 1
+        assert proc.stdout.decode().split('\t')[:3] == ['missing', 'missing-commit', MISSING]
@@ -0,0 +1,170 @@
+'''Tests for util/submodules.py's in-process `.gitmodules`, ref, and tree parsing, checked against git's own output.
+
+Run via:
+
+    nosetests
+'''
+
+from os.path import join
+
+from git_helpers.util.submodules import (
+    _tree_entry, _unquote, decorations, gitlinks, gitlinks_at, parse_gitmodules, read_head, read_refs,
+)
+
+from scratch_repo import git, scratch_dir, scratch_repo
+
+SHA1 = '1' * 40
+SHA2 = '2' * 40
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_unquote():
+    assert _unquote('plain  ') == 'plain'
+    assert _unquote('"a ; b" ; comment') == 'a ; b'
+    assert _unquote('a # comment') == 'a'
+    assert _unquote(r'"tab\there" x') == 'tab\there x'
+    assert _unquote(r'back\\slash') == 'back\\slash'
+
+
+def test_parse_gitmodules():
+    with scratch_dir() as tmp:
+        path = join(tmp, '.gitmodules')
+        write(path, '\n'.join([
+            '# comment',
+            '[submodule "a"]',
+            '\tpath = libs/a',
+            '\tURL = https://github.com/o/a.git  ; trailing comment',
+            '[core]',
+            '\tpath = ignored',
+            '[submodule "we\\"ird"] path = "with space"',
+            '\tshallow',
+            '',
+        ]))
+        assert parse_gitmodules(path) == {
+            'a': { 'path': 'libs/a', 'url': 'https://github.com/o/a.git' },
+            'we"ird': { 'path': 'with space', 'shallow': 'true' },
+        }
+        assert parse_gitmodules(join(tmp, 'missing')) == {}
+
+
+def test_tree_entry():
+    tree = b''.join([
+        b'100644 a\0' + bytes.fromhex(SHA1),
+        b'160000 sub\0' + bytes.fromhex(SHA2),
+        b'40000 subdir\0' + bytes.fromhex(SHA1),
+    ])
+    assert _tree_entry(tree, b'sub', b'160000') == SHA2
+    # Wrong mode, missing name
+    assert _tree_entry(tree, b'subdir', b'160000') is None
+    assert _tree_entry(tree, b'su', b'160000') is None
+    assert _tree_entry(b'160000 s\0' + b'\x03' * 32, b's', b'160000', sha_len=32) == '03' * 32
+
+
+def test_decorations():
+    refs = {
+        'refs/heads/main': SHA1,
+        'refs/heads/topic': SHA1,
+        'refs/remotes/origin/main': SHA1,
+        'refs/tags/v1': SHA2,
+        'refs/tags/v0': SHA2,
+        'refs/heads/other': SHA2,
+    }
+    peeled = { 'refs/tags/v1': SHA1 }
+    assert decorations(SHA1, refs, peeled, 'main') == ['HEAD -> main', 'tag: v1', 'origin/main', 'topic']
+    assert decorations(SHA2, refs, peeled) == ['HEAD', 'tag: v0', 'other']
+    assert decorations(None, refs, peeled) == []
+
+
+def make_repo(repo):
+    '''Branches and tags (lightweight, and annotated), some packed, with `origin/HEAD` a symref.'''
+    for n in range(3):
+        git(repo, 'commit', '-q', '--allow-empty', '-m', f'c{n}')
+        git(repo, 'tag', '-a', f'annotated{n}', '-m', f'tag {n}')
+        git(repo, 'tag', f'light{n}')
+        git(repo, 'branch', f'b{n}')
+        git(repo, 'update-ref', f'refs/remotes/origin/r{n}', 'HEAD')
+        if n == 0:
+            git(repo, 'pack-refs', '--all')
+    git(repo, 'symbolic-ref', 'refs/remotes/origin/HEAD', 'refs/remotes/origin/r1')
+    # A packed ref that's been updated since: the loose value wins
+    git(repo, 'update-ref', 'refs/heads/b0', 'HEAD')
+
+
+def test_read_refs():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        git_dir = join(repo, '.git')
+        refs, peeled = read_refs(git_dir)
+        expected_refs, expected_peeled = {}, {}
+        for line in git(repo, 'for-each-ref', '--format=%(refname) %(objectname) %(*objectname)').splitlines():
+            name, sha, target = (line + ' ').split(' ')[:3]
+            expected_refs[name] = sha
+            if target:
+                expected_peeled[name] = target
+        assert refs == expected_refs
+        assert peeled == expected_peeled
+        assert read_head(git_dir, refs) == (git(repo, 'rev-parse', 'HEAD'), 'main')
+
+
+def test_read_head_detached():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        git(repo, 'checkout', '-q', '--detach', 'HEAD~')
+        assert read_head(join(repo, '.git')) == (git(repo, 'rev-parse', 'HEAD'), None)
+
+
+def test_decorations_match_git_log():
+    with scratch_repo() as repo:
+        make_repo(repo)
+        git_dir = join(repo, '.git')
+        refs, peeled = read_refs(git_dir)
+        sha, branch = read_head(git_dir, refs)
+        for rev in (sha, git(repo, 'rev-parse', 'HEAD~'), git(repo, 'rev-parse', 'HEAD~2')):
+            names = decorations(rev, refs, peeled, branch)
+            # Only the HEAD commit has HEAD pointing at it
+            if rev != sha:
+                names = names[1:]
+            assert ', '.join(names) == git(repo, 'log', '-1', '--decorate=short', '--format=%D', rev), rev
+
+
+def make_superproject(repo):
+    '''`sub` and `nested/sub` gitlinks, moved in a second commit; the third removes them.'''
+    for sha in (SHA1, SHA2):
+        for path in ('sub', 'nested/sub'):
+            git(repo, 'update-index', '--add', '--cacheinfo', f'160000,{sha},{path}')
+        git(repo, 'commit', '-qm', sha[:1])
+    git(repo, 'rm', '-q', '--cached', 'sub', 'nested/sub')
+    git(repo, 'commit', '-q', '--allow-empty', '-m', 'rm')
+
+
+def test_gitlinks():
+    with scratch_repo() as repo:
+        make_superproject(repo)
+        assert gitlinks(repo, ref='HEAD~') == { 'sub': SHA2, 'nested/sub': SHA2 }
+        assert gitlinks(repo, ref='HEAD~2') == { 'sub': SHA1, 'nested/sub': SHA1 }
+        assert gitlinks(repo) == {}
+
+
+def test_gitlinks_at():
+    with scratch_repo() as repo:
+        make_superproject(repo)
+        revs = ['HEAD~2', 'HEAD~', 'HEAD', 'no-such-rev']
+        expected = { 'HEAD~2': SHA1, 'HEAD~': SHA2, 'HEAD': None, 'no-such-rev': None }
+        assert gitlinks_at(revs, 'sub', cwd=repo) == expected
+        assert gitlinks_at(revs, 'nested/sub', cwd=repo) == expected
+        assert gitlinks_at(revs, 'nested/sub/', cwd=repo) == expected
+
+
+def test_gitlinks_at_non_tree_parent():
+    '''Where `path`'s parent isn't a tree, that rev has no gitlink, and later revs are still read correctly.'''
+    with scratch_repo() as repo:
+        make_superproject(repo)
+        blob = git(repo, 'hash-object', '-w', '--stdin', input=b'now a file\n')
+        git(repo, 'update-index', '--add', '--cacheinfo', f'100644,{blob},nested')
+        git(repo, 'commit', '-qm', 'file')
+        revs = ['HEAD', 'HEAD~2', 'HEAD', 'HEAD~3']
+        assert gitlinks_at(revs, 'nested/sub', cwd=repo) == { 'HEAD': None, 'HEAD~2': SHA2, 'HEAD~3': SHA1 }
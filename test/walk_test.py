@@ -0,0 +1,150 @@
+'''Tests for util/walk.py: commit-graph parsing, and the first-parent fork-point walk.
+
+Run via:
+
+    nosetests
+'''
+
+from git_helpers.util.walk import CommitGraph, FirstParents, first_parent_fork_point
+
+from scratch_repo import git, scratch_repo
+
+
+class Commits:
+    '''Writes commits into `repo` directly with `commit-tree` (empty trees, one second apart).'''
+
+    def __init__(self, repo):
+        self.dir = repo
+        self.tree = git(repo, 'mktree', input=b'')
+        self.time = 1700000000
+
+    def commit(self, msg, *parents):
+        self.time += 1
+        date = f'@{self.time} +0000'
+        args = [ arg for parent in parents for arg in ('-p', parent) ]
+        return git(self.dir, 'commit-tree', self.tree, *args, '-m', msg, env={ 'GIT_AUTHOR_DATE': date, 'GIT_COMMITTER_DATE': date })
+
+    def branch(self, name, sha):
+        git(self.dir, 'update-ref', f'refs/heads/{name}', sha)
+
+
+def make_history(path):
+    '''`main`: r ─ m1 ─ m2 ─ m3 (merges s1, branched from m1) ─ m4 ─ m5; `feature`: f1 ─ f2 ─ f3, branched from m2.
+
+    `feature` also merges m4 back in (as f3's second parent), so m4 is a (non-first-parent) ancestor of both tips.
+    '''
+    repo = Commits(path)
+    c = {}
+    c['r'] = repo.commit('r')
+    c['m1'] = repo.commit('m1', c['r'])
+    c['m2'] = repo.commit('m2', c['m1'])
+    c['s1'] = repo.commit('s1', c['m1'])
+    c['m3'] = repo.commit('m3', c['m2'], c['s1'])
+    c['f1'] = repo.commit('f1', c['m2'])
+    c['m4'] = repo.commit('m4', c['m3'])
+    c['f2'] = repo.commit('f2', c['f1'])
+    c['f3'] = repo.commit('f3', c['f2'], c['m4'])
+    c['m5'] = repo.commit('m5', c['m4'])
+    repo.branch('main', c['m5'])
+    repo.branch('feature', c['f3'])
+    repo.branch('side', c['s1'])
+    return repo, c
+
+
+def history(repo):
+    '''`{sha: (first parent or None, topological level)}` ("generation number v1") for every commit, computed from
+    `git rev-list --parents`.'''
+    out = git(repo.dir, 'rev-list', '--all', '--topo-order', '--reverse', '--parents').splitlines()
+    commits = {}
+    for line in out:
+        sha, *parents = line.split()
+        level = 1 + max((commits[p][1] for p in parents), default=0)
+        commits[sha] = (parents[0] if parents else None, level)
+    return commits
+
+
+def check_lookups(repo, graph):
+    for sha, (first_parent, level) in history(repo).items():
+        parent, generation, date = graph.lookup(sha)
+        assert parent == first_parent, sha
+        assert generation == level, sha
+        assert date == int(git(repo.dir, 'log', '-1', '--format=%ct', sha)), sha
+
+
+def test_commit_graph_single_file():
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        git(repo.dir, 'commit-graph', 'write', '--reachable')
+        graph = CommitGraph.load(repo.dir)
+        assert graph and len(graph.files) == 1
+        check_lookups(repo, graph)
+        assert graph.lookup('0' * 40) is None
+
+
+def test_commit_graph_split_chain():
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        git(repo.dir, 'commit-graph', 'write', '--reachable', '--split=no-merge')
+        # A second layer, holding only the new commits (whose parents are looked up in the base layer)
+        repo.branch('main', repo.commit('m6', c['m5']))
+        repo.branch('feature', repo.commit('f4', c['f3']))
+        git(repo.dir, 'commit-graph', 'write', '--reachable', '--split=no-merge')
+        graph = CommitGraph.load(repo.dir)
+        assert graph and len(graph.files) == 2
+        check_lookups(repo, graph)
+
+
+def test_commit_graph_disabled():
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        git(repo.dir, 'commit-graph', 'write', '--reachable')
+        git(repo.dir, 'config', 'core.commitGraph', 'false')
+        assert CommitGraph.load(repo.dir) is None
+
+
+def fork_point(repo, a, b, graph):
+    with FirstParents(cwd=repo.dir, graph=graph) as parents:
+        return first_parent_fork_point(a, b, parents)[0]
+
+
+def test_fork_point():
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        for graph in (False, True):
+            if graph:
+                git(repo.dir, 'commit-graph', 'write', '--reachable')
+            # m4 is a common ancestor (via f3's merge parent), but not on feature's first-parent chain
+            assert fork_point(repo, c['m5'], c['f3'], graph) == c['m2']
+            assert fork_point(repo, c['f3'], c['m5'], graph) == c['m2']
+            # s1 is merged into main via m3's second parent; its first-parent chain meets main's at m1
+            assert fork_point(repo, c['m5'], c['s1'], graph) == c['m1']
+            # An ancestor on the same first-parent chain is its own fork point
+            assert fork_point(repo, c['m5'], c['m2'], graph) == c['m2']
+            assert fork_point(repo, c['m2'], c['m5'], graph) == c['m2']
+            assert fork_point(repo, c['f2'], c['f2'], graph) == c['f2']
+
+
+def test_fork_point_unrelated():
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        other = repo.commit('other root')
+        for graph in (False, True):
+            if graph:
+                repo.branch('other', other)
+                git(repo.dir, 'commit-graph', 'write', '--reachable')
+            assert fork_point(repo, c['m5'], other, graph) is None
+
+
+def test_fork_point_partially_graphed():
+    '''Commits newer than the commit-graph are read via `cat-file`, and still meet the graphed ones.'''
+    with scratch_repo() as path:
+        repo, c = make_history(path)
+        git(repo.dir, 'commit-graph', 'write', '--reachable')
+        g1 = repo.commit('g1', c['f3'])
+        g2 = repo.commit('g2', g1)
+        with FirstParents(cwd=repo.dir) as parents:
+            assert parents.graph.lookup(g2) is None
+            fork, visited = first_parent_fork_point(c['m5'], g2, parents)
+        assert fork == c['m2']
+        # Only the commits unique to the two sides are visited: m5, m4, m3 and g2, g1, f3, f2, f1
+        assert visited == 8